@@ -1,46 +1,72 @@
 # first attempt at using Streamlit to label graphs.
 # Streamlit is not good at labeling as it always restarts the script
+#
+# streamlit run archive/part_explorer.py
+#
+# Only the selected participant is read from bike_data (indexed on my_id), reads are
+# cached across reruns, and every line is downsampled with LTTB before plotting.
 
+import os
+import sys
 import streamlit as st
-import sqlalchemy as sq
-import pandas as pd
-import numpy as np
-import plotly.express as px
-import seaborn as sns
 import matplotlib.pyplot as plt
-import helper_functions.helpers as h
+
+# storage.py and downsample.py live one folder up
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from storage import dbInfo
+from downsample import lttb
+
+# the explorer reads the notebook-era database, not nih_scripts.db
+DB_URL = "sqlite:///nih.db"
+DAYS = ["day1", "day2", "day3"]
 
 st.title("Check out your participant's characteristics")
 
 
-db = h.dbConnect("sqlite:///nih.db")
-df = db.load_table("bike_data")
+@st.cache_data
+def load_participants(url):
+    participants = dbInfo(url).list_sessions("bike_data", key="my_id")
+    return sorted(participants)
+
+
+@st.cache_data
+def load_participant(url, person):
+    df = dbInfo(url).load_table(
+        "bike_data", columns=["day", "cadence", "power"], where={"my_id": person}
+    )
+    sessions = {}
+    for day, temp in df.groupby("day", sort=False):
+        temp = temp.reset_index(drop=True)
+        sessions[day] = temp.assign(min=temp.index / 60)
+    return sessions
+
+
+@st.cache_data
+def downsampled(url, person, col, n_points):
+    lines = {}
+    for day, temp in load_participant(url, person).items():
+        lines[day] = lttb(temp["min"].to_numpy(), temp[col].to_numpy(), n_points)
+    return lines
 
-participants = list(df['my_id'].unique())
-participants.sort()
-person = st.sidebar.radio("Select participant",participants)
 
-newest = pd.DataFrame(columns=df.columns)
-new_df = df[df['my_id']==person]
-for day in new_df['day'].unique():
-    temp = new_df[new_df['day']==day].reset_index(drop=True)
-    temp = temp.reset_index()
-    temp['min'] = temp['index']/60
-    newest = newest.append(temp)
+participants = load_participants(DB_URL)
+person = st.sidebar.radio("Select participant", participants)
+n_points = st.sidebar.slider("Points per line", 200, 5000, 1000, step=100)
 
-fig_cad, ax = plt.subplots()
-ax = sns.lineplot(x='min',y='cadence',
-                  data=newest,hue='day',
-                  hue_order=['day1','day2','day3'])
-ax.set_title(person + " Cadence")
-ax.set_ylim(-20,100)
 
-st.pyplot(fig_cad)
+def plot(col, title, ylim=None):
+    fig, ax = plt.subplots()
+    lines = downsampled(DB_URL, person, col, n_points)
+    for day in [d for d in DAYS if d in lines] + [d for d in lines if d not in DAYS]:
+        ax.plot(*lines[day], label=day, linewidth=1)
+    ax.set_xlabel("min")
+    ax.set_ylabel(col)
+    ax.set_title(person + " " + title)
+    if ylim is not None:
+        ax.set_ylim(*ylim)
+    ax.legend(title="day")
+    return fig
 
-fig_pow, ax = plt.subplots()
-ax = sns.lineplot(x='min',y='power',
-                  data=newest,hue='day',
-                  hue_order=['day1','day2','day3'])
-ax.set_title(person + " Power")
 
-st.pyplot(fig_pow)
+st.pyplot(plot("cadence", "Cadence", ylim=(-20, 100)))
+st.pyplot(plot("power", "Power"))
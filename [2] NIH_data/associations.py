@@ -0,0 +1,348 @@
+"""
+Bootstrap confidence intervals and permutation tests for UPDRS vs bike metric associations, every metric at once.
+
+USE:
+    dfe = dfEntropy()
+    df = associations(dfe.result, outcome = "updrs_chg", by = "session", workers = 4)
+    # one row per metric x session: r, ci_low, ci_high, p_perm, p_maxt
+
+    dfd = dfDemos(df_bike)
+    df = associations(dfd.result, metrics = ["mean_effort"], subject = "id")
+
+    # do mild and severe participants (median split of updrs_pre) respond differently?
+    df = group_differences(dfe.result, severity_groups(dfe.result["updrs_pre"]), by = "session")
+
+PURPOSE:
+    * A resample draws one set of row indices that is applied to every metric, so thousands
+      of resamples of all metric x session combinations are a few batched matrix operations
+      (BATCH resamples at a time) instead of a scipy call per test
+    * Correlations (pearson, or spearman on the ranks of each resample) use the rows where
+      both the outcome and the metric are present
+    * p_perm is the two-sided permutation p-value of each metric, p_maxt is corrected for
+      testing every metric with the max-T method (Westfall & Young, 1993)
+    * Batches run in worker processes, each batch gets its own seed from `seed`, so results
+      are the same for any number of workers
+"""
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from scipy.stats import rankdata
+
+# resamples computed together, memory is about BATCH x rows x metrics floats
+BATCH = 500
+N_RESAMPLES = 5000
+CI_LEVEL = 0.95
+
+
+def corr_batch(x, y, method="pearson"):
+    """
+    Correlation of x with every column of y, for a batch of resamples
+
+    input
+    -----
+    x: np.array
+        (resamples, rows)
+    y: np.array
+        (resamples, rows, metrics), or (1, rows, metrics) to use the same y for every resample
+    method: str
+        pearson or spearman
+
+    output
+    ------
+    np.array (resamples, metrics), nan where fewer than 3 rows are present
+    """
+    ok = ~np.isnan(x)[:, :, None] & ~np.isnan(y)
+    x = np.where(ok, x[:, :, None], np.nan)
+    y = np.where(ok, y, np.nan)
+    if method == "spearman":
+        x = rankdata(x, axis=1, nan_policy="omit")
+        y = rankdata(y, axis=1, nan_policy="omit")
+    n = ok.sum(axis=1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        xc = np.where(ok, x - np.nansum(x, axis=1, keepdims=True) / n[:, None], 0.0)
+        yc = np.where(ok, y - np.nansum(y, axis=1, keepdims=True) / n[:, None], 0.0)
+        r = (xc * yc).sum(axis=1) / np.sqrt((xc**2).sum(axis=1) * (yc**2).sum(axis=1))
+    return np.where(n >= 3, r, np.nan)
+
+
+def diff_batch(values, labels):
+    """
+    Mean of the labelled rows minus mean of the other rows, for a batch of labellings
+
+    input
+    -----
+    values: np.array
+        (rows, metrics) or (resamples, rows, metrics)
+    labels: np.array of bool
+        (resamples, rows)
+
+    output
+    ------
+    np.array (resamples, metrics)
+    """
+    ok = ~np.isnan(values)
+    filled = np.where(ok, values, 0.0)
+    a = labels.astype(float)[:, :, None]
+    b = 1.0 - a
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean_a = (a * filled).sum(axis=1) / (a * ok).sum(axis=1)
+        mean_b = (b * filled).sum(axis=1) / (b * ok).sum(axis=1)
+    return mean_a - mean_b
+
+
+def boot_corr_task(seed, size, x, y, method):
+    rng = np.random.default_rng(seed)
+    idx = rng.integers(0, len(x), (size, len(x)))
+    return corr_batch(x[idx], y[idx], method)
+
+
+def perm_corr_task(seed, size, x, y, method):
+    rng = np.random.default_rng(seed)
+    idx = rng.permuted(np.tile(np.arange(len(x)), (size, 1)), axis=1)
+    return corr_batch(x[idx], y[None], method)
+
+
+def boot_diff_task(seed, size, values, labels):
+    rng = np.random.default_rng(seed)
+    # resample within each group, so both groups keep their size
+    in_a = np.flatnonzero(labels)
+    in_b = np.flatnonzero(~labels)
+    idx = np.concatenate(
+        [
+            in_a[rng.integers(0, len(in_a), (size, len(in_a)))],
+            in_b[rng.integers(0, len(in_b), (size, len(in_b)))],
+        ],
+        axis=1,
+    )
+    new_labels = np.zeros(idx.shape, dtype=bool)
+    new_labels[:, : len(in_a)] = True
+    return diff_batch(values[idx], new_labels)
+
+
+def perm_diff_task(seed, size, values, labels):
+    rng = np.random.default_rng(seed)
+    return diff_batch(values, rng.permuted(np.tile(labels, (size, 1)), axis=1))
+
+
+def run_batches(task, n_resamples, seed, workers, *args):
+    """
+    Runs task(seed, size, *args) over batches of at most BATCH resamples
+
+    output
+    ------
+    np.array (n_resamples, metrics), the batches stacked in order
+    """
+    sizes = [BATCH] * (n_resamples // BATCH)
+    if n_resamples % BATCH:
+        sizes.append(n_resamples % BATCH)
+    if not isinstance(seed, np.random.SeedSequence):
+        seed = np.random.SeedSequence(seed)
+    seeds = seed.spawn(len(sizes))
+    if workers == 1 or len(sizes) == 1:
+        results = [task(s, size, *args) for s, size in zip(seeds, sizes)]
+    else:
+        n = len(sizes)
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(task, seeds, sizes, *[[arg] * n for arg in args]))
+    return np.concatenate(results, axis=0)
+
+
+def p_values(observed, null):
+    """
+    Two-sided permutation p-values of every metric, and the max-T corrected ones
+
+    input
+    -----
+    observed: np.array (metrics,)
+    null: np.array (resamples, metrics)
+    """
+    observed = np.abs(observed)
+    null = np.abs(null)
+    n = np.sum(~np.isnan(null), axis=0)
+    p_perm = (1 + np.sum(null >= observed, axis=0)) / (1 + n)
+    max_null = np.where(np.isnan(null), -np.inf, null).max(axis=1)
+    p_maxt = (1 + np.sum(max_null[:, None] >= observed, axis=0)) / (1 + len(null))
+    missing = np.isnan(observed)
+    return np.where(missing, np.nan, p_perm), np.where(missing, np.nan, p_maxt)
+
+
+def confidence_interval(boot, level=CI_LEVEL):
+    """
+    Percentile interval of every metric's bootstrap distribution
+    """
+    tail = (1 - level) / 2 * 100
+    with np.errstate(invalid="ignore"):
+        low, high = np.nanpercentile(boot, [tail, 100 - tail], axis=0)
+    return low, high
+
+
+def metric_matrix(table, outcome, metrics=None, by=None, subject="subject"):
+    """
+    One row per subject and one column per metric (x `by` value, ex: session)
+
+    input
+    -----
+    table: pd.DataFrame
+        Long table, ex: dfEntropy.result or dfDemos.result
+    outcome: str
+        Column the metrics are compared against, ex: updrs_chg. Has to be one value per subject.
+    metrics: list of str
+        Defaults to every numeric column that isn't the outcome, subject, by, group or UPDRS
+    by: str
+        If given, each metric is split by this column, ex: session
+
+    output
+    ------
+    outcome (pd.Series) and metrics (pd.DataFrame), both indexed by subject.
+    Columns are metric, or (metric, by value).
+    """
+    if metrics is None:
+        skip = {outcome, subject, by, "group", "updrs_pre", "updrs_post", "updrs_chg"}
+        metrics = [
+            col for col in table.select_dtypes("number").columns if col not in skip
+        ]
+    y = table.groupby(subject, sort=True)[outcome].first()
+    if by is None:
+        x = table.groupby(subject, sort=True)[metrics].mean()
+    else:
+        x = table.pivot_table(
+            index=subject, columns=by, values=metrics, aggfunc="mean", observed=True
+        )
+    return y, x.reindex(y.index).astype(float)
+
+
+def associations(
+    table,
+    outcome="updrs_chg",
+    metrics=None,
+    by=None,
+    subject="subject",
+    method="pearson",
+    n_boot=N_RESAMPLES,
+    n_perm=N_RESAMPLES,
+    seed=0,
+    workers=None,
+):
+    """
+    Correlation of the outcome with every metric (x by), with a bootstrap CI and permutation p-values
+
+    input
+    -----
+    table, outcome, metrics, by, subject:
+        See metric_matrix
+    method: str
+        pearson or spearman
+    n_boot, n_perm: int
+        Number of bootstrap and permutation resamples
+    seed: int
+        Same seed, same result, for any number of workers
+    workers: int
+        Number of processes, None uses every core, 1 runs everything here
+
+    output
+    ------
+    pd.DataFrame, one row per metric (x by value): metric, (by), n, r, ci_low, ci_high,
+    p_perm, p_maxt
+    """
+    y, x = metric_matrix(table, outcome, metrics, by, subject)
+    outcome_values = y.to_numpy(dtype=float)
+    values = x.to_numpy()
+    boot_seed, perm_seed = np.random.SeedSequence(seed).spawn(2)
+
+    r = corr_batch(outcome_values[None], values[None], method)[0]
+    boot = run_batches(
+        boot_corr_task, n_boot, boot_seed, workers, outcome_values, values, method
+    )
+    null = run_batches(
+        perm_corr_task, n_perm, perm_seed, workers, outcome_values, values, method
+    )
+    low, high = confidence_interval(boot)
+    p_perm, p_maxt = p_values(r, null)
+
+    result = result_frame(x.columns, by)
+    result["n"] = (~np.isnan(values) & ~np.isnan(outcome_values)[:, None]).sum(axis=0)
+    result["r"] = r
+    result["ci_low"] = low
+    result["ci_high"] = high
+    result["p_perm"] = p_perm
+    result["p_maxt"] = p_maxt
+    return result
+
+
+def group_differences(
+    table,
+    groups,
+    metrics=None,
+    by=None,
+    subject="subject",
+    n_boot=N_RESAMPLES,
+    n_perm=N_RESAMPLES,
+    seed=0,
+    workers=None,
+):
+    """
+    Difference in every metric (x by) between two groups of subjects, with a bootstrap CI
+    and permutation p-values
+
+    input
+    -----
+    groups: pd.Series
+        Group of each row of table (ex: grp_coded, or severity_groups). Has to have two values,
+        the difference is the first (sorted) group minus the second.
+    table, metrics, by, subject, n_boot, n_perm, seed, workers:
+        See associations
+
+    output
+    ------
+    pd.DataFrame, one row per metric (x by value): metric, (by), group_a, group_b, n_a, n_b,
+    diff, ci_low, ci_high, p_perm, p_maxt
+    """
+    table = table.assign(_group=pd.Series(groups, index=table.index))
+    labels, x = metric_matrix(table, "_group", metrics, by, subject)
+    names = sorted(labels.dropna().unique())
+    if len(names) != 2:
+        raise ValueError(f"group_differences needs two groups, got {names}")
+    keep = labels.notna().to_numpy()
+    in_a = (labels == names[0]).to_numpy()[keep]
+    values = x.to_numpy()[keep]
+    boot_seed, perm_seed = np.random.SeedSequence(seed).spawn(2)
+
+    diff = diff_batch(values, in_a[None])[0]
+    boot = run_batches(boot_diff_task, n_boot, boot_seed, workers, values, in_a)
+    null = run_batches(perm_diff_task, n_perm, perm_seed, workers, values, in_a)
+    low, high = confidence_interval(boot)
+    p_perm, p_maxt = p_values(diff, null)
+
+    ok = ~np.isnan(values)
+    result = result_frame(x.columns, by)
+    result["group_a"] = names[0]
+    result["group_b"] = names[1]
+    result["n_a"] = ok[in_a].sum(axis=0)
+    result["n_b"] = ok[~in_a].sum(axis=0)
+    result["diff"] = diff
+    result["ci_low"] = low
+    result["ci_high"] = high
+    result["p_perm"] = p_perm
+    result["p_maxt"] = p_maxt
+    return result
+
+
+def result_frame(columns, by=None):
+    """
+    metric (and by) columns of a result, from the columns of metric_matrix
+    """
+    if by is None:
+        return pd.DataFrame({"metric": list(columns)})
+    return pd.DataFrame(list(columns), columns=["metric", by])
+
+
+def severity_groups(updrs_pre, cut=None):
+    """
+    mild or severe for every row, severe when updrs_pre is above cut (default the median)
+    """
+    updrs_pre = pd.to_numeric(updrs_pre, errors="coerce")
+    cut = updrs_pre.median() if cut is None else cut
+    groups = pd.Series(
+        np.where(updrs_pre > cut, "severe", "mild"), index=updrs_pre.index
+    )
+    return groups.where(updrs_pre.notna())
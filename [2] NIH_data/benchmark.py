@@ -0,0 +1,279 @@
+"""
+Benchmarks the raw_processing pipeline on a synthetic cohort.
+
+USE:
+    python benchmark.py --sessions 10 100 1000
+    python benchmark.py --sessions 10000 --stages bike
+
+    raw = make_cohort(100)  # same columns as [combined_files].xlsx
+
+PURPOSE:
+    * Generate realistic 1 Hz SMB sessions: warm up, main session with dynamic cadence,
+      cool down, and a tail of zeroes where the bike was left running
+    * Time dfBike, dfDemos.create_effort and dfEntropy (computed from bike_data) at each size
+    * Record wall time, peak memory (tracemalloc) and rows per second
+    * Append every run to benchmark_results.jsonl with the git commit, and print the change
+      against the last run of the same stage and size so regressions are visible
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+import tracemalloc
+import datetime as dt
+import pandas as pd
+import numpy as np
+import studies as st
+
+RESULTS_FILE = "benchmark_results.jsonl"
+# flag a stage when it got this much slower than its last run
+REGRESSION = 0.2
+# the NIH R21 IDs, with participant numbers of any length. SMB_\d\d\d would read
+# SMB_1000 as SMB100 and merge sessions of cohorts above 999 participants.
+BENCHMARK_STUDY = {
+    **st.NIH_R21,
+    "name": "benchmark",
+    "id_patterns": {
+        "my_id": r"(SMB_\d+)",
+        "day": r"(day\d)",
+        "unknown": r"day\d_(\d\d)",
+    },
+}
+
+
+def make_cohort(n_sessions, seed=0, days=3, min_sec=2400, max_sec=3600):
+    """
+    Synthetic raw bike data, in the same layout as [combined_files].xlsx
+
+    input
+    -----
+    n_sessions: int
+    seed: int
+    days: int
+        Sessions per participant, at most 9 (day\d)
+    min_sec, max_sec: int
+        Range of session lengths, in seconds
+
+    output
+    ------
+    pd.DataFrame with Date, Time, Millitm, HR, Cadence, Power and ID columns.
+    Participants past 999 get 4 digit IDs (SMB_1000_day1_02), read them with BENCHMARK_STUDY.
+    """
+    if days > 9:
+        raise ValueError(f"days is {days}, session IDs only have one digit for the day")
+    rng = np.random.default_rng(seed)
+    lengths = rng.integers(min_sec, max_sec, n_sessions)
+    starts = np.concatenate([[0], np.cumsum(lengths)[:-1]])
+    sess = np.repeat(np.arange(n_sessions), lengths)
+    sec = np.arange(lengths.sum()) - np.repeat(starts, lengths)
+    n = len(sec)
+
+    warmup = rng.integers(180, 480, n_sessions)[sess]
+    tail = rng.integers(0, 600, n_sessions)[sess]
+    cooldown = rng.integers(180, 300, n_sessions)[sess]
+    length = lengths[sess]
+    main_end = length - tail - cooldown
+    target = rng.uniform(70, 90, n_sessions)[sess]
+
+    # warm up ramp, main session, cool down ramp, then the bike sits still
+    shape = np.clip(sec / warmup, 0, 1)
+    shape = np.where(
+        sec > main_end, np.clip(1 - (sec - main_end) / cooldown, 0, 1), shape
+    )
+    dynamic = 6 * np.sin(sec / rng.uniform(20, 60, n_sessions)[sess])
+    cadence = shape * (target + dynamic + rng.normal(0, 3, n))
+    idle = sec >= length - tail
+    cadence[idle] = rng.normal(0, 0.001, idle.sum())
+    # the occasional sensor spike
+    spikes = rng.random(n) < 0.0005
+    cadence[spikes] = rng.uniform(150, 250, spikes.sum())
+
+    power = np.maximum(
+        cadence * rng.uniform(0.5, 1.2, n_sessions)[sess] + rng.normal(0, 5, n), 0
+    )
+    power[idle] = 0
+    hr = np.round(70 + 35 * shape + rng.normal(0, 2, n)).astype(int)
+
+    participant = sess // days + 1
+    day = sess % days + 1
+    unknown = rng.integers(1, 20, n_sessions)[sess]
+    ids = pd.Series(
+        [
+            f"SMB_{p:03d}_day{d}_{u:02d}"
+            for p, d, u in zip(participant[starts], day[starts], unknown[starts])
+        ]
+    )
+    session_start = pd.Timestamp("2012-10-19 08:00:00") + pd.to_timedelta(
+        np.arange(n_sessions), unit="D"
+    )
+    stamps = pd.DatetimeIndex(np.repeat(session_start, lengths)) + pd.to_timedelta(
+        sec, unit="s"
+    )
+
+    return pd.DataFrame(
+        {
+            "Date": stamps.strftime("%m/%d/%Y"),
+            "Time": stamps.strftime("%H:%M:%S"),
+            "Millitm": rng.integers(0, 1000, n_sessions)[sess],
+            "HR": hr,
+            "Cadence": cadence,
+            "Power": power,
+            "ID": ids.to_numpy()[sess],
+        }
+    )
+
+
+def measure(func, *args, trace_memory=True, **kwargs):
+    """
+    Runs func, returns its output, the wall time in seconds and the peak traced memory in MB.
+    tracemalloc slows python down a lot, so memory is measured on a second, separate run.
+    """
+    start = time.perf_counter()
+    output = func(*args, **kwargs)
+    wall = time.perf_counter() - start
+    if not trace_memory:
+        return output, wall, np.nan
+
+    tracemalloc.start()
+    func(*args, **kwargs)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return output, wall, peak / 1024**2
+
+
+def git_commit():
+    try:
+        out = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True
+        )
+        return out.stdout.strip() or None
+    except OSError:
+        return None
+
+
+def run_benchmark(
+    n_sessions,
+    stages=("bike", "effort", "entropy"),
+    seed=0,
+    workers=None,
+    trace_memory=True,
+):
+    """
+    Benchmarks each stage on a cohort of n_sessions, returns one record per stage
+    """
+    # imported here so `python benchmark.py --help` works without the pipeline's dependencies
+    import raw_processing as r
+
+    raw = make_cohort(n_sessions, seed=seed)
+    records = []
+
+    def record(stage, rows, wall, peak):
+        records.append(
+            {
+                "timestamp": dt.datetime.now().isoformat(timespec="seconds"),
+                "commit": git_commit(),
+                "stage": stage,
+                "sessions": n_sessions,
+                "rows": rows,
+                "wall_sec": round(wall, 4),
+                "peak_mb": round(peak, 2),
+                "rows_per_sec": round(rows / wall, 1) if wall > 0 else None,
+            }
+        )
+
+    dfb, wall, peak = measure(
+        r.dfBike,
+        use_this=raw,
+        study=BENCHMARK_STUDY,
+        trace_memory=trace_memory and "bike" in stages,
+    )
+    bike_df = dfb.result
+    # every session has to come out on its own, or the timings are of merged sessions
+    assert bike_df["id_sess"].nunique() == n_sessions
+    if "bike" in stages:
+        record("bike", len(raw), wall, peak)
+    if "effort" in stages:
+        dfd = r.dfDemos.__new__(r.dfDemos)
+        _, wall, peak = measure(
+            dfd.create_effort, bike_df, trace_memory=trace_memory
+        )
+        record("effort", len(bike_df), wall, peak)
+    if "entropy" in stages:
+        dfe = r.dfEntropy.__new__(r.dfEntropy)
+        _, wall, peak = measure(
+            dfe.compute_entropy, bike_df, workers=workers, trace_memory=trace_memory
+        )
+        record("entropy", len(bike_df), wall, peak)
+    return records
+
+
+def load_results(path=RESULTS_FILE):
+    if not os.path.exists(path):
+        return pd.DataFrame()
+    return pd.read_json(path, lines=True)
+
+
+def save_results(records, path=RESULTS_FILE):
+    with open(path, "a") as f:
+        for rec in records:
+            f.write(json.dumps(rec) + "\n")
+
+
+def compare(records, history):
+    """
+    Prints each record next to the last run of the same stage and size
+    """
+    for rec in records:
+        line = (
+            f"{rec['stage']:>8} {rec['sessions']:>6} sessions: {rec['wall_sec']:9.3f} s, "
+            f"{rec['peak_mb']:9.1f} MB, {rec['rows_per_sec']:>12} rows/s"
+        )
+        if len(history):
+            prev = history[
+                (history["stage"] == rec["stage"])
+                & (history["sessions"] == rec["sessions"])
+            ]
+            if len(prev):
+                last = prev.iloc[-1]
+                change = rec["wall_sec"] / last["wall_sec"] - 1
+                commit = "last run" if pd.isna(last["commit"]) else last["commit"]
+                line += f" ({change:+.0%} vs {commit})"
+                if change > REGRESSION:
+                    line += " <-- REGRESSION"
+        print(line)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--sessions", type=int, nargs="+", default=[10, 100])
+    parser.add_argument(
+        "--stages",
+        nargs="+",
+        default=["bike", "effort", "entropy"],
+        choices=["bike", "effort", "entropy"],
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--results", default=RESULTS_FILE)
+    parser.add_argument(
+        "--no-save", action="store_true", help="don't add this run to the results file"
+    )
+    parser.add_argument(
+        "--no-memory", action="store_true", help="skip the second, memory traced run"
+    )
+    args = parser.parse_args(argv)
+
+    history = load_results(args.results)
+    for n_sessions in args.sessions:
+        records = run_benchmark(
+            n_sessions, args.stages, args.seed, args.workers, not args.no_memory
+        )
+        compare(records, history)
+        if not args.no_save:
+            save_results(records, args.results)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,120 @@
+"""
+Keeps the parsed, typed versions of the source spreadsheets as parquet files, so warm runs skip Excel.
+
+USE:
+    updrs = load_cached("data/Smartbike_NIH_variabiliity_UPDRS.xlsx", "updrs", parse_updrs)
+
+PURPOSE:
+    * Each entry is keyed by the sha256 of the source file, the parser name and PARSER_VERSION.
+      Editing the spreadsheet or bumping PARSER_VERSION makes a new entry, the stale one
+      is eventually evicted.
+    * The cache folder, subfolders included, is kept under MAX_BYTES by removing the least
+      recently used entries
+    * Set ENABLED = False to always parse the source files
+"""
+import os
+import hashlib
+import pandas as pd
+
+CACHE_DIR = "cache"
+MAX_BYTES = 2 * 1024 ** 3  # 2 GB
+# bump this whenever a parser changes what it returns
+PARSER_VERSION = 3
+ENABLED = True
+# files evict_cache counts, anything else in the folder is left alone
+CACHED_SUFFIXES = (".parquet", ".png")
+
+
+def file_hash(path, chunk_size=1024 ** 2):
+    """
+    sha256 of a file's contents
+    """
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def cache_path(path, name, cache_dir=CACHE_DIR):
+    """
+    Where the cached version of `path` parsed by the `name` parser lives
+    """
+    key = f"{name}-v{PARSER_VERSION}-{file_hash(path)[:32]}"
+    return os.path.join(cache_dir, key + ".parquet")
+
+
+def load_cached(path, name, parser, cache_dir=CACHE_DIR, max_bytes=MAX_BYTES, evict=True):
+    """
+    Returns parser(path), from the cache if this exact file was parsed before
+
+    input
+    -----
+    path: str
+        Source file
+    name: str
+        Name of the parser, one file can be parsed several ways (ex: updrs and entropy)
+    parser: function
+        Takes the path, returns a dataframe
+    evict: bool
+        If False, skips the size check. Used by worker processes, the parent evicts once at the end.
+    """
+    if not ENABLED:
+        return parser(path)
+
+    target = cache_path(path, name, cache_dir)
+    if os.path.exists(target):
+        # mark as recently used
+        os.utime(target)
+        return pd.read_parquet(target)
+
+    df = parser(path)
+    if df is None:
+        # parser failed, nothing to keep
+        return df
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp = f"{target}.{os.getpid()}.tmp"
+    try:
+        df.to_parquet(tmp)
+        # atomic, so two processes writing the same entry can't leave a half written file
+        os.replace(tmp, target)
+    except Exception as e:
+        print(f"WARNING: could not cache {path} ({name}): {e}")
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        return df
+    # read back so cold and warm runs return the exact same dtypes
+    df = pd.read_parquet(target)
+    if evict:
+        evict_cache(cache_dir, max_bytes)
+    return df
+
+
+def evict_cache(cache_dir=CACHE_DIR, max_bytes=MAX_BYTES):
+    """
+    Removes the least recently used entries until the cache folder is under max_bytes.
+    Subfolders count too (the pipeline outputs and segment_report panels).
+    """
+    if not os.path.isdir(cache_dir):
+        return
+    entries = []
+    for folder, _, names in os.walk(cache_dir):
+        for name in names:
+            if name.endswith(CACHED_SUFFIXES):
+                path = os.path.join(folder, name)
+                stat = os.stat(path)
+                entries.append((stat.st_mtime, stat.st_size, path))
+    entries.sort()
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in entries:
+        if total <= max_bytes:
+            break
+        os.remove(path)
+        total -= size
+
+
+def clear_cache(cache_dir=CACHE_DIR):
+    """
+    Removes every cached entry
+    """
+    evict_cache(cache_dir, max_bytes=-1)
@@ -0,0 +1,222 @@
+"""
+Finds the warm up, main session and cool down of each cadence trace, and writes the num_cuts
+table that segment_cutter.r and segmenter.py read. Replaces the hand-typed dicts in data/num_cuts.py.
+
+USE:
+    dfn = dfNumCuts(bike_df, save_table = False)
+    num_cuts = dfn.result
+
+PURPOSE:
+    * Average the cadence into short bins (10 seconds by default)
+    * Find the change points of the binned cadence with PELT (Killick et al., 2012), which runs in
+      about linear time. The penalty scales with the noise of the session and log(n).
+    * Merge neighbouring segments whose means are within `merge_rpm` of each other, the longest
+      merged segment is the main session
+    * Anything before the main session is the warm up, anything after is the cool down.
+      num_cuts is the number of those that exist (1 or 2).
+    * A 0 still means manual review: the main session is too short, or there is nothing to cut
+"""
+import pandas as pd
+import numpy as np
+from storage import dbInfo
+
+# settings used by dfNumCuts, any of them can be overridden
+CUT_CONFIG = {
+    "bin_sec": 10,  # seconds averaged together before looking for change points
+    "min_size": 3,  # shortest segment, in bins
+    "penalty": 3.0,  # multiplied by the noise variance and log(number of bins)
+    "merge_rpm": 10,  # segments closer than this are the same plateau
+    "min_edge_sec": 60,  # warm ups / cool downs shorter than this are ignored
+    "min_main_frac": 0.5,  # main session has to be at least this much of the session
+}
+
+
+def bin_means(values, bin_size):
+    """
+    Averages every bin_size values, the last bin may be shorter. Ignores nans.
+    """
+    values = np.asarray(values, dtype=float)
+    n_bins = int(np.ceil(len(values) / bin_size))
+    bins = np.arange(len(values)) // bin_size
+    ok = ~np.isnan(values)
+    sums = np.bincount(bins[ok], weights=values[ok], minlength=n_bins)
+    counts = np.bincount(bins[ok], minlength=n_bins)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        means = sums / counts
+    # bins without any values borrow from the previous bin
+    return pd.Series(means).ffill().bfill().to_numpy()
+
+
+def noise_variance(values):
+    """
+    Robust estimate of the noise variance, from the median absolute first difference
+    """
+    diffs = np.diff(values)
+    if len(diffs) == 0:
+        return 1.0
+    mad = np.median(np.abs(diffs - np.median(diffs))) * 1.4826
+    return max((mad / np.sqrt(2)) ** 2, 1e-6)
+
+
+def pelt(values, penalty, min_size=1):
+    """
+    Change points of the mean of values, with the PELT algorithm
+
+    input
+    -----
+    values: np.array
+    penalty: float
+        Cost of adding one change point
+    min_size: int
+        Shortest segment allowed
+
+    output
+    ------
+    Sorted list of segment ends. The last one is always len(values).
+    """
+    n = len(values)
+    csum = np.concatenate([[0], np.cumsum(values)])
+    csum2 = np.concatenate([[0], np.cumsum(values**2)])
+
+    def cost(starts, end):
+        # sum of squared deviations from the segment mean
+        length = end - starts
+        total = csum[end] - csum[starts]
+        return (csum2[end] - csum2[starts]) - total**2 / length
+
+    best = np.full(n + 1, np.inf)
+    best[0] = -penalty
+    last = np.zeros(n + 1, dtype=int)
+    candidates = np.array([0])
+    for t in range(min_size, n + 1):
+        ok = t - candidates >= min_size
+        starts = candidates[ok]
+        if len(starts) == 0:
+            continue
+        totals = best[starts] + cost(starts, t) + penalty
+        i = int(np.argmin(totals))
+        best[t] = totals[i]
+        last[t] = starts[i]
+        # prune the starts that can never win again
+        keep = np.ones(len(candidates), dtype=bool)
+        keep[ok] = totals - penalty <= best[t]
+        candidates = np.append(candidates[keep], t)
+
+    ends = []
+    t = n
+    while t > 0:
+        ends.append(t)
+        t = last[t]
+    return sorted(ends)
+
+
+def find_sections(cadence, config=None):
+    """
+    Finds the warm up, main session and cool down of one session
+
+    input
+    -----
+    cadence: np.array
+        Cadence of one session, one value per second
+    config: dict
+        Overrides for CUT_CONFIG
+
+    output
+    ------
+    dict with num_cuts, warmup_end and cooldown_start (in seconds), main_mean and n_segments
+    """
+    config = {**CUT_CONFIG, **(config or {})}
+    bin_sec = config["bin_sec"]
+    binned = bin_means(cadence, bin_sec)
+    n = len(binned)
+    if n < 2 * config["min_size"]:
+        return {
+            "num_cuts": 0,
+            "warmup_end": np.nan,
+            "cooldown_start": np.nan,
+            "main_mean": np.nan,
+            "n_segments": 1,
+        }
+
+    penalty = config["penalty"] * noise_variance(binned) * np.log(n)
+    ends = pelt(binned, penalty, config["min_size"])
+    starts = [0] + ends[:-1]
+    means = [binned[s:e].mean() for s, e in zip(starts, ends)]
+
+    # merge neighbouring segments that sit on the same plateau
+    merged = [[starts[0], ends[0], means[0]]]
+    for s, e, m in zip(starts[1:], ends[1:], means[1:]):
+        if abs(m - merged[-1][2]) < config["merge_rpm"]:
+            merged[-1][1] = e
+            merged[-1][2] = binned[merged[-1][0] : e].mean()
+        else:
+            merged.append([s, e, m])
+    main_start, main_end, main_mean = max(merged, key=lambda seg: seg[1] - seg[0])
+
+    min_edge = config["min_edge_sec"] / bin_sec
+    has_warmup = main_start >= min_edge
+    has_cooldown = n - main_end >= min_edge
+    num_cuts = int(has_warmup) + int(has_cooldown)
+    if (main_end - main_start) < config["min_main_frac"] * n:
+        # no clear main session, a person has to look at it
+        num_cuts = 0
+    return {
+        "num_cuts": num_cuts,
+        "warmup_end": float(main_start * bin_sec) if has_warmup else np.nan,
+        "cooldown_start": float(main_end * bin_sec) if has_cooldown else np.nan,
+        "main_mean": float(main_mean),
+        "n_segments": len(ends),
+    }
+
+
+class dfNumCuts:
+    """
+    Estimates the number of cuts each session needs, the automatic version of data/num_cuts.py
+    """
+
+    def __init__(self, bike_df, save_table=False, config=None):
+        """
+        Coordinates the self.functions
+
+        bike_df:
+            dfBike.result, at least id_sess, elapsed_sec and cadence columns
+        config:
+            Dict that overrides any of the CUT_CONFIG settings
+        """
+        self.config = {**CUT_CONFIG, **(config or {})}
+        num_cuts = self.estimate_cuts(bike_df)
+
+        if save_table:
+            db = dbInfo()
+            db.save_table(num_cuts, "num_cuts")
+
+        self.result = num_cuts
+
+    def estimate_cuts(self, bike_df):
+        """
+        Runs find_sections on every session
+        """
+        rows = []
+        for id_sess, temp_df in bike_df.groupby("id_sess", sort=False, observed=True):
+            temp_df = temp_df.sort_values("elapsed_sec", kind="stable")
+            sections = find_sections(temp_df["cadence"].to_numpy(), self.config)
+            if sections["num_cuts"] == 0:
+                print(f"WARNING: {id_sess} needs manual review")
+            rows.append({"id_sess": id_sess, **sections})
+        return pd.DataFrame(
+            rows,
+            columns=[
+                "id_sess",
+                "num_cuts",
+                "warmup_end",
+                "cooldown_start",
+                "main_mean",
+                "n_segments",
+            ],
+        )
+
+    def as_dict(self):
+        """
+        Same format as num_cuts_dict in data/num_cuts.py
+        """
+        return dict(zip(self.result["id_sess"], self.result["num_cuts"]))
@@ -0,0 +1,66 @@
+"""
+Downsamples a signal for plotting, keeping its shape.
+
+USE:
+    x_small, y_small = lttb(df["min"].to_numpy(), df["cadence"].to_numpy(), 1000)
+
+PURPOSE:
+    * A 1 Hz session is thousands of points, a plot is about a thousand pixels wide
+    * Largest-Triangle-Three-Buckets (Steinarsson, 2013) keeps the peaks and dips that
+      averaging or taking every nth point would lose
+    * The first and last points are always kept
+"""
+import numpy as np
+
+
+def lttb(x, y, n_out):
+    """
+    Largest-Triangle-Three-Buckets downsampling
+
+    input
+    -----
+    x: np.array
+        Sorted x values
+    y: np.array
+    n_out: int
+        Number of points to keep, at least 3
+
+    output
+    ------
+    x and y of the kept points. If there are no more than n_out points, x and y unchanged.
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return x, y
+
+    # missing values can't form triangles, drop them first
+    ok = ~(np.isnan(x) | np.isnan(y))
+    x, y = x[ok], y[ok]
+    n = len(x)
+    if n_out >= n:
+        return x, y
+
+    # the first and last points get buckets of their own, the rest share n_out - 2 buckets
+    edges = np.linspace(1, n - 1, n_out - 1).astype(int)
+    keep = np.empty(n_out, dtype=np.int64)
+    keep[0] = 0
+    keep[-1] = n - 1
+    a = 0
+    for i in range(n_out - 2):
+        start, stop = edges[i], edges[i + 1]
+        # the third point is the average of the next bucket
+        if i + 2 < len(edges):
+            next_start, next_stop = edges[i + 1], edges[i + 2]
+        else:
+            next_start, next_stop = n - 1, n
+        cx = x[next_start:next_stop].mean()
+        cy = y[next_start:next_stop].mean()
+        # twice the triangle area from the last kept point, each candidate and the average
+        area = np.abs(
+            (x[a] - cx) * (y[start:stop] - y[a]) - (x[a] - x[start:stop]) * (cy - y[a])
+        )
+        a = start + int(np.argmax(area))
+        keep[i + 1] = a
+    return x[keep], y[keep]
@@ -0,0 +1,130 @@
+"""
+Effort as time in zone: the percent of each session spent above one or more power and cadence
+thresholds. Replaces helpers.perc_time_in_col.
+
+USE:
+    sessions, participants = effort_tables(bike_df)
+    sessions, participants = effort_tables(bike_df, {"power": range(0, 100, 5)})  # sweep
+
+PURPOSE:
+    * Every threshold of a signal is counted in one pass: each row is binned by how many
+      thresholds it is above, then counted per session with a single bincount
+    * Column names are perc_{signal}_gt_{threshold}, ex: perc_cadence_gt_60
+    * perc_time_in_pos (percent of time with power > 0) is always there, it is the effort
+      used in the demos table
+    * Per session and per participant (mean of their sessions) tables come from the same call
+    * Missing values count as time spent below every threshold
+"""
+import pandas as pd
+import numpy as np
+import studies as st
+
+# thresholds used when none are given, in watts and rpm
+EFFORT_THRESHOLDS = {
+    "power": [0, 20, 40, 60],
+    "cadence": [0, 60, 75, 90],
+}
+
+
+def zone_column(signal, threshold):
+    return f"perc_{signal}_gt_{threshold:g}"
+
+
+def time_above(values, codes, n_sessions, thresholds):
+    """
+    Number of rows of each session above each threshold
+
+    input
+    -----
+    values: np.array
+    codes: np.array of int
+        Session of each row, 0 to n_sessions - 1
+    n_sessions: int
+    thresholds: list of float
+
+    output
+    ------
+    np.array of shape (n_sessions, len(thresholds)), in the same order as thresholds
+    """
+    thresholds = np.asarray(thresholds, dtype=float)
+    order = np.argsort(thresholds)
+    n_levels = len(thresholds) + 1
+    # how many thresholds each value is above, missing values are above none
+    level = np.searchsorted(thresholds[order], values, side="left")
+    level[np.isnan(values)] = 0
+
+    counts = np.bincount(
+        codes * n_levels + level, minlength=n_sessions * n_levels
+    ).reshape(n_sessions, n_levels)
+    # above threshold j = every row with a level past j
+    above = np.cumsum(counts[:, ::-1], axis=1)[:, ::-1][:, 1:]
+    result = np.empty_like(above)
+    result[:, order] = above
+    return result
+
+
+def by_participant(sessions):
+    """
+    Mean of every effort column over each participant's sessions, plus their session count and time
+    """
+    perc = [col for col in sessions.columns if col.startswith("perc_")]
+    return (
+        sessions.groupby("id")
+        .agg(
+            n_sessions=("id_sess", "size"),
+            sec=("sec", "sum"),
+            **{col: (col, "mean") for col in perc},
+        )
+        .reset_index()
+    )
+
+
+def effort_tables(bike_df, thresholds=None):
+    """
+    Time in zone of every session and participant
+
+    input
+    -----
+    bike_df: pd.DataFrame
+        dfBike.result, at least id_sess and the signals in thresholds
+    thresholds: dict
+        {signal: list of thresholds}, defaults to EFFORT_THRESHOLDS
+
+    output
+    ------
+    sessions: pd.DataFrame
+        One row per id_sess: id_sess, perc_time_in_pos, day, id, sec (number of rows)
+        and one column per signal and threshold
+    participants: pd.DataFrame
+        One row per id, see by_participant
+    """
+    thresholds = {k: list(v) for k, v in (thresholds or EFFORT_THRESHOLDS).items()}
+    codes, ids = pd.factorize(bike_df["id_sess"])
+    ok = codes >= 0
+    codes = codes[ok]
+    n_sessions = len(ids)
+    sec = np.bincount(codes, minlength=n_sessions)
+
+    ids = pd.Series(np.asarray(ids, dtype=object), dtype=str)
+    sessions = pd.DataFrame({"id_sess": ids})
+    # power > 0 comes along with the other power thresholds
+    power = thresholds.get("power", [])
+    above = time_above(
+        bike_df["power"].to_numpy(dtype=float)[ok], codes, n_sessions, [0] + power
+    )
+    sessions["perc_time_in_pos"] = above[:, 0] / sec * 100
+    parts = st.session_parts(bike_df, ids)
+    sessions["day"] = parts["day"]
+    sessions["id"] = parts["id"]
+    sessions["sec"] = sec
+    for signal, values in thresholds.items():
+        if signal == "power":
+            counts = above[:, 1:]
+        else:
+            counts = time_above(
+                bike_df[signal].to_numpy(dtype=float)[ok], codes, n_sessions, values
+            )
+        for j, threshold in enumerate(values):
+            sessions[zone_column(signal, threshold)] = counts[:, j] / sec * 100
+
+    return sessions, by_participant(sessions)
@@ -0,0 +1,176 @@
+"""
+Computes the entropy measures of the bike signals directly from bike_data, instead of reading
+them out of Smartbike_NIH_variabiliity_UPDRS.xlsx.
+
+USE:
+    df_entropy = entropy_table(bike_df, workers = 4)
+    dfe = dfEntropy(bike_df = bike_df)  # same thing, in the long format of dfEntropy
+
+PURPOSE:
+    * mean, std, sample entropy (samen), approximate entropy (apen) and spectral entropy (spen)
+      of hr, cadence and power for every id_sess
+    * Template matching uses a KD-tree (Chebyshev distance), so sample and approximate entropy
+      don't compare every pair of templates
+    * Sessions run in parallel, one session per task
+    * Defaults follow the usual choices: m = 2, r = 0.2 * std of the signal
+    * Spectral entropy is the Shannon entropy of the normalized periodogram, divided by
+      log(number of frequencies) so it falls between 0 and 1
+"""
+import pandas as pd
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from scipy.spatial import cKDTree
+
+# bike_data column : short name used in the entropy table
+SIGNALS = {"hr": "hr", "cadence": "cad", "power": "pow"}
+STATS = ["mean", "std", "samen", "apen", "spen"]
+COLUMNS = ["id_sess"] + [
+    f"{short}_{stat}" for short in SIGNALS.values() for stat in STATS
+]
+
+
+def embed(values, m):
+    """
+    All templates (windows) of length m, one per row
+    """
+    n = len(values) - m + 1
+    if n <= 0:
+        return np.empty((0, m))
+    return np.lib.stride_tricks.sliding_window_view(values, m)
+
+
+def clean(values):
+    """
+    Signal as floats, without missing values
+    """
+    values = np.asarray(values, dtype=float)
+    return values[~np.isnan(values)]
+
+
+def sample_entropy(values, m=2, r=0.2):
+    """
+    Sample entropy (Richman & Moorman, 2000)
+
+    input
+    -----
+    values: np.array
+    m: int
+        Template length
+    r: float
+        Tolerance, as a fraction of the standard deviation of values
+
+    output
+    ------
+    float, nan if there are no matches to compare
+    """
+    values = clean(values)
+    n = len(values)
+    if n <= m + 1:
+        return np.nan
+    tol = r * np.std(values)
+    # the same N - m templates are used for both lengths
+    templates_m = embed(values, m)[: n - m]
+    templates_m1 = embed(values, m + 1)
+
+    # count_neighbors counts every ordered pair, including each template with itself
+    tree_m = cKDTree(templates_m)
+    tree_m1 = cKDTree(templates_m1)
+    b = (tree_m.count_neighbors(tree_m, tol, p=np.inf) - len(templates_m)) / 2
+    a = (tree_m1.count_neighbors(tree_m1, tol, p=np.inf) - len(templates_m1)) / 2
+    if a == 0 or b == 0:
+        return np.nan
+    return float(-np.log(a / b))
+
+
+def approximate_entropy(values, m=2, r=0.2):
+    """
+    Approximate entropy (Pincus, 1991). Same inputs as sample_entropy.
+    """
+    values = clean(values)
+    n = len(values)
+    if n <= m + 1:
+        return np.nan
+    tol = r * np.std(values)
+
+    def phi(length):
+        templates = embed(values, length)
+        tree = cKDTree(templates)
+        # includes each template matching itself, so never log(0)
+        counts = tree.query_ball_point(templates, tol, p=np.inf, return_length=True)
+        return np.mean(np.log(counts / len(templates)))
+
+    return float(phi(m) - phi(m + 1))
+
+
+def spectral_entropy(values):
+    """
+    Normalized spectral entropy, between 0 (one frequency) and 1 (white noise)
+    """
+    values = clean(values)
+    if len(values) < 4:
+        return np.nan
+    power = np.abs(np.fft.rfft(values - values.mean())) ** 2
+    # leave out the zero frequency, it is 0 after removing the mean
+    power = power[1:]
+    total = power.sum()
+    if total == 0:
+        return np.nan
+    p = power / total
+    p = p[p > 0]
+    return float(-np.sum(p * np.log(p)) / np.log(len(power)))
+
+
+def session_entropy(task):
+    """
+    Every statistic of every signal for one session. Runs in a worker process.
+
+    input
+    -----
+    task: tuple
+        (id_sess, {signal name: np.array}, m, r)
+    """
+    id_sess, signals, m, r = task
+    row = {"id_sess": id_sess}
+    for col, short in SIGNALS.items():
+        values = clean(signals[col])
+        row[f"{short}_mean"] = values.mean() if len(values) else np.nan
+        row[f"{short}_std"] = values.std(ddof=1) if len(values) > 1 else np.nan
+        row[f"{short}_samen"] = sample_entropy(values, m, r)
+        row[f"{short}_apen"] = approximate_entropy(values, m, r)
+        row[f"{short}_spen"] = spectral_entropy(values)
+    return row
+
+
+def session_task(id_sess, temp_df, m=2, r=0.2):
+    """
+    The session_entropy task of one session of bike_data
+    """
+    temp_df = temp_df.sort_values("elapsed_sec", kind="stable")
+    signals = {col: temp_df[col].to_numpy(dtype=float) for col in SIGNALS}
+    return id_sess, signals, m, r
+
+
+def entropy_table(bike_df, m=2, r=0.2, workers=None):
+    """
+    One row per id_sess with the mean, std, samen, apen and spen of hr, cadence and power
+
+    input
+    -----
+    bike_df: pd.DataFrame
+        dfBike.result (or main_sessions), at least id_sess, elapsed_sec, hr, cadence and power
+    m, r:
+        Passed to sample_entropy and approximate_entropy
+    workers: int
+        Number of processes, None uses every core, 1 runs the sessions one by one
+    """
+    tasks = [
+        session_task(id_sess, temp_df, m, r)
+        for id_sess, temp_df in bike_df.groupby("id_sess", sort=False, observed=True)
+    ]
+
+    if workers == 1:
+        rows = [session_entropy(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            rows = list(pool.map(session_entropy, tasks))
+    return pd.DataFrame(rows, columns=COLUMNS)
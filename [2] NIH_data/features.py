@@ -0,0 +1,186 @@
+"""
+Rolling mean, std, slope and coefficient of variation of hr, cadence and power at several window sizes,
+summarized into one row of features per session.
+
+USE:
+    df_features = feature_table(bike_df)  # windows of 10, 30, 60 and 300 s
+    df_features = feature_table(bike_df, windows = [5, 120], signals = ["power"])
+
+    # the per-row rolling values of one signal
+    stats = rolling_stats(values, elapsed_sec, bounds, windows = [30])[30]
+
+PURPOSE:
+    * Every window of every session comes from running sums: the sum over the last `window`
+      rows is cs[i] - cs[i - window]. The running sums of a signal are computed once, then
+      each window size is one strided subtraction over every row of every session. The only
+      loop is over signals and window sizes, there is none over rows or sessions and no
+      (rows x window) array.
+    * Windows are in rows, which are seconds for the 1 Hz bike data (dfBike(resample = True)
+      fills the gaps so rows and seconds match exactly). A window is only computed once the
+      session has that many rows, and only if at least MIN_FILLED of its rows are present.
+    * slope is the least squares slope against elapsed_sec (units per second), cv is std / mean
+      (only where the mean is positive)
+    * Each rolling series is averaged over the session, the columns are
+      {signal}_{stat}_{window}s, ex: cad_cv_30s, with the same short names as entropy.py
+    * Signals are centered on their session mean first, so the running sums stay small
+"""
+import numpy as np
+import pandas as pd
+import zero_runs as zr
+import studies as st
+from entropy import SIGNALS
+
+WINDOWS = [10, 30, 60, 300]
+ROLL_STATS = ["mean", "std", "slope", "cv"]
+# fraction of a window's rows that have to be present
+MIN_FILLED = 0.5
+
+
+def feature_column(short, stat, window):
+    return f"{short}_{stat}_{window:g}s"
+
+
+def window_sums(sums, positions, window):
+    """
+    Sum of the last `window` rows (this one included) of every row, within its session
+
+    input
+    -----
+    sums: np.array
+        (columns, rows + 1) running sums of every session back to back, starting with 0
+    positions: np.array
+        Position of each row within its session, from zero_runs.session_positions
+    window: int
+
+    output
+    ------
+    np.array (columns, rows), nan for the first window - 1 rows of every session
+    """
+    out = np.full((len(sums), len(positions)), np.nan)
+    # plain slices, the windows that cross into the previous session are masked after
+    out[:, window - 1 :] = sums[:, window:] - sums[:, :-window]
+    out[:, positions < window - 1] = np.nan
+    return out
+
+
+def session_means(values, codes, n_sessions):
+    """
+    nan-aware mean of every session, repeated for each of its rows
+    """
+    ok = ~np.isnan(values)
+    total = np.bincount(codes[ok], weights=values[ok], minlength=n_sessions)
+    count = np.bincount(codes[ok], minlength=n_sessions)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return (total / count)[codes]
+
+
+def rolling_stats(values, times, bounds, windows, min_filled=MIN_FILLED):
+    """
+    Rolling mean, std, slope and cv of one signal, for every session and window size at once
+
+    input
+    -----
+    values: np.array
+        Signal of every session back to back, each session sorted by time
+    times: np.array
+        elapsed_sec of every row
+    bounds: np.array
+        Session offsets from zero_runs.session_bounds
+    windows: list of int
+        Number of rows in a window
+    min_filled: float
+        Windows with fewer present rows than min_filled * window are nan
+
+    output
+    ------
+    {window: {stat: np.array}}, one value per row, for the window ending at that row
+    """
+    values = np.asarray(values, dtype=float)
+    times = np.asarray(times, dtype=float)
+    lengths = np.diff(bounds)
+    codes = np.repeat(np.arange(len(lengths)), lengths)
+    positions = zr.session_positions(bounds)
+    ok = ~np.isnan(values) & ~np.isnan(times)
+    offset = session_means(np.where(ok, values, np.nan), codes, len(lengths))
+    x = np.where(ok, values - offset, 0.0)
+    t = np.where(ok, times - session_means(times, codes, len(lengths)), 0.0)
+
+    # running sums of n, x, x^2, t, t^2 and t * x, shared by every window size
+    terms = np.stack([ok.astype(float), x, x * x, t, t * t, t * x])
+    sums = np.concatenate([np.zeros((len(terms), 1)), np.cumsum(terms, axis=1)], axis=1)
+
+    result = {}
+    for window in windows:
+        n, sx, sxx, st, stt, stx = window_sums(sums, positions, window)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = sx / n
+            var = np.maximum(sxx - sx * mean, 0) / (n - 1)
+            std = np.sqrt(var)
+            slope = (n * stx - st * sx) / (n * stt - st * st)
+            mean = mean + offset
+            cv = np.where(mean > 0, std / mean, np.nan)
+
+        enough = n >= max(min_filled * window, 2)
+        stats = {"mean": mean, "std": std, "slope": slope, "cv": cv}
+        result[window] = {
+            stat: np.where(enough, v, np.nan) for stat, v in stats.items()
+        }
+    return result
+
+
+def feature_table(bike_df, windows=None, signals=None, min_filled=MIN_FILLED):
+    """
+    One row per id_sess with the session mean of every rolling statistic, signal and window
+
+    input
+    -----
+    bike_df: pd.DataFrame
+        dfBike.result (or main_sessions), at least id_sess, elapsed_sec and the signals
+    windows: list of int
+        Window sizes in rows (seconds), defaults to WINDOWS
+    signals: list of str
+        bike_data columns, defaults to hr, cadence and power
+    min_filled: float
+        See rolling_stats
+
+    output
+    ------
+    pd.DataFrame: id_sess, id, day, sec (number of rows) and {signal}_{stat}_{window}s columns.
+    A session shorter than a window has nan for that window.
+    """
+    windows = windows or WINDOWS
+    signals = signals or list(SIGNALS)
+    codes, ids = pd.factorize(bike_df["id_sess"])
+    ok = codes >= 0
+    times = bike_df["elapsed_sec"].to_numpy(dtype=float)[ok]
+    codes = codes[ok]
+    # sessions back to back, each in time order
+    order = np.lexsort((times, codes))
+    codes = codes[order]
+    times = times[order]
+    n_sessions = len(ids)
+    sec = np.bincount(codes, minlength=n_sessions)
+    bounds = zr.session_bounds(sec)
+
+    ids = pd.Series(np.asarray(ids, dtype=object), dtype=str)
+    table = pd.DataFrame({"id_sess": ids})
+    parts = st.session_parts(bike_df, ids, np.flatnonzero(ok)[order][bounds[:-1]])
+    table["id"] = parts["id"]
+    table["day"] = parts["day"]
+    table["sec"] = sec
+
+    columns = {}
+    for signal in signals:
+        values = bike_df[signal].to_numpy(dtype=float)[ok][order]
+        short = SIGNALS.get(signal, signal)
+        rolled = rolling_stats(values, times, bounds, windows, min_filled)
+        for window, stats in rolled.items():
+            for stat in ROLL_STATS:
+                present = ~np.isnan(stats[stat])
+                total = np.bincount(
+                    codes[present], weights=stats[stat][present], minlength=n_sessions
+                )
+                count = np.bincount(codes[present], minlength=n_sessions)
+                with np.errstate(invalid="ignore", divide="ignore"):
+                    columns[feature_column(short, stat, window)] = total / count
+    return pd.concat([table, pd.DataFrame(columns)], axis=1)
@@ -0,0 +1,171 @@
+"""
+Reads the per-session raw bike exports directly, instead of the hand-built [combined_files].xlsx.
+
+USE:
+    df = load_bike_files("raw_bike_files", workers=4)
+    dfb = dfBike(use_this="raw_bike_files")  # same thing, through dfBike
+
+PURPOSE:
+    * Find every raw bike export (CSV or XLSX) in a folder
+    * Parse and organize the files in parallel, one file per worker process
+    * Result is the same as running dfBike.load_and_organize on the combined workbook
+    * Files without an ID column get the file name as their ID (ex: SMB_024_day1_02.csv)
+    * Each organized file is cached (see cache.py), so only new or edited files are parsed again
+    * load_studies reads the files of several studies (see studies.py) in one process pool
+"""
+
+import os
+import glob
+import pandas as pd
+from pandas.api.types import union_categoricals
+from concurrent.futures import ProcessPoolExecutor
+import cache
+import studies as st
+
+# the old hand-combined workbook lives in the same folder, skip it
+COMBINED_FILE = "[combined_files].xlsx"
+
+
+def find_bike_files(folder="raw_bike_files", extensions=(".csv", ".xlsx")):
+    """
+    Lists the raw bike exports in folder, sorted by file name
+
+    input
+    -----
+    folder: str
+    extensions: tuple of str
+        File types to pick up
+    """
+    files = []
+    for name in sorted(os.listdir(folder)):
+        path = os.path.join(folder, name)
+        if name == COMBINED_FILE or name.startswith("~$"):
+            # skip the combined workbook and excel lock files
+            continue
+        if os.path.isfile(path) and name.lower().endswith(tuple(extensions)):
+            files.append(path)
+    return files
+
+
+def read_bike_file(path):
+    """
+    Reads one raw bike export, in the same layout as the combined workbook
+    """
+    if path.lower().endswith(".csv"):
+        df = pd.read_csv(path)
+    else:
+        df = pd.read_excel(path)
+    if "ID" not in df.columns:
+        df["ID"] = os.path.splitext(os.path.basename(path))[0]
+    return df
+
+
+def organize_bike_file(path, compat=False, study=None):
+    """
+    Reads one raw bike export and runs it through dfBike.load_and_organize. Runs in a worker process.
+    """
+    # imported here, raw_processing imports this module
+    import raw_processing as r
+
+    name = "bike_compat" if compat else "bike"
+    return cache.load_cached(
+        path,
+        f"{name}-{st.study_key(study)}",
+        lambda path: r.dfBike.load_and_organize(read_bike_file(path), compat, study),
+        evict=False,
+    )
+
+
+def concat_files(frames):
+    """
+    Concatenates the organized files. Categorical columns get the union of every file's
+    categories first, otherwise pandas would turn them back into strings.
+    """
+    for col in frames[0].columns:
+        if isinstance(frames[0][col].dtype, pd.CategoricalDtype):
+            categories = union_categoricals([df[col] for df in frames]).categories
+            frames = [
+                df.assign(**{col: df[col].cat.set_categories(categories)})
+                for df in frames
+            ]
+    return pd.concat(frames, ignore_index=True)
+
+
+def load_bike_files(
+    folder="raw_bike_files", workers=None, files=None, compat=False, study=None
+):
+    """
+    Reads and organizes every raw bike export in folder
+
+    input
+    -----
+    folder: str
+    workers: int
+        Number of worker processes. None uses every core, 1 reads the files one by one.
+    files: list of str
+        Use these files instead of searching folder
+    compat: bool
+        Passed to dfBike.load_and_organize, keeps the old dtypes
+    study: str, dict or None
+        Study the files come from, sets how the IDs are split (see studies.py)
+    """
+    if files is None:
+        files = find_bike_files(folder)
+    if len(files) == 0:
+        raise FileNotFoundError(f"No raw bike files found in {folder}")
+
+    n = len(files)
+    if workers == 1:
+        frames = [organize_bike_file(path, compat, study) for path in files]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            frames = list(
+                pool.map(organize_bike_file, files, [compat] * n, [study] * n)
+            )
+    cache.evict_cache()
+    return concat_files(frames)
+
+
+def load_studies(studies, workers=None, compat=False):
+    """
+    Reads and organizes the raw bike exports of several studies, all files in one pool
+
+    input
+    -----
+    studies: list of str or dict
+        See studies.get_study, each needs a raw_folder
+    workers: int
+        Number of worker processes. None uses every core, 1 reads the files one by one.
+
+    output
+    ------
+    {study name: organized bike data}, same as load_bike_files for each study
+    """
+    studies = [st.get_study(study) for study in studies]
+    files = {}
+    for study in studies:
+        files[study["name"]] = find_bike_files(study["raw_folder"])
+        if len(files[study["name"]]) == 0:
+            raise FileNotFoundError(
+                f"No raw bike files found in {study['raw_folder']} ({study['name']})"
+            )
+    paths = [path for study in studies for path in files[study["name"]]]
+    owners = [study for study in studies for _ in files[study["name"]]]
+
+    if workers == 1:
+        frames = [organize_bike_file(p, compat, o) for p, o in zip(paths, owners)]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            frames = list(
+                pool.map(organize_bike_file, paths, [compat] * len(paths), owners)
+            )
+    cache.evict_cache()
+
+    # frames are in the same order as the studies
+    result = {}
+    start = 0
+    for study in studies:
+        stop = start + len(files[study["name"]])
+        result[study["name"]] = concat_files(frames[start:stop])
+        start = stop
+    return result
@@ -0,0 +1,217 @@
+"""
+Stage and session level instrumentation for dfBike, dfDemos and dfEntropy.
+
+USE:
+    import instrument
+    instrument.clear()
+    dfb = dfBike()
+    events = instrument.to_frame()  # one row per stage call / session
+    instrument.summary()            # time and rows per stage
+    instrument.slowest("remove_extreme_cad")
+
+    instrument.add_hook(instrument.print_hook)  # or any function that takes an event dict
+
+PURPOSE:
+    * Every instrumented stage records its wall time, rows in, rows out and the process memory
+    * Stages that run once per session also record the id_sess, so the slow sessions stand out
+    * Warnings (ex: `elapsed_sec` no longer sequential) are recorded as events and still printed
+    * Hooks are called with every event as it happens, ex: to stream them to a file
+    * Only the last MAX_EVENTS events are kept, the oldest are dropped, so a long-lived process
+      doesn't grow without limit. Use a hook to keep all of them.
+    * Only stages that run in this process are recorded. Stages that run in worker processes
+      (ex: load_and_organize when ingest.load_bike_files reads files with workers) record into
+      the worker's own copy, which is thrown away. The stages around them are still recorded.
+    * Set ENABLED = False to turn it all off
+"""
+import os
+import time
+import functools
+import inspect
+import datetime as dt
+from collections import deque
+import pandas as pd
+
+ENABLED = True
+# events kept in memory, a full run records a few per session
+MAX_EVENTS = 100000
+EVENTS = deque(maxlen=MAX_EVENTS)
+HOOKS = []
+
+COLUMNS = [
+    "timestamp",
+    "stage",
+    "id_sess",
+    "wall_sec",
+    "rows_in",
+    "rows_out",
+    "rss_mb",
+    "level",
+    "message",
+]
+
+
+def memory_mb():
+    """
+    Resident memory of this process in MB, nan where it can't be read
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / 1024**2
+    except (OSError, ValueError, AttributeError):
+        try:
+            import resource
+
+            # peak instead of current, ru_maxrss is in KB on linux and bytes on mac
+            return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        except ImportError:
+            return float("nan")
+
+
+def emit(
+    stage,
+    id_sess=None,
+    wall_sec=None,
+    rows_in=None,
+    rows_out=None,
+    level="info",
+    message=None,
+):
+    """
+    Records one event and passes it to every hook
+    """
+    if not ENABLED:
+        return
+    event = {
+        "timestamp": dt.datetime.now().isoformat(timespec="milliseconds"),
+        "stage": stage,
+        "id_sess": id_sess,
+        "wall_sec": wall_sec,
+        "rows_in": rows_in,
+        "rows_out": rows_out,
+        "rss_mb": memory_mb(),
+        "level": level,
+        "message": message,
+    }
+    EVENTS.append(event)
+    for hook in HOOKS:
+        hook(event)
+
+
+def emit_sessions(stage, id_sess, rows_in, rows_out):
+    """
+    Records one event per session for a stage that handles every session in one pass.
+    There is no per-session wall time, see the stage's own event for that.
+    """
+    if not ENABLED:
+        return
+    for k, n_in, n_out in zip(id_sess, rows_in, rows_out):
+        emit(stage, id_sess=k, rows_in=int(n_in), rows_out=int(n_out))
+
+
+def warn(stage, message, id_sess=None):
+    """
+    Prints a warning and records it as an event
+    """
+    print(f"WARNING: {message}")
+    emit(stage, id_sess=id_sess, level="warning", message=message)
+
+
+def n_rows(obj):
+    """
+    Number of rows if obj is a dataframe
+    """
+    return len(obj) if isinstance(obj, pd.DataFrame) else None
+
+
+def timed(stage):
+    """
+    Decorator that records the wall time and rows in/out of a stage.
+    rows_in is the first dataframe argument, rows_out the returned dataframe. If the function
+    takes an id_sess argument, the event is recorded for that session.
+    """
+
+    def decorator(func):
+        signature = inspect.signature(func)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not ENABLED:
+                return func(*args, **kwargs)
+            bound = signature.bind_partial(*args, **kwargs).arguments
+            rows_in = next(
+                (len(v) for v in bound.values() if isinstance(v, pd.DataFrame)), None
+            )
+            start = time.perf_counter()
+            output = func(*args, **kwargs)
+            emit(
+                stage,
+                id_sess=bound.get("id_sess"),
+                wall_sec=time.perf_counter() - start,
+                rows_in=rows_in,
+                rows_out=n_rows(output),
+            )
+            return output
+
+        return wrapper
+
+    return decorator
+
+
+def add_hook(hook):
+    HOOKS.append(hook)
+
+
+def remove_hook(hook):
+    HOOKS.remove(hook)
+
+
+def print_hook(event):
+    """
+    Prints every event on one line
+    """
+    wall = "" if event["wall_sec"] is None else f" {event['wall_sec']:.3f}s"
+    sess = "" if event["id_sess"] is None else f" [{event['id_sess']}]"
+    rows = f" rows {event['rows_in']} -> {event['rows_out']}"
+    print(f"{event['stage']}{sess}{wall}{rows} ({event['rss_mb']:.0f} MB)")
+
+
+def clear():
+    EVENTS.clear()
+
+
+def to_frame():
+    """
+    Every recorded event as a dataframe
+    """
+    return pd.DataFrame(list(EVENTS), columns=COLUMNS)
+
+
+def summary():
+    """
+    Total time, calls, rows and peak memory per stage, slowest stage first.
+    Only timed calls count, the per-session rows of whole-cohort stages would count twice.
+    """
+    events = to_frame()
+    events = events[(events["level"] == "info") & events["wall_sec"].notna()]
+    return (
+        events.groupby("stage")
+        .agg(
+            calls=("stage", "size"),
+            wall_sec=("wall_sec", "sum"),
+            rows_in=("rows_in", "sum"),
+            rows_out=("rows_out", "sum"),
+            peak_rss_mb=("rss_mb", "max"),
+        )
+        .sort_values("wall_sec", ascending=False)
+    )
+
+
+def slowest(stage, n=10):
+    """
+    The n sessions that took longest in stage (or, for whole-cohort stages, had the most rows)
+    """
+    events = to_frame()
+    events = events[(events["stage"] == stage) & events["id_sess"].notna()]
+    by = "wall_sec" if events["wall_sec"].notna().any() else "rows_in"
+    return events.sort_values(by, ascending=False).head(n)
@@ -0,0 +1,207 @@
+"""
+Cleans bike telemetry while the session is still running, one 1 Hz row at a time.
+
+USE:
+    for status in filter_rows(tail_csv("raw_bike_files/SMB_024_day1_02.csv"), "SMB024_day1"):
+        if status["extreme"]:
+            ...
+        if status["ended"]:
+            print(f"session ended at row {status['stop']}")
+
+    rows = read_socket("localhost", 5000)  # CSV lines over TCP, header first
+
+PURPOSE:
+    * Same rules as dfBike.find_longest_zeroes and dfBike.remove_extreme_cad, updated per row:
+        * rolling diff over the last `roll` rows, kept in a ring buffer
+        * the longest run of (rounded) zero diffs so far, ties go to the earliest run
+        * the session has ended once that run starts after `min_start` and is longer than
+          `min_length`, every row from its start on is trimmed
+        * cadences outside config["cad_limits"] (CAD_LIMITS by default) are extreme
+    * Memory does not grow with the session, only the last `roll` values are kept
+    * The trim point can still move while the session runs (a longer run of zeroes later on
+      moves it there), so every status has the current `stop`. Keeping the rows with
+      elapsed_sec < the last stop that are not extreme gives the same rows as dfBike.
+"""
+import csv
+import time
+import socket
+import numpy as np
+import instrument
+from raw_processing import TRIM_CONFIG
+
+
+def to_float(value):
+    """
+    float(value), nan for empty or unreadable values
+    """
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+class onlineFilter:
+    """
+    Trailing zero and extreme cadence filter for one session, fed one row at a time
+    """
+
+    def __init__(self, id_sess=None, config=None):
+        """
+        id_sess:
+            Only used to label events
+        config:
+            Dict that overrides any of the TRIM_CONFIG settings
+        """
+        self.id_sess = id_sess
+        self.config = {**TRIM_CONFIG, **(config or {})}
+        self.ring = np.full(self.config["roll"], np.nan)
+        self.n = 0
+        # run of zero diffs that is still going, and the longest run so far
+        self.run_start = -1
+        self.run_length = 0
+        self.best_start = -1
+        self.best_length = -1
+        self.cut = None
+
+    def push(self, value):
+        """
+        Adds the next row's value (cadence by default)
+
+        output
+        ------
+        dict with the row's elapsed_sec, roll_diff, zero (part of a run), extreme,
+        ended (the session has a trim point) and stop (rows before it are kept)
+        """
+        config = self.config
+        value = to_float(value)
+        i = self.n
+        roll = config["roll"]
+
+        # same as zero_runs.rolling_diff, the first `roll` rows and any nan count as 0
+        diff = value - self.ring[i % roll] if i >= roll else 0.0
+        if np.isnan(diff):
+            diff = 0.0
+        self.ring[i % roll] = value
+        self.n += 1
+
+        zero = bool(np.rint(diff) == config["num"])
+        if zero:
+            if self.run_start < 0:
+                self.run_start = i
+                self.run_length = 0
+            # only non-missing values count toward the run length
+            self.run_length += int(not np.isnan(value))
+            if self.run_length > self.best_length:
+                self.best_start = self.run_start
+                self.best_length = self.run_length
+        else:
+            self.run_start = -1
+
+        cut = None
+        if (
+            self.best_start > config["min_start"]
+            and self.best_length > config["min_length"]
+        ):
+            cut = self.best_start
+        if cut != self.cut:
+            self.cut = cut
+            instrument.emit(
+                "online_filter",
+                id_sess=self.id_sess,
+                message=f"session end at row {cut}",
+            )
+
+        low, high = config["cad_limits"]
+        return {
+            "elapsed_sec": i,
+            "roll_diff": diff,
+            "zero": zero,
+            "extreme": not (low <= value <= high),
+            "ended": self.cut is not None,
+            "stop": self.stop,
+        }
+
+    @property
+    def stop(self):
+        """
+        Rows before this are kept, same as the trim of find_longest_zeroes on the rows so far
+        """
+        return self.n if self.cut is None else self.cut
+
+
+def filter_rows(rows, id_sess=None, config=None, session_key=None):
+    """
+    Runs every row through an onlineFilter, yields each row with its status added
+
+    input
+    -----
+    rows: iterable of dict
+        ex: tail_csv or read_socket, with a cadence (or config["col"]) value
+    id_sess: str
+        Label of the session
+    config: dict
+        Overrides for TRIM_CONFIG
+    session_key: str
+        If given, a new session (and filter) starts whenever row[session_key] changes
+    """
+    col = {**TRIM_CONFIG, **(config or {})}["col"]
+    live = None
+    current = object()
+    for row in rows:
+        if live is None or (session_key and row.get(session_key) != current):
+            current = row.get(session_key) if session_key else id_sess
+            live = onlineFilter(current, config)
+        yield {**row, **live.push(row.get(col))}
+
+
+def csv_rows(lines):
+    """
+    Turns CSV lines (header first) into dicts with lower case keys
+    """
+    header = None
+    for values in csv.reader(lines):
+        if not values:
+            continue
+        if header is None:
+            header = [name.strip().lower() for name in values]
+            continue
+        yield dict(zip(header, values))
+
+
+def follow(path, poll_sec=1.0, idle_sec=60):
+    """
+    Yields every complete line of path, waiting for new ones like `tail -f`.
+    Stops once nothing new was written for idle_sec.
+    """
+    partial = ""
+    idle = 0.0
+    with open(path, newline="") as f:
+        while True:
+            line = f.readline()
+            if not line:
+                if idle >= idle_sec:
+                    return
+                time.sleep(poll_sec)
+                idle += poll_sec
+                continue
+            idle = 0.0
+            partial += line
+            # the writer may be halfway through a line
+            if partial.endswith("\n"):
+                yield partial
+                partial = ""
+
+
+def tail_csv(path, poll_sec=1.0, idle_sec=60):
+    """
+    Rows of a CSV export that is still being written
+    """
+    return csv_rows(follow(path, poll_sec, idle_sec))
+
+
+def read_socket(host, port):
+    """
+    Rows of CSV telemetry sent over a TCP socket, until the sender closes it
+    """
+    with socket.create_connection((host, port)) as sock:
+        yield from csv_rows(sock.makefile("r", newline=""))
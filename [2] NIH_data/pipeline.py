@@ -0,0 +1,396 @@
+"""
+Runs dfBike, dfDemos and dfEntropy as a graph of stages, each stage only recomputed when its inputs change.
+
+USE:
+    p = default_pipeline(bike={"use_this": "raw_bike_files"})
+    results = p.run()  # {"bike": df, "updrs": df, "demographics": df, "demos": df, "entropy": df, "features": df}
+
+    # only bike and demos are recomputed, the spreadsheets come from the memo
+    p.set("bike", trim_config={"cad_limits": (0, 120)})
+    results = p.run(["demos"])
+
+    # another study, or another copy of one of its spreadsheets
+    p = default_pipeline(study="nih_r21", updrs={"path": "data/updrs_v2.xlsx"})
+
+PURPOSE:
+    * Every stage (node) declares the stages it needs, its parameters and the files it reads
+    * A node's key is the sha256 of its name, parameters, source file hashes, cache.PARSER_VERSION
+      and the keys of its inputs. Changing one parameter changes the key of that node and of
+      every node downstream of it, the other nodes keep their key.
+    * The study (its whole dict), timeline_config and the spreadsheet paths are parameters
+      like any other, so they are part of the keys. Outputs are passed downstream: demos and
+      entropy use the bike and updrs outputs instead of reading the files again.
+    * Outputs are kept in memory and as parquet files in `cache_dir`, keyed by the node key,
+      so a later run (or another process) reuses them
+    * Nodes whose inputs are ready run at the same time in a thread pool. The heavy lifting
+      inside dfBike and entropy already runs in processes of their own (see `workers`).
+"""
+import os
+import json
+import hashlib
+import concurrent.futures as cf
+import pandas as pd
+import cache
+import features as ft
+import instrument
+import raw_processing as r
+import studies as st
+
+PIPELINE_DIR = os.path.join(cache.CACHE_DIR, "pipeline")
+# parameters that don't change a node's output, left out of its key
+UNHASHED = ["workers"]
+
+
+def value_hash(value):
+    """
+    sha256 of a parameter value, dataframes are hashed by their contents
+    """
+    if isinstance(value, pd.DataFrame):
+        rows = pd.util.hash_pandas_object(value, index=False).to_numpy()
+        return hashlib.sha256(
+            rows.tobytes() + repr(list(value.columns)).encode()
+        ).hexdigest()
+    if isinstance(value, dict):
+        value = {k: value_hash(v) for k, v in sorted(value.items())}
+    return hashlib.sha256(json.dumps(value, default=repr).encode()).hexdigest()
+
+
+def source_hash(path):
+    """
+    sha256 of a file, or of every file in a folder. Missing files hash as "missing",
+    the node reading them will say what is wrong.
+    """
+    if os.path.isdir(path):
+        names = sorted(os.listdir(path))
+        return value_hash(
+            {name: source_hash(os.path.join(path, name)) for name in names}
+        )
+    if os.path.exists(path):
+        return cache.file_hash(path)
+    return "missing"
+
+
+class pipeline:
+    """
+    A graph of stages, memoized on their inputs and parameters
+    """
+
+    def __init__(self, cache_dir=PIPELINE_DIR, workers=None):
+        """
+        cache_dir:
+            Where node outputs are kept, None only keeps them in memory
+        workers:
+            Number of nodes that can run at the same time, None runs every ready node
+        """
+        self.cache_dir = cache_dir
+        self.workers = workers
+        self.nodes = {}
+        self.memo = {}
+
+    def add(self, name, func, inputs=(), params=None, sources=()):
+        """
+        Declares a node
+
+        input
+        -----
+        name: str
+        func: function
+            Called as func(*outputs of inputs, **params), returns a dataframe
+        inputs: list of str
+            Names of the nodes whose outputs func needs, in order
+        params: dict
+            Keyword arguments of func
+        sources: list of str, or a function of params that returns one
+            Files or folders func reads, their contents are part of the key
+        """
+        for dep in inputs:
+            if dep not in self.nodes:
+                raise ValueError(f"{name} needs {dep}, add {dep} first")
+        self.nodes[name] = {
+            "func": func,
+            "inputs": list(inputs),
+            "params": dict(params or {}),
+            "sources": sources,
+        }
+        return self
+
+    def set(self, name, **params):
+        """
+        Changes some parameters of a node, the next run recomputes it and everything downstream
+        """
+        self.nodes[name]["params"].update(params)
+        return self
+
+    def upstream(self, targets):
+        """
+        targets and every node they need, in the order they were added
+        """
+        needed = set()
+        todo = list(targets)
+        while todo:
+            name = todo.pop()
+            if name not in needed:
+                needed.add(name)
+                todo.extend(self.nodes[name]["inputs"])
+        return [name for name in self.nodes if name in needed]
+
+    def keys(self, names):
+        """
+        Key of every node in names, names has to be in dependency order
+        """
+        keys = {}
+        for name in names:
+            node = self.nodes[name]
+            sources = node["sources"]
+            if callable(sources):
+                sources = sources(node["params"])
+            key = {
+                "name": name,
+                "version": cache.PARSER_VERSION,
+                "params": value_hash(
+                    {k: v for k, v in node["params"].items() if k not in UNHASHED}
+                ),
+                "sources": [source_hash(path) for path in sources],
+                "inputs": [keys[dep] for dep in node["inputs"]],
+            }
+            keys[name] = value_hash(key)
+        return keys
+
+    def path(self, name, key):
+        return os.path.join(self.cache_dir, f"{name}-{key[:32]}.parquet")
+
+    def recall(self, name, key):
+        """
+        The memoized output of a node, None if it has to be computed
+        """
+        if key in self.memo:
+            return self.memo[key]
+        if self.cache_dir is not None and os.path.exists(self.path(name, key)):
+            target = self.path(name, key)
+            # mark as recently used
+            os.utime(target)
+            self.memo[key] = pd.read_parquet(target)
+            return self.memo[key]
+        return None
+
+    def keep(self, name, key, df):
+        """
+        Memoizes a node's output, in memory and in cache_dir
+        """
+        self.memo[key] = df
+        if self.cache_dir is None or not isinstance(df, pd.DataFrame):
+            return df
+        os.makedirs(self.cache_dir, exist_ok=True)
+        target = self.path(name, key)
+        tmp = f"{target}.{os.getpid()}.tmp"
+        try:
+            df.to_parquet(tmp)
+            os.replace(tmp, target)
+        except Exception as e:
+            print(f"WARNING: could not keep {name} in {self.cache_dir}: {e}")
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            return df
+        # read back so memoized and fresh runs return the exact same dtypes
+        self.memo[key] = pd.read_parquet(target)
+        return self.memo[key]
+
+    def run(self, targets=None):
+        """
+        Computes targets (default every node) and the nodes they need
+
+        output
+        ------
+        dict of {node name: output} for targets and every node computed on the way
+        """
+        names = self.upstream(targets or list(self.nodes))
+        keys = self.keys(names)
+        results = {}
+        # nodes that have to be computed, a memoized node doesn't need its inputs
+        needed = set()
+        todo = list(targets or self.nodes)
+        while todo:
+            name = todo.pop()
+            if name in results or name in needed:
+                continue
+            df = self.recall(name, keys[name])
+            if df is None:
+                needed.add(name)
+                todo.extend(self.nodes[name]["inputs"])
+                continue
+            results[name] = df
+            instrument.emit(
+                "pipeline", rows_out=instrument.n_rows(df), message=f"{name} memoized"
+            )
+        waiting = [name for name in names if name in needed]
+
+        with cf.ThreadPoolExecutor(self.workers) as pool:
+            running = {}
+            while waiting or running:
+                for name in list(waiting):
+                    node = self.nodes[name]
+                    if all(dep in results for dep in node["inputs"]):
+                        args = [results[dep] for dep in node["inputs"]]
+                        running[pool.submit(node["func"], *args, **node["params"])] = (
+                            name
+                        )
+                        waiting.remove(name)
+                done, _ = cf.wait(running, return_when=cf.FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    try:
+                        df = future.result()
+                    except Exception:
+                        for other in running:
+                            other.cancel()
+                        raise
+                    results[name] = self.keep(name, keys[name], df)
+                    instrument.emit(
+                        "pipeline",
+                        rows_out=instrument.n_rows(df),
+                        message=f"{name} computed",
+                    )
+        return results
+
+
+def run_bike(
+    use_this=None,
+    workers=None,
+    trim_config=None,
+    compat=False,
+    resample=False,
+    timeline_config=None,
+    study=None,
+):
+    return r.dfBike(
+        use_this,
+        trim_config=trim_config,
+        workers=workers,
+        compat=compat,
+        resample=resample,
+        timeline_config=timeline_config,
+        study=study,
+    ).result
+
+
+def bike_sources(params):
+    use_this = params.get("use_this")
+    if use_this is None:
+        study = st.get_study(params.get("study"))
+        return [study["combined_file"] or study["raw_folder"]]
+    # a dataframe is hashed with the other params
+    if isinstance(use_this, (str, os.PathLike)):
+        return [use_this]
+    return []
+
+
+def sheet_study(study, sheet, path=None):
+    """
+    The study, with path in place of the path of one of its spreadsheets
+    """
+    study = st.get_study(study)
+    if path is None:
+        return study
+    return {**study, sheet: {**st.sheet_layout(study, sheet), "path": path}}
+
+
+def sheet_sources(sheet):
+    """
+    sources of a node that reads one of the study's spreadsheets
+    """
+
+    def sources(params):
+        study = sheet_study(params.get("study"), sheet, params.get("path"))
+        return [st.sheet_layout(study, sheet)["path"]]
+
+    return sources
+
+
+def run_updrs(study=None, path=None):
+    demos = r.dfDemos.__new__(r.dfDemos)
+    demos.study = sheet_study(study, "updrs", path)
+    return demos.load_updrs()
+
+
+def run_demographics(study=None, path=None):
+    demos = r.dfDemos.__new__(r.dfDemos)
+    demos.study = sheet_study(study, "demographics", path)
+    return demos.load_demos(None)
+
+
+def run_demos(bike_df, updrs, demographics, thresholds=None, study=None):
+    return r.dfDemos(
+        bike_df,
+        thresholds=thresholds,
+        updrs=updrs,
+        demographics=demographics,
+        study=study,
+    ).result
+
+
+def run_entropy(bike_df, updrs, workers=None, study=None):
+    return r.dfEntropy(
+        bike_df=bike_df, updrs=updrs, workers=workers, study=study
+    ).result
+
+
+def run_features(bike_df, windows=None, signals=None):
+    return ft.feature_table(bike_df, windows=windows, signals=signals)
+
+
+def default_pipeline(
+    cache_dir=PIPELINE_DIR, workers=None, study=None, timeline_config=None, **params
+):
+    """
+    The bike, updrs, demographics, demos, entropy and features nodes
+
+    input
+    -----
+    study: str or dict
+        The study every node reads (see studies.py), part of every key
+    timeline_config:
+        Same as dfBike, part of the bike key
+    params:
+        {node name: dict of parameters}, ex: bike={"use_this": "raw_bike_files", "workers": 4}
+        or demos={"thresholds": {"power": [0, 30]}} or features={"windows": [10, 60]}.
+        updrs and demographics take a path that replaces the study's spreadsheet.
+    """
+    # the whole study dict is hashed, so editing a registered study changes the keys
+    study = st.get_study(study)
+
+    def node_params(name, **defaults):
+        return {**defaults, **params.get(name, {})}
+
+    p = pipeline(cache_dir, workers)
+    p.add(
+        "bike",
+        run_bike,
+        params=node_params("bike", study=study, timeline_config=timeline_config),
+        sources=bike_sources,
+    )
+    p.add(
+        "updrs",
+        run_updrs,
+        params=node_params("updrs", study=study),
+        sources=sheet_sources("updrs"),
+    )
+    p.add(
+        "demographics",
+        run_demographics,
+        params=node_params("demographics", study=study),
+        sources=sheet_sources("demographics"),
+    )
+    p.add(
+        "demos",
+        run_demos,
+        inputs=["bike", "updrs", "demographics"],
+        params=node_params("demos", study=study),
+    )
+    p.add(
+        "entropy",
+        run_entropy,
+        inputs=["bike", "updrs"],
+        params=node_params("entropy", study=study),
+    )
+    p.add("features", run_features, inputs=["bike"], params=params.get("features"))
+    return p
@@ -17,6 +17,9 @@ REASON:
 PURPOSE:
     * Will not include graphing functions
     * Combine the raw bike files into one dataset (stored in `nih.db` as `bike_data`)
+        * In memory, `bike_data` uses the compact BIKE_DTYPES (categories, small ints, float32),
+          dfBike(compat = True) keeps the old strings, int64 and float64. The signals are only
+          cast to float32 after trimming, so both modes cut in exactly the same places.
     * Label participants as belonging to `dynamic` or `static` groups
     * Load and extract UPDRS information
     * Create effort dataset
@@ -27,9 +30,88 @@ PURPOSE:
 """
 import pandas as pd
 import numpy as np
-import datetime as dt
-import dynbike_functions.helpers as h
+import hashlib
 import dynbike_functions.checkers as c
+import zero_runs as zr
+import entropy as ent
+import effort as ef
+import ingest
+import timeline as tl
+import studies as st
+import cache
+import instrument
+from storage import dbInfo
+
+BIKE_COLS = [
+    "datetime",
+    "date",
+    "time",
+    "elapsed_sec",
+    "id_sess",
+    "my_id",
+    "day",
+    "unknown",
+    "hr",
+    "power",
+    "cadence",
+]
+
+# cadences kept by dfBike.remove_extreme_cad, in rpm
+CAD_LIMITS = (0, 150)
+
+# compact dtypes of bike_data, dfBike(compat = True) keeps strings, int64 and float64 instead
+BIKE_DTYPES = {
+    "date": "category",
+    "time": "category",
+    "elapsed_sec": "int32",
+    "id_sess": "category",
+    "my_id": "category",
+    "day": "category",
+    "unknown": "int8",
+    "hr": "float32",
+    "power": "float32",
+    "cadence": "float32",
+    "cadence_roll_diff": "float32",
+    "cadence_rounded": "int32",
+}
+# kept as float64 until the sessions are trimmed, so the rolling diff rounds like compat mode
+SIGNAL_COLS = ["hr", "power", "cadence"]
+# format of the Date column in the raw bike exports
+DATE_FORMAT = "%m/%d/%Y"
+
+# settings used by dfBike.find_longest_zeroes to trim trailing zeroes,
+# and the cadences kept by dfBike.remove_extreme_cad
+TRIM_CONFIG = {
+    "col": "cadence",
+    "num": 0,
+    "roll": 60,
+    "min_start": 2000,
+    "min_length": 150,
+    "cad_limits": CAD_LIMITS,
+}
+
+
+def from_codes(codes, values):
+    """
+    Categorical column from factorize codes and one value per code, -1 codes are missing.
+    Codes that end up with the same value share a category.
+    """
+    value_codes, categories = pd.factorize(pd.Series(values))
+    value_codes = np.append(value_codes, -1)
+    return pd.Categorical.from_codes(value_codes[codes], categories)
+
+
+def compact_types(dataframe, skip=()):
+    """
+    Casts the bike_data columns to BIKE_DTYPES, other columns (and skip) are left alone
+    """
+    return dataframe.astype(
+        {
+            col: kind
+            for col, kind in BIKE_DTYPES.items()
+            if col in dataframe.columns and col not in skip
+        }
+    )
 
 
 class dfBike:
@@ -37,76 +119,296 @@ class dfBike:
     Processes files to create the df_bike dataframe
     """
 
-    def __init__(self, use_this=None, save_table=False):
+    def __init__(
+        self,
+        use_this=None,
+        save_table=False,
+        trim_config=None,
+        workers=None,
+        incremental=False,
+        compat=False,
+        resample=False,
+        timeline_config=None,
+        study=None,
+    ):
         """
         Coordinates the self.functions
 
         use_this:
-            If None, will load file from raw_bike_files folder
+            If None, will load the study's combined file, or its raw_bike_files folder
             If a dataframe, will use that dataframe instead
+            If a folder path, will read every raw bike export in it in parallel
+        trim_config:
+            Dict that overrides any of the TRIM_CONFIG settings used by find_longest_zeroes
+        workers:
+            Number of processes used to read a folder of raw bike exports, None uses every core
+        incremental:
+            If True, only processes the id_sess that are new or changed since the last save,
+            and save_table upserts just those sessions. self.result then only holds those sessions.
+        compat:
+            If True, keeps the old dtypes (strings, int64 and float64) instead of BIKE_DTYPES
+        resample:
+            If True, puts every session on a 1 Hz grid of its real timestamps before trimming,
+            so elapsed_sec is real seconds. Otherwise rows are counted as seconds, and the
+            gaps in the timestamps are only reported (self.gaps, self.timeline).
+        timeline_config:
+            Dict that overrides any of the timeline.TIMELINE_CONFIG settings
+        study:
+            Name or dict of the study the files come from (see studies.py), defaults to NIH R21
         """
+        self.trim_config = {**TRIM_CONFIG, **(trim_config or {})}
+        self.compat = compat
+        self.resample = resample
+        self.timeline_config = {**tl.TIMELINE_CONFIG, **(timeline_config or {})}
+        self.study = st.get_study(study)
+        if use_this is None and self.study["combined_file"] is None:
+            use_this = self.study["raw_folder"]
         if use_this is None:
-            df = pd.read_excel("raw_bike_files/[combined_files].xlsx")
+            name = "bike_compat" if compat else "bike"
+            df = cache.load_cached(
+                self.study["combined_file"],
+                f"{name}-{st.study_key(self.study)}",
+                lambda path: self.load_and_organize(
+                    pd.read_excel(path), compat, self.study
+                ),
+            )
+        elif isinstance(use_this, str):
+            df = ingest.load_bike_files(
+                use_this, workers=workers, compat=compat, study=self.study
+            )
         else:
-            df = use_this
-        df = self.load_and_organize(df)
-        df_bike = pd.DataFrame(
-            columns=[
-                "datetime",
-                "date",
-                "time",
-                "elapsed_sec",
-                "id_sess",
-                "my_id",
-                "day",
-                "unknown",
-                "hr",
-                "power",
-                "cadence",
-            ]
-        )
-
-        # find the number of seconds per id_sess, trim the cadence
-        for id_sess in df["id_sess"].unique():
-            temp_df = df[df["id_sess"] == id_sess]
-            # label each row as one second
-            temp_df = temp_df.reset_index(drop=True).reset_index().rename({"index":"elapsed_sec"},axis=1)
-            # trim the dataset when rolling 60 second diff is < 1
-            temp_df = self.find_longest_zeroes(temp_df, col='cadence',num=0, roll=60)
-            # remove extreme cadences
-            temp_df = self.remove_extreme_cad(temp_df, id_sess)
-            df_bike = df_bike.append(temp_df)
+            df = self.load_and_organize(use_this, compat, self.study)
 
-        if save_table:
+        # label each row as one second
+        df, bounds = self.sort_sessions(df)
+        if incremental:
+            db = dbInfo()
+            fingerprints = self.session_fingerprints(df, bounds)
+            saved = db.load_manifest("bike_data")
+            changed = [k for k, v in fingerprints.items() if saved.get(k) != v]
+            print(f"{len(changed)} of {len(fingerprints)} sessions are new or changed")
+            df, bounds = self.sort_sessions(df[df["id_sess"].isin(changed)])
+        df_bike = self.clean_sessions(df, bounds)
+
+        if save_table and incremental:
+            db.upsert_sessions(df_bike, "bike_data", {k: fingerprints[k] for k in changed})
+        elif save_table:
             # save to db
             db = dbInfo()
             db.save_table(df_bike, "bike_data")
         # this is the final result
         self.result = df_bike.reset_index(drop=True)
 
-    def load_and_organize(self, df):
+    @classmethod
+    def cleaner(
+        cls,
+        trim_config=None,
+        compat=False,
+        resample=False,
+        timeline_config=None,
+        study=None,
+    ):
+        """
+        A dfBike that hasn't loaded anything, only used to call clean_sessions (see stream.py)
+        """
+        self = cls.__new__(cls)
+        self.trim_config = {**TRIM_CONFIG, **(trim_config or {})}
+        self.compat = compat
+        self.resample = resample
+        self.timeline_config = {**tl.TIMELINE_CONFIG, **(timeline_config or {})}
+        self.study = st.get_study(study)
+        return self
+
+    def clean_sessions(self, dataframe, bounds=None):
+        """
+        Labels each row as one second, trims the trailing zeroes and removes the extreme cadences
+
+        input
+        -----
+        dataframe: pd.DataFrame
+            Output of load_and_organize, for any number of sessions
+        bounds: np.array
+            Session offsets, if dataframe was already sorted by sort_sessions
+        """
+        if bounds is None:
+            dataframe, bounds = self.sort_sessions(dataframe)
+        if "datetime" in dataframe.columns:
+            dataframe, bounds = self.check_timeline(dataframe, bounds)
+        # shallow, so the caller's dataframe doesn't get the new column
+        df = dataframe.copy(deep=False)
+        df.insert(0, "elapsed_sec", zr.session_positions(bounds))
+        # trim every session when rolling 60 second diff is < 1
+        df = self.find_longest_zeroes(df, self.trim_config)
+
+        # remove extreme cadences
+        sessions = []
+        for id_sess, temp_df in self.split_sessions(df):
+            temp_df = self.remove_extreme_cad(
+                temp_df, id_sess, self.trim_config["cad_limits"]
+            )
+            sessions.append(temp_df)
+        df_bike = self.combine_sessions(sessions)
+        if not self.compat:
+            df_bike = compact_types(df_bike)
+        return df_bike
+
+    def check_timeline(self, dataframe, bounds):
+        """
+        Finds the gaps, repeats and backwards steps in every session's timestamps and, if
+        self.resample, puts the sessions on a 1 Hz grid (see timeline.py)
+
+        Every gap is saved to self.gaps (id_sess, row, start_sec, stop_sec, jump_sec, missing, kind)
+        and the per session counts to self.timeline
+        """
+        seconds = tl.elapsed_seconds(dataframe["datetime"], bounds)
+        gaps = tl.find_gaps(seconds, bounds, self.timeline_config)
+        sess_ids = dataframe["id_sess"].to_numpy()[bounds[:-1]]
+        self.timeline = tl.gap_summary(gaps, sess_ids)
+        gaps.insert(0, "id_sess", sess_ids[gaps["session"].to_numpy()])
+        self.gaps = gaps.drop("session", axis=1)
+
+        off = self.timeline[
+            self.timeline[["n_gaps", "n_repeats", "n_backwards"]].sum(axis=1) > 0
+        ]
+        for row in off.itertuples():
+            instrument.warn(
+                "check_timeline",
+                f"{row.id_sess} timestamps have {row.n_gaps} gaps ({row.missing_sec} s missing), "
+                f"{row.n_repeats} repeats and {row.n_backwards} backwards steps",
+                row.id_sess,
+            )
+        if self.resample:
+            dataframe, bounds = tl.resample(
+                dataframe, bounds, seconds, self.timeline_config
+            )
+        return dataframe, bounds
+
+    def session_fingerprints(self, dataframe, bounds):
+        """
+        Hashes the organized source rows of every session, together with the trim, compat
+        and study settings. A session whose fingerprint changed has to be processed again.
+
+        input
+        -----
+        dataframe: pd.DataFrame
+            Sorted by sort_sessions
+        bounds: np.array
+            Session offsets from sort_sessions
+        """
+        row_hashes = pd.util.hash_pandas_object(dataframe, index=False).to_numpy()
+        settings = repr(
+            (
+                sorted(self.trim_config.items()),
+                self.resample,
+                sorted(self.timeline_config.items()),
+                self.compat,
+                st.study_key(self.study),
+            )
+        ).encode()
+        fingerprints = {}
+        for i in range(len(bounds) - 1):
+            sha = hashlib.sha256(settings)
+            sha.update(row_hashes[bounds[i] : bounds[i + 1]].tobytes())
+            fingerprints[dataframe["id_sess"].iat[bounds[i]]] = sha.hexdigest()
+        return fingerprints
+
+    def sort_sessions(self, dataframe, col="id_sess"):
+        """
+        Sorts the dataframe once so each session is one contiguous block, in order of
+        first appearance. Rows keep their original order within a session. Rows without
+        an id_sess are dropped, same as filtering on each unique value.
+
+        input
+        -----
+        dataframe: pd.DataFrame
+        col: str
+            Column that identifies a session
+
+        output
+        ------
+        The sorted dataframe (fresh 0..n index) and the session offsets, so session `i`
+        is rows `bounds[i]:bounds[i + 1]`
+        """
+        codes, uniques = pd.factorize(dataframe[col])
+        keep = np.flatnonzero(codes >= 0)
+        order = keep[np.argsort(codes[keep], kind="stable")]
+        sorted_df = dataframe.iloc[order].reset_index(drop=True)
+        bounds = zr.session_bounds(np.bincount(codes[keep], minlength=len(uniques)))
+        return sorted_df, bounds
+
+    def split_sessions(self, dataframe, col="id_sess"):
+        """
+        Yields (id_sess, slice) pairs, one contiguous slice per session. See sort_sessions.
+        """
+        sorted_df, bounds = self.sort_sessions(dataframe, col)
+        for i in range(len(bounds) - 1):
+            temp_df = sorted_df.iloc[bounds[i] : bounds[i + 1]]
+            yield temp_df[col].iloc[0], temp_df
+
+    def combine_sessions(self, sessions):
+        """
+        Concatenates the processed sessions once, with the bike_data columns first
+        """
+        if len(sessions) == 0:
+            return pd.DataFrame(columns=BIKE_COLS)
+        df_bike = pd.concat(sessions)
+        extra = [col for col in df_bike.columns if col not in BIKE_COLS]
+        return df_bike[BIKE_COLS + extra]
+
+    @staticmethod
+    @instrument.timed("load_and_organize")
+    def load_and_organize(df, compat=False, study=None):
         """
         Reads in combined_files excel sheet, processes it
+
+        input
+        -----
+        df: pd.DataFrame
+            Raw bike data (Date, Time, Millitm, HR, Cadence, Power, ID)
+        compat: bool
+            If True, returns the old dtypes (strings, int64 and float64) instead of BIKE_DTYPES
+        study: str, dict or None
+            Study whose ID grammar is used to split the IDs, see studies.py
         """
         # load
         df = df.drop("Millitm", axis=1)
         cols = [col.lower() for col in df.columns]
         df.columns = cols
-        df["date"] = pd.to_datetime(df["date"])
+
+        # every row of a session repeats the same id, date and (mostly) time,
+        # so only the unique values are parsed
+        id_codes, ids = pd.factorize(df["id"])
+        date_codes, dates = pd.factorize(df["date"])
+        time_codes, times = pd.factorize(df["time"])
+        try:
+            dates = pd.to_datetime(dates, format=DATE_FORMAT)
+        except ValueError:
+            # not the bike export's format (ex: excel already read them as dates)
+            dates = pd.to_datetime(dates)
 
         # organize
-        df["my_id"] = df["id"].str.extract("(SMB_\d\d\d)")
-        df["my_id"] = df["my_id"].str.replace("_", "")
-        df["day"] = df["id"].str.extract("(day\d)")
-        df["unknown"] = df["id"].str.extract("day\d_(\d\d)")
-        df["unknown"] = df["unknown"].astype(int)
-        df["id_sess"] = df["my_id"] + "_" + df["day"]
+        parts = st.parse_ids(ids, study)
+        my_id, day, unknown = parts["my_id"], parts["day"], parts["unknown"]
+        df["date"] = from_codes(date_codes, pd.Series(dates).astype(str))
+        if not compat:
+            df["time"] = from_codes(time_codes, times)
+        df["my_id"] = from_codes(id_codes, my_id)
+        df["day"] = from_codes(id_codes, day)
+        df["unknown"] = pd.Series(unknown.to_numpy()[id_codes], index=df.index)
+        df["unknown"] = df["unknown"].where(id_codes >= 0).astype(int)
+        df["id_sess"] = from_codes(id_codes, my_id + "_" + day)
         df = df.drop("id", axis=1)
 
-        df["date"] = df["date"].astype(str)
-        df["datetime"] = df["date"] + " " + df["time"]
-        df["datetime"] = pd.to_datetime(df["datetime"])
-        return df
+        df["datetime"] = pd.api.extensions.take(
+            dates.to_numpy(), date_codes, allow_fill=True
+        ) + pd.api.extensions.take(
+            pd.to_timedelta(times).to_numpy(), time_codes, allow_fill=True
+        )
+        if compat:
+            for col in ["date", "my_id", "day", "id_sess"]:
+                df[col] = df[col].astype(df[col].cat.categories.dtype)
+            return df
+        return compact_types(df, skip=SIGNAL_COLS)
 
     def find_elapsed_sec(self, dataframe):
         """
@@ -119,62 +421,80 @@ class dfBike:
             Dataframe for just one participant and one session
         """
         init_time = dataframe.iloc[0, -1]
-        dataframe["elapsed_sec"] = dataframe["datetime"].apply(
-            lambda x: dt.timedelta.total_seconds(x - init_time)
-        )
+        dataframe["elapsed_sec"] = (dataframe["datetime"] - init_time).dt.total_seconds()
         return dataframe
     
-    def find_longest_zeroes(self, dataframe, col='cadence', num=0, roll=60):
+    @instrument.timed("find_longest_zeroes")
+    def find_longest_zeroes(self, dataframe, config=None):
         '''
         A different method for finding trailing zeroes in dataset. 
         Does not find zeroes at beginning of dataset, only at the end.
+        Works on every session in the dataframe at once.
+
+        Every run of zeroes is saved to self.zero_runs (id_sess, start, length, longest, cut)
 
         input
         -----
         dataframe: pd.DataFrame
-        col: str
-            Column that has data to be cut
-        num: int or float
-            After taking the rolling difference over 60 seconds, anything 
-            less than or equal to this number is eligible to be thrown out
+            Must have an elapsed_sec column counting rows from the start of each session
+        config: dict
+            Overrides for TRIM_CONFIG
+                col: column that has data to be cut
+                num: after taking the rolling difference over `roll` rows, anything
+                    equal to this number is eligible to be thrown out
+                roll: number of rows in the rolling difference
+                min_start: the longest run has to start after this row to be cut
+                min_length: and has to be longer than this many rows
         '''
-        cut_us = {}
-        cut_df = pd.DataFrame()
-        for id_sess in dataframe['id_sess'].unique():
-            temp_df = dataframe[dataframe['id_sess'] == id_sess].reset_index(drop=True)
-            # here we take the rolling diff, because sometimes there are long repeats of the same cadence 
-            # that needs to be cut off
-            temp_df[f"{col}_roll_diff"] = temp_df[col].diff(periods=roll)
-            # the first couple are always nans, just assume those are zeroes. This is fine ... right ??
-            temp_df[f"{col}_roll_diff"] = temp_df[f"{col}_roll_diff"].fillna(0)
-            # round them to integers, because sometimes 0.0000432 is really just zero
-            temp_df[f"{col}_rounded"] = temp_df[f"{col}_roll_diff"].apply(lambda x: int(round(x)))
-
-            ### This is from stackoverflow: https://stackoverflow.com/a/67438717/9866659
-            mask = temp_df[f"{col}_rounded"] == num # if the difference is num (0), thats bad.
-            counts = temp_df[mask].groupby((~mask).cumsum()).transform('count')[col]
-            idx = counts.idxmax() # returns first instance of longest sequence of <1s
-            ### End stackoverflow
-
-            # 2000 corresponds to 33 minutes
-            # 
-            # 250 corresponds to finding at least 250 sequential Trues
-
-            if (idx > 2000) & (counts.loc[idx] > 150):
-                cut_us[id_sess] = idx
-                temp_df = temp_df.iloc[:idx,:]
-            cut_df = cut_df.append(temp_df)
-        return cut_df
-    
-    def remove_extreme_cad(self, dataframe, id_sess):
+        config = {**TRIM_CONFIG, **(config or {})}
+        col = config["col"]
+        df, bounds = self.sort_sessions(dataframe)
+        values = df[col].to_numpy(dtype=float)
+
+        # here we take the rolling diff, because sometimes there are long repeats of the same cadence 
+        # that needs to be cut off. The first couple are always nans, just assume those are zeroes.
+        df[f"{col}_roll_diff"] = zr.rolling_diff(values, bounds, roll=config["roll"])
+        # round them to integers, because sometimes 0.0000432 is really just zero
+        df[f"{col}_rounded"] = np.rint(df[f"{col}_roll_diff"].to_numpy()).astype(np.int64)
+
+        # if the difference is num (0), thats bad. Only non-missing values count toward the run length.
+        mask = df[f"{col}_rounded"].to_numpy() == config["num"]
+        runs = zr.find_runs(mask, bounds, weights=~np.isnan(values))
+        longest = zr.longest_runs(runs, len(bounds) - 1)
+
+        # 2000 corresponds to 33 minutes
+        cut = (longest["start"] > config["min_start"]) & (
+            longest["length"] > config["min_length"]
+        )
+        stop = np.where(cut, longest["start"], np.diff(bounds))
+
+        sess_ids = df["id_sess"].to_numpy()[bounds[:-1]]
+        runs["longest"] = (
+            runs["start"].to_numpy() == longest["start"].to_numpy()[runs["session"]]
+        )
+        runs["cut"] = runs["longest"] & cut.to_numpy()[runs["session"]]
+        runs.insert(0, "id_sess", sess_ids[runs["session"]])
+        self.zero_runs = runs.drop("session", axis=1)
+
+        keep = zr.session_positions(bounds) < np.repeat(stop, np.diff(bounds))
+        instrument.emit_sessions("find_longest_zeroes", sess_ids, np.diff(bounds), stop)
+        return df[keep]
+
+    @instrument.timed("remove_extreme_cad")
+    def remove_extreme_cad(self, dataframe, id_sess, limits=CAD_LIMITS):
         '''
-        Removes negative cadences and cadences > 150 rpm
+        Removes cadences outside limits, by default negative cadences and cadences > 150 rpm
         '''
-        new_df = dataframe[(dataframe['cadence'] <= 150) & (dataframe['cadence'] >= 0)]
+        low, high = limits
+        new_df = dataframe[(dataframe['cadence'] <= high) & (dataframe['cadence'] >= low)]
         if c.mylist(new_df['elapsed_sec']):
             return new_df
         else:
-            print(f"WARNING: {id_sess} `elapsed_sec` is no longer sequential")
+            instrument.warn(
+                "remove_extreme_cad",
+                f"{id_sess} `elapsed_sec` is no longer sequential",
+                id_sess,
+            )
             return new_df
 
 
@@ -183,14 +503,32 @@ class dfDemos:
     Extracts UPDRS, effort, and demographics data. Organizes, processes, and then merges them together.
     """
 
-    def __init__(self, bike_df, save_table=False):
+    def __init__(
+        self,
+        bike_df,
+        save_table=False,
+        thresholds=None,
+        updrs=None,
+        demographics=None,
+        study=None,
+    ):
         """
         Coordinates the updrs, effort, demos functions. Then merges the three datasets
+
+        thresholds:
+            {signal: list of thresholds} for the time in zone effort columns, see effort.py
+        updrs, demographics:
+            load_updrs() and load_demos() outputs, if they were already loaded (see pipeline.py)
+        study:
+            Name or dict of the study, sets the spreadsheets and their layout (see studies.py)
         """
-        updrs = self.load_updrs()
-        df_pow = self.create_effort(bike_df)
-        mean_pow = df_pow.groupby("id").mean().reset_index()
-        demographics = self.load_demos(df_pow)
+        self.study = st.get_study(study)
+        if updrs is None:
+            updrs = self.load_updrs()
+        df_pow = self.create_effort(bike_df, thresholds=thresholds)
+        mean_pow = self.mean_effort
+        if demographics is None:
+            demographics = self.load_demos(df_pow)
 
         demos = self.merge_cats(updrs, mean_pow, demographics)
 
@@ -204,14 +542,19 @@ class dfDemos:
         """
         Loads and processes UPDRS data from Smartbike_NIH_variabiliity_UPDRS excel sheet
         """
+        layout = st.sheet_layout(self.study, "updrs")
+        return cache.load_cached(
+            layout["path"], "updrs", lambda path: self.parse_updrs(path, layout)
+        )
 
-        updrs = pd.read_excel("data/Smartbike_NIH_variabiliity_UPDRS.xlsx")
-        updrs = updrs.iloc[:, 0:4]
-        updrs.columns = ["id", "group", "updrs_pre", "updrs_post"]
+    def parse_updrs(self, path, layout=None):
+        """
+        Reads the UPDRS columns of the Smartbike_NIH_variabiliity_UPDRS excel sheet,
+        or of the study's UPDRS sheet (layout, see studies.py)
+        """
         # drop means and other irrelevant rows
-        updrs = updrs.drop([0, 1, 24, 25, 26, 27, 53, 54, 55, 56]).reset_index(
-            drop=True
-        )
+        updrs = st.read_sheet({**(layout or st.NIH_R21["updrs"]), "path": path})
+        updrs.columns = ["id", "group", "updrs_pre", "updrs_post"]
 
         updrs["id"] = updrs["id"].str.replace("_", "")
         # calculate change in UPDRS
@@ -219,15 +562,15 @@ class dfDemos:
 
         return updrs
 
-    def create_effort(self, dataframe, save_table=False):
+    @instrument.timed("create_effort")
+    def create_effort(self, dataframe, save_table=False, thresholds=None):
         """
         Calculates and creates the effort column for each id_sess. Dataframe is the raw bike dataframe with an id_sess column
+
+        Also adds the percent of time above each of the thresholds (default effort.EFFORT_THRESHOLDS),
+        and saves the mean of each participant's sessions to self.mean_effort
         """
-        df_pow = h.perc_time_in_col(dataframe, "power")
-        df_pow["day"] = df_pow["id_sess"].str.split("_", expand=True)[1]
-        df_pow["id"] = df_pow["id_sess"].str.split("_day", expand=True)[0]
-        df_pow["id"] = df_pow["id"].str.replace("_", "")
-        df_pow = df_pow.reset_index(drop=True)
+        df_pow, self.mean_effort = ef.effort_tables(dataframe, thresholds)
 
         if save_table:
             db = dbInfo()
@@ -239,7 +582,18 @@ class dfDemos:
         """
         Merges updrs and effort datasets with the demographics dataset
         """
-        demos = pd.read_excel("data/NIH_dynamic_demographics.xlsx", sheet_name=0)
+        layout = st.sheet_layout(self.study, "demographics")
+        return cache.load_cached(
+            layout["path"], "demographics", lambda path: self.parse_demos(path, layout)
+        )
+
+    def parse_demos(self, path, layout=None):
+        """
+        Reads the NIH_dynamic_demographics excel sheet, or the study's demographics sheet
+        """
+        demos = st.read_sheet(
+            {**(layout or st.NIH_R21["demographics"]), "path": path}, sheet_name=0
+        )
         demos.columns = [
             "id",
             "group",
@@ -258,6 +612,7 @@ class dfDemos:
 
         return demos
 
+    @instrument.timed("merge_cats")
     def merge_cats(self, updrs, mean_pow, demos):
         """
         Merges the datasets, then formats the resulting dataframe.
@@ -278,12 +633,29 @@ class dfEntropy:
     Extracts entropy data from Smartbike_NIH_variabiliity_UPDRS and formats, restructures the dataset from wide to long form.
     """
 
-    def __init__(self, save_table=False):
+    def __init__(
+        self, save_table=False, bike_df=None, updrs=None, workers=None, study=None
+    ):
         """
         Coordinates the self.functions
+
+        bike_df:
+            If None, reads the precomputed entropy from Smartbike_NIH_variabiliity_UPDRS
+            If a dataframe (dfBike.result or main_sessions), computes entropy from the signals
+        updrs:
+            dfDemos.load_updrs() output. Only used with bike_df, adds the group and UPDRS
+            columns and filters to the dynamic group, same as the spreadsheet version.
+        workers:
+            Number of processes used to compute entropy, None uses every core
+        study:
+            Name or dict of the study, sets the spreadsheet layout and group coding (see studies.py)
         """
-        raw_entropy = self.load_and_organize()
-        entropy = self.restructure_entropy(raw_entropy)
+        self.study = st.get_study(study)
+        if bike_df is None:
+            raw_entropy = self.load_and_organize()
+            entropy = self.restructure_entropy(raw_entropy)
+        else:
+            entropy = self.compute_entropy(bike_df, updrs, workers)
 
         if save_table:
             db = dbInfo()
@@ -291,21 +663,47 @@ class dfEntropy:
 
         self.result = entropy
 
+    @instrument.timed("compute_entropy")
+    def compute_entropy(self, bike_df, updrs=None, workers=None):
+        """
+        Computes entropy from the bike signals and puts it in the same long form as restructure_entropy
+        """
+        df = ent.entropy_table(bike_df, workers=workers)
+        # my_id and day as load_and_organize parsed them with the study's ID grammar
+        ids = pd.Series(pd.factorize(bike_df["id_sess"])[1], dtype=str)
+        parts = st.session_parts(bike_df, ids).set_index(ids)
+        df.insert(0, "subject", df["id_sess"].astype(str).map(parts["id"]))
+        day = df["id_sess"].astype(str).map(parts["day"])
+        df["session"] = day.str.extract(r"(\d+)", expand=False).astype(int)
+        df["session"] = df["session"].astype("category")
+
+        if updrs is not None:
+            df = updrs.rename({"id": "subject"}, axis=1).merge(df, on="subject")
+            # code which group each participant belonged to
+            df["grp_coded"] = df["group"].map(self.study["group_codes"])
+            # filter to just the dynamic group
+            df = df[df["grp_coded"] == self.study["keep_group"]].reset_index(drop=True)
+        return df
+
     def load_and_organize(self):
-        # load the data
-        df = pd.read_excel(
-            "data/Smartbike_NIH_variabiliity_UPDRS.xlsx", sheet_name=0, header=2
+        layout = st.sheet_layout(self.study, "entropy")
+        df = cache.load_cached(
+            layout["path"], "entropy", lambda path: self.parse_entropy(path, layout)
+        )
+        if df is not None:
+            self.last_cols = list(df.columns[5:])
+        return df
+
+    def parse_entropy(self, path, layout=None):
+        """
+        Reads the entropy columns of the Smartbike_NIH_variabiliity_UPDRS excel sheet,
+        or of the study's entropy sheet (layout, see studies.py)
+        """
+        # load the data, drop Average rows, separators, empty and duplicate columns,
+        # and the last 15 columns (they are all averages of the sessions)
+        df = st.read_sheet(
+            {**(layout or st.NIH_R21["entropy"]), "path": path}, sheet_name=0
         )
-        df = df.drop(
-            [22, 23, 24, 25, 51, 52, 53, 54], axis=0
-        )  # drop Average rows and rows that separated dynamic from static data
-        df = df.drop(
-            ["Unnamed: 5", "Unnamed: 66", "Unnamed: 67"], axis=1
-        )  # drop empties and last two columns that are duplicates of first columns 1,4
-        df = df.iloc[
-            :, :50
-        ]  # drop last 15 columns, they are all averages of the sessions
-        df = df.reset_index(drop=True)
 
         self.last_cols = []
         for s in range(1, 4):
@@ -351,6 +749,7 @@ class dfEntropy:
         if my_stat == 5:
             self.last_cols.append(f"sess{s}_{my_var}_spen")
 
+    @instrument.timed("restructure_entropy")
     def restructure_entropy(self, dataframe):
         """
         Restructures entropy dataframe from wide to long
@@ -386,32 +785,11 @@ class dfEntropy:
         df2["session"] = df2["session"].astype("category")
 
         # code which group each participant belonged to
-        codes = {1: "static", 2: "dynamic"}  # Unnamed:1 col  # Unnamed:1 col
-        df2["grp_coded"] = df2["group"].map(codes)
+        study = getattr(self, "study", st.NIH_R21)
+        df2["grp_coded"] = df2["group"].map(study["group_codes"])
         # filter to just the dynamic group
-        df2 = df2[df2["grp_coded"] == "dynamic"]
+        df2 = df2[df2["grp_coded"] == study["keep_group"]]
         df2.reset_index(drop=True, inplace=True)
         df2['subject'] = df2['subject'].str.replace('_','')
         return df2
 
-
-class dbInfo:
-    """
-    Saves the newly processed dataframes into nih.db
-    """
-
-    def __init__(self):
-        """
-        Initializes db
-        """
-        import sqlalchemy as sq
-
-        engine = sq.create_engine("sqlite:///nih_scripts.db")
-        self.cnx = engine.connect()
-
-    def save_table(self, dataframe, table_name):
-        try:
-            dataframe.to_sql(table_name, con=self.cnx, index=False, if_exists="replace")
-            print("Saved!")
-        except:
-            print("Failed")
@@ -0,0 +1,227 @@
+"""
+Before/after plots of every segmented session, the Python version of segment_cutter.r's dana_main_sess.pdf.
+
+USE:
+    dfm = dfMainSessions(bike_df, num_cuts)
+    segment_report(bike_df, dfm.breakpoints, "main_sess.pdf", workers = 4)
+    segment_report(bike_df, dfm.breakpoints, "main_sess.html")  # one image per session
+
+PURPOSE:
+    * One page per id_sess: the whole session with the cuts as dashed red lines (before),
+      next to the rows dfMainSessions kept (after)
+    * The 1 Hz traces are downsampled with LTTB (see downsample.py) before drawing
+    * Panels are drawn in worker processes and saved as PNGs in `panel_dir`, named by a hash
+      of the session's signal, its cuts and the drawing settings. A rerun only draws the
+      sessions whose data or cuts changed, the rest of the report reuses their panels.
+    * The report is a multi-page PDF or an HTML index, depending on the file extension
+"""
+
+import os
+import html
+import hashlib
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_pdf import PdfPages
+import matplotlib.image as mpimg
+import cache
+import segmenter as seg
+from downsample import lttb
+
+PANEL_DIR = os.path.join(cache.CACHE_DIR, "panels")
+# bump this whenever render_panel draws something different
+PANEL_VERSION = 1
+# points per trace after downsampling
+N_POINTS = 1500
+PANEL_SIZE = (10, 4)
+DPI = 100
+
+
+def panel_key(id_sess, elapsed_sec, cadence, psi, keep, n_points=N_POINTS):
+    """
+    Hash of everything a panel shows, a panel with the same key doesn't need to be drawn again
+    """
+    sha = hashlib.sha256()
+    sha.update(f"{PANEL_VERSION}|{id_sess}|{n_points}|{PANEL_SIZE}|{DPI}".encode())
+    sha.update(np.ascontiguousarray(elapsed_sec, dtype=float).tobytes())
+    sha.update(np.ascontiguousarray(cadence, dtype=float).tobytes())
+    sha.update(np.asarray(psi, dtype=float).tobytes())
+    sha.update(np.asarray(keep, dtype=np.int64).tobytes())
+    return sha.hexdigest()[:32]
+
+
+def render_panel(task):
+    """
+    Draws one session's before/after panel to a PNG. Runs in a worker process.
+
+    input
+    -----
+    task: tuple
+        (id_sess, elapsed_sec array, cadence array, breakpoints, (start, stop) rows kept,
+        number of points per trace, path of the PNG)
+    """
+    id_sess, elapsed_sec, cadence, psi, keep, n_points, path = task
+    fig = Figure(figsize=PANEL_SIZE)
+    before, after = fig.subplots(1, 2, sharey=True)
+
+    before.plot(*lttb(elapsed_sec, cadence, n_points), ".", markersize=2, color="k")
+    for p in psi:
+        before.axvline(p, linestyle="--", color="red")
+    before.set_title(f"{id_sess} (before)")
+
+    start, stop = keep
+    after.plot(
+        *lttb(elapsed_sec[start:stop], cadence[start:stop], n_points),
+        ".",
+        markersize=2,
+        color="k",
+    )
+    after.set_title(f"{id_sess} (after)")
+    for ax in (before, after):
+        ax.set_xlabel("elapsed_sec")
+    before.set_ylabel("cadence")
+    # fixed margins, tight_layout takes longer than drawing the points
+    fig.subplots_adjust(left=0.07, right=0.98, bottom=0.13, top=0.9, wspace=0.06)
+
+    # written next to path first, so an interrupted run can't leave half a PNG
+    tmp = f"{path}.{os.getpid()}.tmp"
+    fig.savefig(tmp, dpi=DPI, format="png")
+    os.replace(tmp, path)
+    return path
+
+
+def panel_tasks(bike_df, breakpoints, n_points=N_POINTS, panel_dir=PANEL_DIR):
+    """
+    One render_panel task per session in breakpoints, with the rows dfMainSessions fitted
+
+    output
+    ------
+    list of (id_sess, task), in the order of breakpoints
+    """
+    dfm = seg.dfMainSessions.__new__(seg.dfMainSessions)
+    bike_df = bike_df[bike_df["id_sess"].isin(breakpoints["id_sess"].unique())]
+    sessions = dict(list(bike_df.groupby("id_sess", sort=False, observed=True)))
+    tasks = []
+    for id_sess, cuts in breakpoints.groupby("id_sess", sort=False, observed=True):
+        if id_sess not in sessions:
+            print(f"WARNING: {id_sess} has breakpoints but no bike data, it is skipped")
+            continue
+        # same rows as dfMainSessions.cut_sessions
+        temp_df = sessions[id_sess].sort_values("elapsed_sec", kind="stable")
+        temp_df = dfm.clean_session(temp_df, id_sess)
+        elapsed_sec = temp_df["elapsed_sec"].to_numpy(dtype=float)
+        cadence = temp_df["cadence"].to_numpy(dtype=float)
+        cuts = cuts.sort_values("breakpoint")
+        psi = cuts["psi"].to_numpy(dtype=float)
+        keep = (int(cuts["start_row"].iloc[0]), int(cuts["stop_row"].iloc[0]))
+
+        key = panel_key(id_sess, elapsed_sec, cadence, psi, keep, n_points)
+        path = os.path.join(panel_dir, f"{key}.png")
+        tasks.append(
+            (id_sess, (id_sess, elapsed_sec, cadence, psi, keep, n_points, path))
+        )
+    return tasks
+
+
+def render_panels(tasks, workers=None):
+    """
+    Draws the panels that aren't in the panel folder yet
+
+    output
+    ------
+    {id_sess: path of its PNG}
+    """
+    todo = []
+    for _, task in tasks:
+        if os.path.exists(task[-1]):
+            # mark as recently used, panels are evicted with the rest of the cache
+            os.utime(task[-1])
+        else:
+            todo.append(task)
+        os.makedirs(os.path.dirname(task[-1]) or ".", exist_ok=True)
+    if workers == 1 or len(todo) <= 1:
+        for task in todo:
+            render_panel(task)
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            list(pool.map(render_panel, todo))
+    print(f"{len(todo)} of {len(tasks)} panels drawn, the rest were reused")
+    return {id_sess: task[-1] for id_sess, task in tasks}
+
+
+def write_pdf(panels, path):
+    """
+    One page per panel, in the order of the breakpoints table
+    """
+    with PdfPages(path) as pdf:
+        for id_sess, png in panels.items():
+            image = mpimg.imread(png)
+            # the page is the size of the image, pixels are copied as they are
+            fig = Figure(figsize=(image.shape[1] / DPI, image.shape[0] / DPI))
+            fig.figimage(image)
+            pdf.savefig(fig, dpi=DPI)
+    return path
+
+
+def write_html(panels, path):
+    """
+    An index of every session, linking the panel images
+    """
+    folder = os.path.dirname(os.path.abspath(path))
+    links = []
+    sections = []
+    for i, (id_sess, png) in enumerate(panels.items()):
+        name = html.escape(str(id_sess))
+        src = html.escape(os.path.relpath(os.path.abspath(png), folder))
+        links.append(f'<li><a href="#s{i}">{name}</a></li>')
+        sections.append(f'<h2 id="s{i}">{name}</h2>\n<img src="{src}" alt="{name}">')
+    links = "\n".join(links)
+    sections = "\n".join(sections)
+    with open(path, "w") as f:
+        f.write(
+            "<!DOCTYPE html>\n<html>\n"
+            '<head><meta charset="utf-8"><title>Segmented sessions</title></head>\n'
+            f"<body>\n<h1>Segmented sessions</h1>\n<ul>\n{links}\n</ul>\n"
+            f"{sections}\n</body>\n</html>\n"
+        )
+    return path
+
+
+def segment_report(
+    bike_df,
+    breakpoints,
+    path="main_sess.pdf",
+    workers=None,
+    n_points=N_POINTS,
+    panel_dir=PANEL_DIR,
+):
+    """
+    Writes the before/after report of every session in breakpoints
+
+    input
+    -----
+    bike_df: pd.DataFrame
+        The bike data dfMainSessions was run on, at least id_sess, elapsed_sec and cadence
+    breakpoints: pd.DataFrame
+        dfMainSessions.breakpoints (or the saved breakpoints table)
+    path: str
+        .pdf for a multi-page PDF, .html for an HTML index of the panel images
+    workers: int
+        Number of processes drawing panels, None uses every core, 1 draws them one by one
+    n_points: int
+        Points per trace after downsampling
+    panel_dir: str
+        Where the panels are kept between runs
+
+    output
+    ------
+    path
+    """
+    tasks = panel_tasks(bike_df, breakpoints, n_points, panel_dir)
+    panels = render_panels(tasks, workers)
+    if path.lower().endswith((".html", ".htm")):
+        path = write_html(panels, path)
+    else:
+        path = write_pdf(panels, path)
+    cache.evict_cache(cache.CACHE_DIR, cache.MAX_BYTES)
+    return path
@@ -0,0 +1,347 @@
+"""
+Python replacement for segment_cutter.r. Cuts the warm up and cool down off each session
+with piecewise (segmented) linear regression.
+
+USE:
+    dfm = dfMainSessions(bike_df, num_cuts, save_table = False)
+    main_sessions = dfm.result
+    breakpoints = dfm.breakpoints
+
+PURPOSE:
+    * Fit cadence ~ elapsed_sec with any number of breakpoints, using the same iterative
+      linearization as R's `segmented` package (Muggeo, 2003)
+    * Fit every session in parallel
+    * Report a standard error and 95% confidence interval for every breakpoint
+    * Cut each session the same way segment_cutter.r does
+        * 1 cut: keep the side of the cut that does not hold the middle of the session
+        * 2 cuts: keep what is between the cuts
+        * 3+ cuts: keep the longest stretch between two cuts
+    * Save the result as `main_sessions`, and the breakpoints as `breakpoints`
+"""
+import pandas as pd
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from storage import dbInfo
+
+# columns of the breakpoints table
+BREAKPOINT_COLS = [
+    "id_sess",
+    "num_cuts",
+    "breakpoint",
+    "psi",
+    "se",
+    "lower",
+    "upper",
+    "rss",
+    "start_row",
+    "stop_row",
+]
+
+# 97.5th percentile of the normal distribution, for 95% confidence intervals
+Z_95 = 1.959963984540054
+
+
+def design_matrix(x, psi, with_v=True):
+    """
+    Columns: intercept, x, (x - psi_j)+ for every breakpoint and, if with_v, -I(x > psi_j)
+    """
+    cols = [np.ones_like(x), x]
+    cols += [np.maximum(x - p, 0) for p in psi]
+    if with_v:
+        cols += [-(x > p).astype(float) for p in psi]
+    return np.column_stack(cols)
+
+
+def fixed_fit(x, y, psi):
+    """
+    Least squares fit with the breakpoints held at psi. Returns the coefficients and the rss.
+    """
+    X = design_matrix(x, psi, with_v=False)
+    coef, _, _, _ = np.linalg.lstsq(X, y, rcond=None)
+    resid = y - X @ coef
+    return coef, float(resid @ resid)
+
+
+def valid_psi(x, psi, min_gap=2):
+    """
+    Breakpoints have to be inside the data, in order, and not on top of each other
+    """
+    if not np.all(np.isfinite(psi)):
+        return False
+    edges = np.concatenate([[x.min()], np.sort(psi), [x.max()]])
+    return bool(np.all(np.diff(edges) >= min_gap))
+
+
+def fit_from(x, y, psi, max_iter=30, tol=1e-8):
+    """
+    Muggeo's iterative linearization, starting from the breakpoints in psi.
+    Returns None if the breakpoints leave the data or collapse onto each other.
+    """
+    psi = np.sort(np.asarray(psi, dtype=float))
+    k = len(psi)
+    _, rss = fixed_fit(x, y, psi)
+    for _ in range(max_iter):
+        X = design_matrix(x, psi)
+        coef, _, _, _ = np.linalg.lstsq(X, y, rcond=None)
+        beta = coef[2 : 2 + k]
+        gamma = coef[2 + k :]
+        if np.any(beta == 0):
+            return None
+        step = gamma / beta
+        # step halving, like segmented's default
+        for h in [1, 0.5, 0.25, 0.125, 0.0625]:
+            new_psi = np.sort(psi + h * step)
+            if not valid_psi(x, new_psi):
+                continue
+            _, new_rss = fixed_fit(x, y, new_psi)
+            if new_rss <= rss:
+                break
+        else:
+            break
+        done = abs(rss - new_rss) <= tol * max(rss, 1)
+        psi, rss = new_psi, new_rss
+        if done:
+            break
+    if not valid_psi(x, psi):
+        return None
+    return psi, rss
+
+
+def breakpoint_se(x, y, psi):
+    """
+    Standard error of every breakpoint, by the delta method on the last linearized fit.
+    At convergence gamma is ~0, so se(psi_j) = se(gamma_j) / |beta_j|.
+    """
+    k = len(psi)
+    X = design_matrix(x, psi)
+    coef, _, _, _ = np.linalg.lstsq(X, y, rcond=None)
+    resid = y - X @ coef
+    dof = max(len(y) - X.shape[1], 1)
+    sigma2 = float(resid @ resid) / dof
+    cov = sigma2 * np.linalg.pinv(X.T @ X)
+    beta = coef[2 : 2 + k]
+    gamma = coef[2 + k :]
+    idx_b = np.arange(2, 2 + k)
+    idx_g = np.arange(2 + k, 2 + 2 * k)
+    var = (
+        cov[idx_g, idx_g] / beta**2
+        + gamma**2 * cov[idx_b, idx_b] / beta**4
+        - 2 * gamma * cov[idx_g, idx_b] / beta**3
+    )
+    return np.sqrt(np.maximum(var, 0))
+
+
+def fit_breakpoints(x, y, n_breaks, n_starts=10, seed=0):
+    """
+    Fits y ~ x as a continuous piecewise linear line with n_breaks breakpoints
+
+    input
+    -----
+    x, y: np.array
+    n_breaks: int
+        Number of breakpoints, any number >= 1
+    n_starts: int
+        The first start uses evenly spaced quantiles of x (segmented's default),
+        the others jitter those. The fit with the lowest rss wins.
+
+    output
+    ------
+    dict with psi, se, lower, upper (np.arrays, one value per breakpoint) and rss,
+    or None if no start converged
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    if len(x) < 2 * n_breaks + 3:
+        return None
+    rng = np.random.default_rng(seed)
+    probs = np.arange(1, n_breaks + 1) / (n_breaks + 1)
+
+    best = None
+    for start in range(n_starts):
+        if start > 0:
+            jitter = rng.uniform(-0.5, 0.5, n_breaks) / (n_breaks + 1)
+            probs_start = np.clip(probs + jitter, 0.01, 0.99)
+        else:
+            probs_start = probs
+        fit = fit_from(x, y, np.quantile(x, probs_start))
+        if fit is not None and (best is None or fit[1] < best[1]):
+            best = fit
+    if best is None:
+        return None
+
+    psi, rss = best
+    se = breakpoint_se(x, y, psi)
+    return {
+        "psi": psi,
+        "se": se,
+        "lower": psi - Z_95 * se,
+        "upper": psi + Z_95 * se,
+        "rss": rss,
+    }
+
+
+def keep_rows(n_rows, elapsed_sec, psi):
+    """
+    Which rows segment_cutter.r keeps for these breakpoints, as a (start, stop) slice.
+    The rounded breakpoints are used as 1-based row numbers, same as dplyr::slice.
+    """
+    locs = [int(np.round(p)) for p in psi]
+    if len(locs) == 1:
+        middle = np.max(elapsed_sec) / 2
+        if locs[0] < middle:
+            # if less than middle, then beginning is cut
+            return max(locs[0] - 1, 0), n_rows
+        # if more than middle, then end is cut
+        return 0, min(locs[0], n_rows)
+    if len(locs) == 2:
+        return max(locs[0] - 1, 0), min(locs[1], n_rows)
+    edges = [1] + locs + [n_rows]
+    longest = int(np.argmax(np.diff(edges)))
+    return max(edges[longest] - 1, 0), min(edges[longest + 1], n_rows)
+
+
+def segment_session(task):
+    """
+    Fits and cuts one session. Runs in a worker process.
+
+    input
+    -----
+    task: tuple
+        (id_sess, elapsed_sec array, cadence array, number of cuts)
+    """
+    id_sess, elapsed_sec, cadence, n_cuts = task
+    fit = fit_breakpoints(elapsed_sec, cadence, n_cuts)
+    if fit is None:
+        return id_sess, None, None
+    return id_sess, fit, keep_rows(len(cadence), elapsed_sec, fit["psi"])
+
+
+def is_sequential(elapsed_sec):
+    """
+    Same as sanity() in segment_cutter.r, True if every step is exactly 1
+    """
+    return bool(np.all(np.diff(elapsed_sec) == 1))
+
+
+def main_session(temp_df, id_sess, keep):
+    """
+    The rows of one session that keep_rows kept, with a `sane` column from is_sequential
+    """
+    temp_df = temp_df.iloc[keep[0] : keep[1]].copy()
+    sane = is_sequential(temp_df["elapsed_sec"].to_numpy())
+    temp_df["sane"] = sane
+    print(f"{id_sess} sequential = {sane}")
+    return temp_df
+
+
+def breakpoint_rows(id_sess, fit, keep):
+    """
+    The rows of the breakpoints table for one fitted session
+    """
+    return [
+        {
+            "id_sess": id_sess,
+            "num_cuts": len(fit["psi"]),
+            "breakpoint": i + 1,
+            "psi": psi,
+            "se": fit["se"][i],
+            "lower": fit["lower"][i],
+            "upper": fit["upper"][i],
+            "rss": fit["rss"],
+            "start_row": keep[0],
+            "stop_row": keep[1],
+        }
+        for i, psi in enumerate(fit["psi"])
+    ]
+
+
+class dfMainSessions:
+    """
+    Cuts the warm up and cool down off every session of the bike data
+    """
+
+    def __init__(self, bike_df, num_cuts=None, save_table=False, workers=None):
+        """
+        Coordinates the self.functions
+
+        bike_df:
+            dfBike.result, at least id_sess, elapsed_sec and cadence columns
+        num_cuts:
+            {id_sess: number of cuts} (ex: data/num_cuts.py), or a dataframe with id_sess
+            and num_cuts columns. If None, loads the num_cuts table from the database.
+            Sessions with 0 cuts are flagged for manual review and skipped.
+        workers:
+            Number of processes, None uses every core, 1 fits the sessions one by one
+        """
+        cuts = self.load_cuts(num_cuts)
+        self.breakpoints, df_main = self.cut_sessions(bike_df, cuts, workers)
+
+        if save_table:
+            db = dbInfo()
+            db.save_table(df_main, "main_sessions")
+            db.save_table(self.breakpoints, "breakpoints")
+
+        self.result = df_main
+
+    def load_cuts(self, num_cuts):
+        """
+        Returns {id_sess: number of cuts} without the sessions flagged for review
+        """
+        if num_cuts is None:
+            num_cuts = dbInfo().load_table("num_cuts")
+        if isinstance(num_cuts, pd.DataFrame):
+            num_cuts = dict(zip(num_cuts["id_sess"], num_cuts["num_cuts"]))
+        # a 0 indicates manual review needed
+        return {k: int(v) for k, v in num_cuts.items() if v > 0}
+
+    def clean_session(self, temp_df, id_sess):
+        """
+        Removes outrageous cadences (< -50 or > 150) so they don't bias the fit.
+        bike_data from dfBike has already dropped everything outside 0-150.
+        """
+        bad = (temp_df["cadence"] < -50) | (temp_df["cadence"] > 150)
+        if bad.any():
+            print(
+                f"WARNING: {id_sess} has {bad.sum()} cadences < -50 or > 150! They have been cut out."
+            )
+            temp_df = temp_df[~bad]
+        return temp_df
+
+    def cut_sessions(self, bike_df, cuts, workers=None):
+        """
+        Fits every session in cuts, returns the breakpoint table and the cut sessions
+        """
+        bike_df = bike_df[bike_df["id_sess"].isin(list(cuts))]
+        sessions = {}
+        for id_sess, temp_df in bike_df.groupby("id_sess", sort=False, observed=True):
+            temp_df = temp_df.sort_values("elapsed_sec", kind="stable")
+            sessions[id_sess] = self.clean_session(temp_df, id_sess)
+        tasks = [
+            (
+                id_sess,
+                temp_df["elapsed_sec"].to_numpy(dtype=float),
+                temp_df["cadence"].to_numpy(dtype=float),
+                cuts[id_sess],
+            )
+            for id_sess, temp_df in sessions.items()
+        ]
+
+        if workers == 1:
+            fits = [segment_session(task) for task in tasks]
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                fits = list(pool.map(segment_session, tasks, chunksize=4))
+
+        rows = []
+        main = []
+        for id_sess, fit, keep in fits:
+            if fit is None:
+                print(f"ERROR: {id_sess}: segmented regression did not converge")
+                continue
+            main.append(main_session(sessions[id_sess], id_sess, keep))
+            rows += breakpoint_rows(id_sess, fit, keep)
+
+        breakpoints = pd.DataFrame(rows, columns=BREAKPOINT_COLS)
+        if len(main) == 0:
+            return breakpoints, bike_df.iloc[:0].assign(sane=pd.Series(dtype=bool))
+        return breakpoints, pd.concat(main).reset_index(drop=True)
@@ -0,0 +1,180 @@
+"""
+Memory-mapped store of the bike signals, with an index of where each session starts and stops.
+
+USE:
+    write_store(bike_df, "signal_store")  # or a stream, ex: write_store(iter_db_sessions())
+    store = signalStore("signal_store")
+    cadence = store.session("SMB024_day1")["cadence"]  # a view, nothing is copied
+    temp_df = store.frame("SMB024_day1")
+
+    df_entropy = stream_entropy(store)  # the store is also a stream of (id_sess, frame)
+
+    stores = open_studies()  # {study: signalStore}, written by studies.ingest_studies
+
+PURPOSE:
+    * Each column is one contiguous little-endian binary file (ex: cadence.bin), with every
+      session back to back, sorted by elapsed_sec
+    * index.csv holds id_sess, start and stop of every session, so a session is the rows
+      start:stop of each file. Getting one is an O(1) slice instead of a mask over the table.
+    * meta.json holds the columns and their dtypes
+    * The files are opened with np.memmap, so worker processes share the operating system's
+      page cache instead of each getting a pickled copy. A signalStore pickles as its path.
+    * Plain binary files and a CSV index can also be read from R (readBin)
+    * Several studies are kept as one store per study under STUDY_STORE_DIR, so their
+      id_sess can't collide
+"""
+
+import os
+import json
+import shutil
+import numpy as np
+import pandas as pd
+
+STORE_DIR = "signal_store"
+# one store per study, see studies.ingest_studies
+STUDY_STORE_DIR = "study_store"
+# columns written by default, with the dtype they are stored as
+SIGNAL_COLS = {
+    "elapsed_sec": "int32",
+    "hr": "float32",
+    "power": "float32",
+    "cadence": "float32",
+}
+
+
+def write_store(sessions, path=STORE_DIR, columns=None):
+    """
+    Writes the signals of every session to path, replacing what was there
+
+    input
+    -----
+    sessions: pd.DataFrame or iterable of (id_sess, pd.DataFrame)
+        bike_data (or main_sessions), or a stream of sessions (see stream.py).
+        A stream is written one session at a time.
+    path: str
+        Folder of the store
+    columns: dict
+        {column: dtype} to store, defaults to SIGNAL_COLS
+
+    output
+    ------
+    signalStore opened on the new files
+    """
+    columns = columns or SIGNAL_COLS
+    if isinstance(sessions, pd.DataFrame):
+        sessions = sessions.groupby("id_sess", sort=False, observed=True)
+
+    # written next to path first, so readers never see half a store
+    tmp = f"{path}.{os.getpid()}.tmp"
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    files = {col: open(os.path.join(tmp, f"{col}.bin"), "wb") for col in columns}
+    index = []
+    start = 0
+    try:
+        for id_sess, temp_df in sessions:
+            if "elapsed_sec" in temp_df.columns:
+                temp_df = temp_df.sort_values("elapsed_sec", kind="stable")
+            for col, kind in columns.items():
+                values = temp_df[col].to_numpy(dtype=np.dtype(kind).newbyteorder("<"))
+                files[col].write(values.tobytes())
+            index.append((id_sess, start, start + len(temp_df)))
+            start += len(temp_df)
+    finally:
+        for f in files.values():
+            f.close()
+
+    pd.DataFrame(index, columns=["id_sess", "start", "stop"]).to_csv(
+        os.path.join(tmp, "index.csv"), index=False
+    )
+    with open(os.path.join(tmp, "meta.json"), "w") as f:
+        json.dump({"n_rows": start, "columns": columns}, f, indent=2)
+
+    shutil.rmtree(path, ignore_errors=True)
+    os.replace(tmp, path)
+    return signalStore(path)
+
+
+class signalStore:
+    """
+    Read-only view of a store written by write_store
+    """
+
+    def __init__(self, path=STORE_DIR):
+        """
+        Opens the index and memory maps every column. Nothing is read until it is sliced.
+        """
+        self.path = path
+        with open(os.path.join(path, "meta.json")) as f:
+            meta = json.load(f)
+        self.columns = meta["columns"]
+        self.n_rows = meta["n_rows"]
+        index = pd.read_csv(os.path.join(path, "index.csv"), dtype={"id_sess": str})
+        self.sessions = index["id_sess"].tolist()
+        self.offsets = dict(
+            zip(self.sessions, zip(index["start"].tolist(), index["stop"].tolist()))
+        )
+        # same layout as zero_runs.session_bounds
+        self.bounds = np.append(index["start"].to_numpy(), self.n_rows)
+        self.arrays = {}
+        for col, kind in self.columns.items():
+            dtype = np.dtype(kind).newbyteorder("<")
+            if self.n_rows == 0:
+                # np.memmap can't map an empty file
+                self.arrays[col] = np.empty(0, dtype=dtype)
+            else:
+                self.arrays[col] = np.memmap(
+                    os.path.join(path, f"{col}.bin"),
+                    dtype=dtype,
+                    mode="r",
+                    shape=(self.n_rows,),
+                )
+
+    def __reduce__(self):
+        # workers reopen the files instead of receiving the arrays
+        return (signalStore, (self.path,))
+
+    def __len__(self):
+        return len(self.sessions)
+
+    def __contains__(self, id_sess):
+        return id_sess in self.offsets
+
+    def __iter__(self):
+        """
+        Yields (id_sess, frame) for every session, so the store works as a session stream
+        """
+        for id_sess in self.sessions:
+            yield id_sess, self.frame(id_sess)
+
+    def session(self, id_sess, columns=None):
+        """
+        {column: array} of one session. The arrays are read-only views of the files.
+        """
+        start, stop = self.offsets[id_sess]
+        return {col: self.arrays[col][start:stop] for col in columns or self.columns}
+
+    def frame(self, id_sess, columns=None):
+        """
+        One session as a dataframe with an id_sess column, without copying the signals
+        """
+        arrays = self.session(id_sess, columns)
+        n = len(next(iter(arrays.values()))) if arrays else 0
+        temp_df = pd.DataFrame(arrays, copy=False)
+        temp_df.insert(
+            0,
+            "id_sess",
+            pd.Categorical.from_codes(np.zeros(n, dtype=np.int8), [id_sess]),
+        )
+        return temp_df
+
+
+def open_studies(path=STUDY_STORE_DIR):
+    """
+    {study name: signalStore} of every study store in path
+    """
+    stores = {}
+    for name in sorted(os.listdir(path)):
+        if os.path.exists(os.path.join(path, name, "meta.json")):
+            stores[name] = signalStore(os.path.join(path, name))
+    return stores
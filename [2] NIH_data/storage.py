@@ -0,0 +1,344 @@
+"""
+SQLite storage for the processed tables (bike_data, demos, effort, entropy).
+
+USE:
+    db = dbInfo()
+    db.save_table(df_bike, "bike_data")
+    one_person = db.load_table("bike_data", where={"my_id": "SMB024"})
+
+PURPOSE:
+    * One pooled engine per database file, shared by every dbInfo
+    * WAL journal and tuned pragmas, rows are written in executemany chunks
+    * Tables are created from declared schemas, with indexes on id_sess, my_id and elapsed_sec
+      so segment_cutter.r and the explorer can pull single participants back out quickly
+    * Errors are raised, a failed save rolls back instead of leaving half a table
+      (DROP and CREATE included, the engine starts its own transactions)
+"""
+
+import os
+import pandas as pd
+import sqlalchemy as sq
+
+DB_URL = "sqlite:///nih_scripts.db"
+CHUNK_SIZE = 50000
+# sqlite only allows so many parameters per statement
+MAX_PARAMS = 500
+
+PRAGMAS = [
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-200000",  # ~200 MB
+    "PRAGMA mmap_size=1073741824",  # 1 GB
+]
+
+# declared column types. Columns that are not listed get a type from their dtype.
+SCHEMAS = {
+    "bike_data": {
+        "datetime": "TIMESTAMP",
+        "date": "TEXT",
+        "time": "TEXT",
+        "elapsed_sec": "INTEGER",
+        "id_sess": "TEXT",
+        "my_id": "TEXT",
+        "day": "TEXT",
+        "unknown": "INTEGER",
+        "hr": "REAL",
+        "power": "REAL",
+        "cadence": "REAL",
+        "cadence_roll_diff": "REAL",
+        "cadence_rounded": "INTEGER",
+    },
+    "demos": {
+        "id": "TEXT",
+        "age": "REAL",
+        "gender_1_female": "INTEGER",
+        "hyarr": "REAL",
+        "height": "REAL",
+        "weight": "REAL",
+        "bmi": "REAL",
+        "months": "REAL",
+        "ledd": "REAL",
+        "group": "INTEGER",
+        "updrs_pre": "REAL",
+        "updrs_post": "REAL",
+        "updrs_chg": "REAL",
+        "mean_effort": "REAL",
+        "gender": "TEXT",
+    },
+    "effort": {
+        "id_sess": "TEXT",
+        "perc_time_in_pos": "REAL",
+        "day": "TEXT",
+        "id": "TEXT",
+    },
+    "entropy": {
+        "subject": "TEXT",
+        "group": "INTEGER",
+        "updrs_pre": "REAL",
+        "updrs_post": "REAL",
+        "updrs_chg": "REAL",
+        **{
+            f"{var}_{stat}": "REAL"
+            for var in ["hr", "cad", "pow"]
+            for stat in ["mean", "std", "samen", "apen", "spen"]
+        },
+        "session": "INTEGER",
+        "grp_coded": "TEXT",
+    },
+}
+
+# indexes are only built when the table has the columns
+INDEXES = [["id_sess", "elapsed_sec"], ["my_id"]]
+
+_ENGINES = {}
+
+
+def engine_key(url):
+    """
+    url with a relative SQLite path made absolute, so a later os.chdir doesn't reuse
+    the engine of another directory's database
+    """
+    parsed = sq.engine.make_url(url)
+    in_memory = parsed.database in (None, "", ":memory:")
+    if parsed.get_backend_name() != "sqlite" or in_memory:
+        return url
+    database = os.path.abspath(parsed.database)
+    return parsed.set(database=database).render_as_string(hide_password=False)
+
+
+def get_engine(url=None):
+    """
+    Returns the shared engine for url (defaults to DB_URL), creating it the first time
+    """
+    url = engine_key(url or DB_URL)
+    if url not in _ENGINES:
+        engine = sq.create_engine(url)
+
+        @sq.event.listens_for(engine, "connect")
+        def set_pragmas(dbapi_cnx, record):
+            # sqlite3 commits DROP and CREATE on its own, so the transaction is started below
+            dbapi_cnx.isolation_level = None
+            cursor = dbapi_cnx.cursor()
+            for pragma in PRAGMAS:
+                cursor.execute(pragma)
+            cursor.close()
+
+        @sq.event.listens_for(engine, "begin")
+        def begin(cnx):
+            cnx.exec_driver_sql("BEGIN")
+
+        _ENGINES[url] = engine
+    return _ENGINES[url]
+
+
+def sql_type(series):
+    """
+    SQLite column type for a column that has no declared type
+    """
+    if pd.api.types.is_bool_dtype(series) or pd.api.types.is_integer_dtype(series):
+        return "INTEGER"
+    if pd.api.types.is_float_dtype(series):
+        return "REAL"
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return "TIMESTAMP"
+    return "TEXT"
+
+
+def to_rows(dataframe):
+    """
+    Turns a dataframe into a list of tuples of plain python values that sqlite3 accepts.
+    Missing values become None, datetimes are written the same way pandas.to_sql writes them.
+    """
+    cols = []
+    for col in dataframe.columns:
+        series = dataframe[col]
+        if pd.api.types.is_datetime64_any_dtype(series):
+            values = series.dt.strftime("%Y-%m-%d %H:%M:%S.%f")
+        elif pd.api.types.is_bool_dtype(series):
+            values = series.astype(int)
+        else:
+            values = series
+        values = values.astype(object).where(series.notna(), None)
+        cols.append(values.tolist())
+    return list(zip(*cols))
+
+
+class dbInfo:
+    """
+    Saves the newly processed dataframes into nih_scripts.db, and reads them back out
+    """
+
+    def __init__(self, url=None):
+        """
+        Initializes db, url defaults to DB_URL
+        """
+        self.engine = get_engine(url)
+
+    def create_table(self, cnx, dataframe, table_name):
+        """
+        Creates table_name with the declared schema plus any extra columns in dataframe, and its indexes
+        """
+        schema = SCHEMAS.get(table_name, {})
+        col_defs = [
+            f'"{col}" {schema.get(col, sql_type(dataframe[col]))}'
+            for col in dataframe.columns
+        ]
+        cnx.exec_driver_sql(
+            f'CREATE TABLE IF NOT EXISTS "{table_name}" ({", ".join(col_defs)})'
+        )
+        for index_cols in INDEXES:
+            if all(col in dataframe.columns for col in index_cols):
+                name = f"ix_{table_name}_{'_'.join(index_cols)}"
+                cols = ", ".join(f'"{col}"' for col in index_cols)
+                cnx.exec_driver_sql(
+                    f'CREATE INDEX IF NOT EXISTS "{name}" ON "{table_name}" ({cols})'
+                )
+
+    def insert_rows(self, cnx, dataframe, table_name):
+        """
+        Appends dataframe to table_name in executemany chunks
+        """
+        cols = ", ".join(f'"{col}"' for col in dataframe.columns)
+        marks = ", ".join("?" for _ in dataframe.columns)
+        insert = f'INSERT INTO "{table_name}" ({cols}) VALUES ({marks})'
+        for i in range(0, len(dataframe), CHUNK_SIZE):
+            rows = to_rows(dataframe.iloc[i : i + CHUNK_SIZE])
+            cnx.exec_driver_sql(insert, rows)
+
+    def clear_manifest(self, cnx, table_name):
+        """
+        Forgets the fingerprints upsert_sessions saved for table_name, once the whole table is replaced
+        """
+        if table_name != "manifest" and sq.inspect(cnx).has_table("manifest"):
+            cnx.exec_driver_sql(
+                "DELETE FROM manifest WHERE table_name = ?", (table_name,)
+            )
+
+    def save_table(self, dataframe, table_name):
+        """
+        Replaces table_name with dataframe, all in one transaction.
+        The table's manifest rows are dropped with it, the next incremental run redoes every session.
+        """
+        with self.engine.begin() as cnx:
+            cnx.exec_driver_sql(f'DROP TABLE IF EXISTS "{table_name}"')
+            self.clear_manifest(cnx, table_name)
+            self.create_table(cnx, dataframe, table_name)
+            self.insert_rows(cnx, dataframe, table_name)
+        print(f"Saved {len(dataframe)} rows to {table_name}!")
+
+    def load_table(self, table_name, columns=None, where=None):
+        """
+        Reads table_name back out, optionally only some columns and only matching rows
+
+        input
+        -----
+        table_name: str
+        columns: list of str
+            Columns to read, defaults to all
+        where: dict
+            {column: value} or {column: [values]}, ex: load_table("bike_data", where={"my_id": "SMB024"}).
+            Filtering on an indexed column only reads the matching rows.
+        """
+        cols = "*" if columns is None else ", ".join(f'"{col}"' for col in columns)
+        query = f'SELECT {cols} FROM "{table_name}"'
+        params = {}
+        conditions = []
+        for col, value in (where or {}).items():
+            if isinstance(value, (list, tuple, set, pd.Series, pd.Index)):
+                values = list(value)
+            else:
+                values = [value]
+            marks = []
+            for i, v in enumerate(values):
+                params[f"{col}_{i}"] = v
+                marks.append(f":{col}_{i}")
+            conditions.append(f'"{col}" IN ({", ".join(marks)})')
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+
+        schema = SCHEMAS.get(table_name, {})
+        dates = [col for col, kind in schema.items() if kind == "TIMESTAMP"]
+        with self.engine.connect() as cnx:
+            df = pd.read_sql(sq.text(query), cnx, params=params)
+        for col in dates:
+            if col in df.columns:
+                df[col] = pd.to_datetime(df[col])
+        return df
+
+    def save_frames(self, frames, table_name):
+        """
+        Replaces table_name with the rows of every dataframe in frames, all in one transaction.
+        frames can be a generator, only one dataframe is held at a time (see stream.py).
+        The table's columns come from the first dataframe. The manifest is cleared like save_table.
+        """
+        n_rows = 0
+        with self.engine.begin() as cnx:
+            cnx.exec_driver_sql(f'DROP TABLE IF EXISTS "{table_name}"')
+            self.clear_manifest(cnx, table_name)
+            for i, dataframe in enumerate(frames):
+                if i == 0:
+                    self.create_table(cnx, dataframe, table_name)
+                self.insert_rows(cnx, dataframe, table_name)
+                n_rows += len(dataframe)
+        print(f"Saved {n_rows} rows to {table_name}!")
+
+    def list_sessions(self, table_name, key="id_sess"):
+        """
+        Every id_sess in table_name, in the order they were saved
+        """
+        query = (
+            f'SELECT "{key}" FROM "{table_name}" GROUP BY "{key}" ORDER BY MIN(rowid)'
+        )
+        with self.engine.connect() as cnx:
+            return pd.read_sql(sq.text(query), cnx)[key].tolist()
+
+    def load_manifest(self, table_name):
+        """
+        Returns {id_sess: fingerprint} of the sessions saved in table_name by upsert_sessions
+        """
+        if not sq.inspect(self.engine).has_table("manifest"):
+            return {}
+        manifest = self.load_table("manifest", where={"table_name": table_name})
+        return dict(zip(manifest["id_sess"], manifest["fingerprint"]))
+
+    def upsert_sessions(self, dataframe, table_name, fingerprints, key="id_sess"):
+        """
+        Replaces only the given sessions in table_name, all in one transaction.
+        Sessions that are not in fingerprints are left alone.
+
+        input
+        -----
+        dataframe: pd.DataFrame
+            Rows of the new or changed sessions
+        table_name: str
+        fingerprints: dict
+            {id_sess: fingerprint} of every session being replaced, saved in the manifest table
+        key: str
+            Column that identifies a session
+        """
+        ids = list(fingerprints)
+        manifest = pd.DataFrame(
+            {
+                "table_name": table_name,
+                "id_sess": ids,
+                "fingerprint": [fingerprints[k] for k in ids],
+            }
+        )
+
+        with self.engine.begin() as cnx:
+            self.create_table(cnx, dataframe, table_name)
+            self.create_table(cnx, manifest, "manifest")
+            for i in range(0, len(ids), MAX_PARAMS):
+                chunk = ids[i : i + MAX_PARAMS]
+                marks = ", ".join("?" for _ in chunk)
+                cnx.exec_driver_sql(
+                    f'DELETE FROM "{table_name}" WHERE "{key}" IN ({marks})', tuple(chunk)
+                )
+                cnx.exec_driver_sql(
+                    f'DELETE FROM manifest WHERE table_name = ? AND id_sess IN ({marks})',
+                    (table_name, *chunk),
+                )
+            self.insert_rows(cnx, dataframe, table_name)
+            self.insert_rows(cnx, manifest, "manifest")
+        print(f"Upserted {len(ids)} sessions into {table_name}!")
@@ -0,0 +1,216 @@
+"""
+Streams cleaned, trimmed bike sessions one at a time, instead of building all of dfBike.result.
+
+USE:
+    for id_sess, temp_df in iter_raw_sessions("raw_bike_files"):
+        ...
+
+    # raw files straight into the database, one session in memory at a time
+    db = dbInfo()
+    db.save_frames((df for _, df in iter_raw_sessions()), "bike_data")
+
+    df_pow, mean_pow = stream_effort(iter_db_sessions())
+    df_entropy = stream_entropy(iter_db_sessions(), workers=4)
+    for id_sess, main_df, breakpoints in iter_main_sessions(iter_db_sessions(), num_cuts):
+        ...
+
+PURPOSE:
+    * Sessions come from the raw bike exports (iter_raw_sessions) or from a saved table such
+      as bike_data (iter_db_sessions), as (id_sess, dataframe) pairs
+    * Raw sessions go through the same cleaning as dfBike (dfBike.clean_sessions)
+    * Effort, entropy and segmentation take any such stream, so memory stays around one
+      session (or a few, with workers) instead of the whole cohort
+    * Workers only ever get a few sessions ahead of the consumer (see bounded_map)
+"""
+
+import os
+import functools
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import pandas as pd
+import raw_processing as r
+import entropy as ent
+import effort as ef
+import segmenter as seg
+import ingest
+import cache
+from storage import dbInfo, DB_URL
+
+
+def bounded_map(func, tasks, workers=None, window=None):
+    """
+    Like pool.map, but reads tasks lazily and keeps at most `window` of them in flight
+
+    input
+    -----
+    func: function
+        Runs in a worker process, has to be picklable
+    tasks: iterable of (context, task)
+        func(task) is run, context stays in this process and is passed back with the result
+    workers: int
+        Number of processes, None uses every core, 1 runs everything here
+    window: int
+        Tasks in flight, defaults to twice the workers
+
+    output
+    ------
+    Yields (context, func(task)) in the same order as tasks
+    """
+    if workers == 1:
+        for context, task in tasks:
+            yield context, func(task)
+        return
+
+    workers = workers or os.cpu_count()
+    window = window or 2 * workers
+    pending = deque()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for context, task in tasks:
+            pending.append((context, pool.submit(func, task)))
+            if len(pending) >= window:
+                context, future = pending.popleft()
+                yield context, future.result()
+        while pending:
+            context, future = pending.popleft()
+            yield context, future.result()
+
+
+def iter_raw_sessions(
+    folder="raw_bike_files",
+    files=None,
+    trim_config=None,
+    compat=False,
+    workers=1,
+    study=None,
+    resample=False,
+    timeline_config=None,
+):
+    """
+    Yields (id_sess, bike_data of that session), read and cleaned one session at a time
+
+    input
+    -----
+    folder: str
+        Folder of raw bike exports, see ingest.find_bike_files
+    files: list of str
+        Use these files instead of searching folder
+    trim_config, compat:
+        Same as dfBike
+    workers: int
+        Number of processes reading files ahead, None uses every core
+    study: str, dict or None
+        Study the files come from, see studies.py
+    resample, timeline_config:
+        Same as dfBike
+
+    Files of the same session (ex: SMB_024_day1_02 and SMB_024_day1_03) sort next to each
+    other, and are combined into one session like dfBike does.
+    """
+    if files is None:
+        files = ingest.find_bike_files(folder)
+    bike = r.dfBike.cleaner(trim_config, compat, resample, timeline_config, study)
+    organize = functools.partial(ingest.organize_bike_file, compat=compat, study=study)
+
+    pending_id = None
+    pending = []
+    for _, df in bounded_map(organize, ((None, path) for path in files), workers):
+        for id_sess, temp_df in bike.split_sessions(df):
+            if id_sess != pending_id and pending:
+                yield pending_id, bike.clean_sessions(pd.concat(pending))
+                pending = []
+            pending_id = id_sess
+            pending.append(temp_df)
+    if pending:
+        yield pending_id, bike.clean_sessions(pd.concat(pending))
+    cache.evict_cache()
+
+
+def iter_db_sessions(
+    table_name="bike_data", url=DB_URL, sessions=None, columns=None, compat=False
+):
+    """
+    Yields (id_sess, rows of that session) from a saved table, one indexed read per session
+
+    input
+    -----
+    table_name: str
+        bike_data, main_sessions or any table with id_sess and elapsed_sec columns
+    sessions: list of str
+        Only these id_sess, defaults to every session in the order they were saved
+    columns: list of str
+        Columns to read, defaults to all
+    compat: bool
+        If False, bike_data columns are cast to BIKE_DTYPES
+    """
+    db = dbInfo(url)
+    if sessions is None:
+        sessions = db.list_sessions(table_name)
+    for id_sess in sessions:
+        temp_df = db.load_table(table_name, columns, where={"id_sess": id_sess})
+        if "elapsed_sec" in temp_df.columns:
+            temp_df = temp_df.sort_values("elapsed_sec", kind="stable")
+        temp_df = temp_df.reset_index(drop=True)
+        yield id_sess, temp_df if compat else r.compact_types(temp_df)
+
+
+def stream_effort(sessions, thresholds=None):
+    """
+    Same as effort.effort_tables, one session at a time. Returns the session and participant tables.
+    """
+    frames = [ef.effort_tables(temp_df, thresholds)[0] for _, temp_df in sessions]
+    df_pow = pd.concat(frames, ignore_index=True)
+    return df_pow, ef.by_participant(df_pow)
+
+
+def stream_entropy(sessions, m=2, r=0.2, workers=None):
+    """
+    Same as entropy.entropy_table, one session at a time
+    """
+    tasks = ((None, ent.session_task(k, temp_df, m, r)) for k, temp_df in sessions)
+    rows = [row for _, row in bounded_map(ent.session_entropy, tasks, workers)]
+    return pd.DataFrame(rows, columns=ent.COLUMNS)
+
+
+def iter_main_sessions(sessions, num_cuts=None, workers=None):
+    """
+    Same as dfMainSessions, one session at a time
+
+    input
+    -----
+    sessions: iterable of (id_sess, dataframe)
+    num_cuts:
+        Same as dfMainSessions, sessions without cuts are skipped
+    workers: int
+        Number of processes fitting sessions, None uses every core
+
+    output
+    ------
+    Yields (id_sess, main session rows, breakpoints of that session)
+    """
+    dfm = seg.dfMainSessions.__new__(seg.dfMainSessions)
+    cuts = dfm.load_cuts(num_cuts)
+
+    def tasks():
+        for id_sess, temp_df in sessions:
+            if id_sess not in cuts:
+                continue
+            temp_df = temp_df.sort_values("elapsed_sec", kind="stable")
+            temp_df = dfm.clean_session(temp_df, id_sess)
+            task = (
+                id_sess,
+                temp_df["elapsed_sec"].to_numpy(dtype=float),
+                temp_df["cadence"].to_numpy(dtype=float),
+                cuts[id_sess],
+            )
+            yield temp_df, task
+
+    for temp_df, (id_sess, fit, keep) in bounded_map(
+        seg.segment_session, tasks(), workers
+    ):
+        if fit is None:
+            print(f"ERROR: {id_sess}: segmented regression did not converge")
+            continue
+        breakpoints = pd.DataFrame(
+            seg.breakpoint_rows(id_sess, fit, keep), columns=seg.BREAKPOINT_COLS
+        )
+        yield id_sess, seg.main_session(temp_df, id_sess, keep), breakpoints
@@ -0,0 +1,260 @@
+"""
+Study adapters: everything that differs between the cycling cohorts, so one engine can process all of them.
+
+USE:
+    study = get_study("nih_r21")  # what dfBike, dfDemos and dfEntropy use by default
+    dfb = dfBike(study = "nih_r21")
+
+    register_study({
+        "name": "tms_short",
+        "raw_folder": "tms_short_files",
+        "id_patterns": {"my_id": r"(TMS[0-9][0-9])", "day": r"(day[0-9])", "unknown": None},
+    })
+    stores = ingest_studies(["nih_r21", "tms_short"], workers=8)  # {study: signalStore}
+
+PURPOSE:
+    * A study is a dict (same idea as TRIM_CONFIG), missing keys come from STUDY_DEFAULTS:
+        * raw_folder / combined_file: where the raw bike exports are
+        * id_patterns: one regex per ID part (my_id, day, unknown), each with a single group.
+          None means the IDs don't have that part (unknown is then 0).
+        * updrs, entropy, demographics: path and layout of each spreadsheet, the header row,
+          the rows and columns to drop (averages, blank separators) and how many columns to keep
+        * group_codes / keep_group: how the spreadsheet codes each group, and which group
+          the entropy table is filtered to
+    * Only the NIH R21 study is registered here. The other cohorts in Background.txt
+      (dana_data, Jonas Prop, TMS long-term, TMS short-term, pd_bike_robert's KaKV files)
+      get registered with register_study once their raw exports are located.
+    * ingest_studies reads the raw files of every study in one process pool, cleans them
+      like dfBike, and writes one signal store per study (see signal_store.py)
+"""
+import os
+import json
+import hashlib
+import numpy as np
+import pandas as pd
+
+STUDY_DEFAULTS = {
+    "name": None,
+    "raw_folder": None,
+    "combined_file": None,
+    "id_patterns": {"my_id": None, "day": None, "unknown": None},
+    "updrs": None,
+    "entropy": None,
+    "demographics": None,
+    "group_codes": {1: "static", 2: "dynamic"},
+    "keep_group": "dynamic",
+}
+
+NIH_UPDRS_XLSX = "data/Smartbike_NIH_variabiliity_UPDRS.xlsx"
+
+# the NIH R21 study, N = 47, 3 sessions of static or dynamic cycling
+NIH_R21 = {
+    "name": "nih_r21",
+    "raw_folder": "raw_bike_files",
+    "combined_file": "raw_bike_files/[combined_files].xlsx",
+    # ex: SMB_024_day1_02
+    "id_patterns": {
+        "my_id": r"(SMB_\d\d\d)",
+        "day": r"(day\d)",
+        "unknown": r"day\d_(\d\d)",
+    },
+    "updrs": {
+        "path": NIH_UPDRS_XLSX,
+        "header": 0,
+        "n_cols": 4,
+        # means and other irrelevant rows
+        "drop_rows": [0, 1, 24, 25, 26, 27, 53, 54, 55, 56],
+        "drop_cols": [],
+    },
+    "entropy": {
+        "path": NIH_UPDRS_XLSX,
+        "header": 2,
+        "n_cols": 50,
+        # Average rows and rows that separated dynamic from static data
+        "drop_rows": [22, 23, 24, 25, 51, 52, 53, 54],
+        # empties and last two columns that are duplicates of first columns 1,4
+        "drop_cols": ["Unnamed: 5", "Unnamed: 66", "Unnamed: 67"],
+    },
+    "demographics": {"path": "data/NIH_dynamic_demographics.xlsx", "header": 0},
+    "group_codes": {1: "static", 2: "dynamic"},
+    "keep_group": "dynamic",
+}
+
+STUDIES = {"nih_r21": NIH_R21}
+DEFAULT_STUDY = "nih_r21"
+
+
+def get_study(study=None):
+    """
+    The full study dict
+
+    input
+    -----
+    study: str, dict or None
+        Name of a registered study, a study dict, or None for DEFAULT_STUDY
+    """
+    if study is None:
+        study = DEFAULT_STUDY
+    if isinstance(study, str):
+        if study not in STUDIES:
+            raise KeyError(f"Unknown study {study}, registered: {sorted(STUDIES)}")
+        study = STUDIES[study]
+    return {
+        **STUDY_DEFAULTS,
+        **study,
+        "id_patterns": {
+            **STUDY_DEFAULTS["id_patterns"],
+            **study.get("id_patterns", {}),
+        },
+    }
+
+
+def register_study(study):
+    """
+    Adds a study to STUDIES, so it can be used by name
+    """
+    study = get_study(study)
+    if not study["name"]:
+        raise ValueError("A study needs a name")
+    if study["id_patterns"]["my_id"] is None:
+        raise ValueError(f"{study['name']} needs an id_patterns my_id regex")
+    STUDIES[study["name"]] = study
+    return study
+
+
+def study_key(study):
+    """
+    Name of the study and a short hash of its ID patterns, so cached parses of a raw file
+    aren't shared between studies that read its IDs differently
+    """
+    study = get_study(study)
+    patterns = json.dumps(study["id_patterns"], sort_keys=True).encode()
+    return f"{study['name']}-{hashlib.sha256(patterns).hexdigest()[:8]}"
+
+
+def parse_ids(ids, study=None):
+    """
+    Splits raw IDs (ex: SMB_024_day1_02) into my_id, day and unknown
+
+    input
+    -----
+    ids: pd.Series of str
+        Usually just the unique IDs
+    study: str, dict or None
+        See get_study
+
+    output
+    ------
+    pd.DataFrame with my_id (without underscores), day and unknown (str, nan where the
+    pattern didn't match, "0" where the study has no unknown pattern)
+    """
+    patterns = get_study(study)["id_patterns"]
+    ids = pd.Series(ids).reset_index(drop=True)
+    parts = {}
+    for part in ["my_id", "day", "unknown"]:
+        if patterns[part] is None:
+            parts[part] = pd.Series("0" if part == "unknown" else None, index=ids.index)
+        else:
+            parts[part] = ids.str.extract(patterns[part], expand=False)
+    if patterns["my_id"] is not None:
+        parts["my_id"] = parts["my_id"].str.replace("_", "")
+    return pd.DataFrame(parts)
+
+
+def session_parts(bike_df, ids, first_rows=None):
+    """
+    id and day of every session. They come from the my_id and day columns, which
+    load_and_organize parsed with the study's ID grammar, or else from id_sess (my_id_day).
+
+    input
+    -----
+    ids: pd.Series
+        id_sess of every session
+    first_rows: np.array
+        Position in bike_df of the first row of every session. Defaults to the first row
+        of each id_sess, ids are then in pd.factorize(bike_df["id_sess"]) order.
+    """
+    if "my_id" in bike_df.columns and "day" in bike_df.columns:
+        if first_rows is None:
+            codes = pd.factorize(bike_df["id_sess"])[0]
+            found, first_rows = np.unique(codes, return_index=True)
+            first_rows = first_rows[found >= 0]
+        first = bike_df.iloc[first_rows]
+        return pd.DataFrame(
+            {
+                "id": first["my_id"].astype(str).to_numpy(),
+                "day": first["day"].astype(str).to_numpy(),
+            }
+        )
+    parts = ids.str.extract(r"^(.*?)_?(day\d+)")
+    return pd.DataFrame({"id": parts[0].str.replace("_", ""), "day": parts[1]})
+
+
+def sheet_layout(study, sheet):
+    """
+    The layout of one of the study's spreadsheets (updrs, entropy or demographics)
+    """
+    study = get_study(study)
+    if study[sheet] is None:
+        raise ValueError(f"{study['name']} has no {sheet} spreadsheet")
+    return study[sheet]
+
+
+def read_sheet(layout, **kwargs):
+    """
+    Reads a spreadsheet and drops the rows and columns that aren't data, see the updrs,
+    entropy and demographics entries of a study
+    """
+    df = pd.read_excel(layout["path"], header=layout.get("header", 0), **kwargs)
+    df = df.drop(layout.get("drop_rows", []), axis=0)
+    df = df.drop(layout.get("drop_cols", []), axis=1)
+    if layout.get("n_cols") is not None:
+        df = df.iloc[:, : layout["n_cols"]]
+    return df.reset_index(drop=True)
+
+
+def ingest_studies(
+    studies=None,
+    path=None,
+    workers=None,
+    trim_config=None,
+    resample=False,
+    timeline_config=None,
+):
+    """
+    Reads, cleans and stores the bike data of several studies in one run
+
+    input
+    -----
+    studies: list of str or dict
+        Defaults to every registered study
+    path: str
+        Folder of the partitioned store, one signal store per study (default signal_store.STUDY_STORE_DIR)
+    workers: int
+        Number of processes reading the raw files of all studies, None uses every core
+    trim_config, resample, timeline_config:
+        Same as dfBike
+
+    output
+    ------
+    {study name: signalStore}
+    """
+    # imported here, raw_processing imports this module
+    import ingest
+    import raw_processing as r
+    import signal_store as ss
+
+    path = path or ss.STUDY_STORE_DIR
+    studies = [get_study(study) for study in (studies or list(STUDIES))]
+    frames = ingest.load_studies(studies, workers=workers)
+
+    bike = r.dfBike.cleaner(
+        trim_config, resample=resample, timeline_config=timeline_config
+    )
+    stores = {}
+    for study in studies:
+        df_bike = bike.clean_sessions(frames[study["name"]])
+        stores[study["name"]] = ss.write_store(
+            df_bike, os.path.join(path, study["name"])
+        )
+    return stores
@@ -0,0 +1,72 @@
+"""
+Checks the batched correlations and group differences against scipy and plain pandas.
+"""
+import numpy as np
+import pandas as pd
+from scipy import stats
+import associations as a
+
+
+def make_table(n=30, seed=0):
+    """
+    Long table with three sessions, one metric related to updrs_chg and one that isn't
+    """
+    rng = np.random.default_rng(seed)
+    chg = rng.normal(0, 5, n)
+    rows = []
+    for session in [1, 2, 3]:
+        for i in range(n):
+            rows.append(
+                {
+                    "subject": f"SMB{i:03d}",
+                    "session": session,
+                    "updrs_pre": 20 + i % 7,
+                    "updrs_chg": chg[i],
+                    "cad_mean": 0.5 * chg[i] + rng.normal(),
+                    "pow_mean": rng.normal(),
+                }
+            )
+    table = pd.DataFrame(rows)
+    table.loc[3, "pow_mean"] = np.nan
+    return table
+
+
+def test_associations_matches_scipy():
+    table = make_table()
+    result = a.associations(table, by="session", n_boot=400, n_perm=400, workers=1)
+    assert len(result) == 6
+
+    for method, func in [("pearson", stats.pearsonr), ("spearman", stats.spearmanr)]:
+        result = a.associations(
+            table, by="session", method=method, n_boot=200, n_perm=200, workers=1
+        )
+        for row in result.itertuples():
+            temp = table[table["session"] == row.session].dropna(subset=[row.metric])
+            expected = func(temp["updrs_chg"], temp[row.metric])[0]
+            assert np.isclose(row.r, expected)
+            assert row.n == len(temp)
+            assert row.ci_low <= row.r <= row.ci_high
+    assert (result["p_maxt"] >= result["p_perm"]).all()
+    assert (result.loc[result["metric"] == "cad_mean", "p_perm"] < 0.01).all()
+
+
+def test_associations_same_for_any_workers():
+    table = make_table()
+    kwargs = {"by": "session", "n_boot": 1200, "n_perm": 1200, "seed": 3}
+    serial = a.associations(table, workers=1, **kwargs)
+    parallel = a.associations(table, workers=2, **kwargs)
+    pd.testing.assert_frame_equal(serial, parallel)
+
+
+def test_group_differences():
+    table = make_table()
+    groups = a.severity_groups(table["updrs_pre"])
+    result = a.group_differences(
+        table, groups, by="session", n_boot=300, n_perm=300, workers=1
+    )
+    for row in result.itertuples():
+        temp = table[table["session"] == row.session]
+        means = temp.groupby(groups)[row.metric].mean()
+        assert np.isclose(row.diff, means["mild"] - means["severe"])
+        assert row.ci_low <= row.diff <= row.ci_high
+        assert 0 < row.p_perm <= 1
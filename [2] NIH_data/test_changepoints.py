@@ -0,0 +1,53 @@
+"""
+Unit tests for the automatic num_cuts estimate
+"""
+import numpy as np
+import pandas as pd
+import pytest
+import changepoints as cp
+
+
+def make_session(id_sess, warmup, cooldown, seed=0):
+    """
+    50 minutes at 80 rpm, with a ramp up of `warmup` seconds and a ramp down of `cooldown` seconds
+    """
+    rng = np.random.default_rng(seed)
+    cadence = np.full(3000, 80.0)
+    if warmup:
+        cadence[:warmup] = np.linspace(0, 80, warmup)
+    if cooldown:
+        cadence[3000 - cooldown :] = np.linspace(80, 10, cooldown)
+    return pd.DataFrame(
+        {
+            "id_sess": id_sess,
+            "elapsed_sec": np.arange(3000),
+            "cadence": cadence + rng.normal(0, 4, 3000),
+        }
+    )
+
+
+@pytest.fixture()
+def three_sessions():
+    return pd.concat(
+        [
+            make_session("SMB001_day1", 300, 400),
+            make_session("SMB001_day2", 0, 400),
+            make_session("SMB001_day3", 0, 0),
+        ]
+    )
+
+
+def test_pelt():
+    values = np.concatenate([np.zeros(50), np.full(50, 10.0), np.zeros(50)])
+    assert cp.pelt(values, penalty=5) == [50, 100, 150]
+
+
+def test_dfNumCuts(three_sessions):
+    dfn = cp.dfNumCuts(three_sessions)
+
+    # nothing to cut on day3, so it is flagged for review
+    assert dfn.as_dict() == {"SMB001_day1": 2, "SMB001_day2": 1, "SMB001_day3": 0}
+    day1 = dfn.result.iloc[0]
+    # only a rough boundary, segmented regression finds the exact spot
+    assert abs(day1["warmup_end"] - 300) <= 75
+    assert abs(day1["cooldown_start"] - 2600) <= 100
@@ -0,0 +1,19 @@
+"""
+Checks that LTTB keeps the shape of the signal.
+"""
+import numpy as np
+import downsample as ds
+
+
+def test_lttb():
+    x = np.arange(10000, dtype=float)
+    y = np.sin(x / 500)
+    y[4321] = 25  # a spike that every nth point would miss
+
+    x_small, y_small = ds.lttb(x, y, 200)
+
+    assert len(x_small) == 200
+    assert x_small[0] == 0 and x_small[-1] == 9999
+    assert np.all(np.diff(x_small) > 0)
+    assert 25 in y_small
+    assert ds.lttb(x[:50], y[:50], 200)[0].tolist() == x[:50].tolist()
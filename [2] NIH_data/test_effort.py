@@ -0,0 +1,47 @@
+"""
+Checks the time in zone counts against a plain pandas version.
+"""
+import numpy as np
+import pandas as pd
+import pytest
+import effort as ef
+
+
+@pytest.fixture()
+def two_people():
+    rng = np.random.default_rng(1)
+    n = 3000
+    power = rng.uniform(-5, 80, n)
+    power[rng.random(n) < 0.01] = np.nan
+    return pd.DataFrame(
+        {
+            "id_sess": np.repeat(["SMB001_day1", "SMB001_day2", "SMB002_day1"], n // 3),
+            "power": power,
+            "cadence": rng.uniform(0, 100, n),
+        }
+    )
+
+
+def test_effort_tables(two_people):
+    thresholds = {"power": [40, 0, 20], "cadence": [60, 80]}
+    sessions, participants = ef.effort_tables(two_people, thresholds)
+
+    grouped = two_people.groupby("id_sess")
+    for signal, values in thresholds.items():
+        for threshold in values:
+            expected = grouped[signal].apply(lambda s: (s > threshold).mean() * 100)
+            calc_result = sessions.set_index("id_sess")[
+                ef.zone_column(signal, threshold)
+            ]
+            np.testing.assert_allclose(calc_result, expected[calc_result.index])
+    assert sessions["perc_time_in_pos"].equals(sessions["perc_power_gt_0"])
+
+    assert sessions[["day", "id"]].values.tolist() == [
+        ["day1", "SMB001"],
+        ["day2", "SMB001"],
+        ["day1", "SMB002"],
+    ]
+    assert participants["n_sessions"].tolist() == [2, 1]
+    assert participants.loc[0, "perc_cadence_gt_60"] == pytest.approx(
+        sessions.loc[:1, "perc_cadence_gt_60"].mean()
+    )
@@ -0,0 +1,65 @@
+"""
+Unit tests for the entropy engine, compared against the textbook O(N^2) definitions
+"""
+import numpy as np
+import pandas as pd
+import pytest
+import entropy as e
+
+
+def chebyshev_matches(values, m, n_templates, tol):
+    templates = np.array([values[i : i + m] for i in range(n_templates)])
+    dist = np.max(np.abs(templates[:, None] - templates[None]), axis=2)
+    return dist <= tol
+
+
+@pytest.fixture()
+def noisy_sine():
+    rng = np.random.default_rng(0)
+    return np.sin(np.arange(400) / 5) + rng.normal(0, 0.2, 400)
+
+
+def test_sample_entropy(noisy_sine):
+    n, m = len(noisy_sine), 2
+    tol = 0.2 * np.std(noisy_sine)
+    b = (chebyshev_matches(noisy_sine, m, n - m, tol).sum() - (n - m)) / 2
+    a = (chebyshev_matches(noisy_sine, m + 1, n - m, tol).sum() - (n - m)) / 2
+
+    assert e.sample_entropy(noisy_sine) == pytest.approx(-np.log(a / b))
+
+
+def test_approximate_entropy(noisy_sine):
+    n, m = len(noisy_sine), 2
+    tol = 0.2 * np.std(noisy_sine)
+    phi_m = np.mean(
+        np.log(chebyshev_matches(noisy_sine, m, n - m + 1, tol).mean(axis=1))
+    )
+    phi_m1 = np.mean(
+        np.log(chebyshev_matches(noisy_sine, m + 1, n - m, tol).mean(axis=1))
+    )
+
+    assert e.approximate_entropy(noisy_sine) == pytest.approx(phi_m - phi_m1)
+
+
+def test_spectral_entropy():
+    rng = np.random.default_rng(0)
+    assert e.spectral_entropy(np.sin(np.arange(1000) / 5)) < 0.5
+    assert e.spectral_entropy(rng.normal(size=1000)) > 0.9
+
+
+def test_entropy_table(noisy_sine):
+    bike_df = pd.DataFrame(
+        {
+            "id_sess": ["SMB001_day1"] * 200 + ["SMB001_day2"] * 200,
+            "elapsed_sec": list(range(200)) * 2,
+            "hr": noisy_sine + 80,
+            "cadence": noisy_sine * 10 + 60,
+            "power": noisy_sine * 5 + 30,
+        }
+    )
+    calc_result = e.entropy_table(bike_df, workers=1)
+
+    assert calc_result["id_sess"].tolist() == ["SMB001_day1", "SMB001_day2"]
+    assert calc_result.loc[0, "cad_samen"] == pytest.approx(
+        e.sample_entropy(noisy_sine[:200])
+    )
@@ -0,0 +1,104 @@
+"""
+Checks the rolling features against pandas rolling windows, one session at a time.
+"""
+import numpy as np
+import pandas as pd
+import pytest
+import features as ft
+
+
+@pytest.fixture()
+def sessions():
+    rng = np.random.default_rng(2)
+    frames = []
+    for id_sess, n in [
+        ("SMB001_day1", 400),
+        ("SMB001_day2", 250),
+        ("SMB002_day1", 20),
+    ]:
+        df = pd.DataFrame(
+            {
+                "id_sess": id_sess,
+                "elapsed_sec": np.arange(n, dtype=float),
+                "hr": rng.normal(90, 5, n),
+                "cadence": 60 + np.arange(n) * 0.05 + rng.normal(0, 3, n),
+                "power": rng.uniform(0, 50, n),
+            }
+        )
+        df.loc[rng.random(n) < 0.05, "power"] = np.nan
+        frames.append(df)
+    # out of order, feature_table sorts each session by elapsed_sec
+    return pd.concat(frames, ignore_index=True).sample(frac=1, random_state=0)
+
+
+def reference(temp_df, signal, window):
+    temp_df = temp_df.sort_values("elapsed_sec")
+    values = temp_df[signal].reset_index(drop=True)
+    times = temp_df["elapsed_sec"].reset_index(drop=True)
+    roll = values.rolling(window, min_periods=max(int(np.ceil(window / 2)), 2))
+    mean = roll.mean()
+    std = roll.std()
+
+    def slope(rows):
+        x = values[rows.index]
+        t = times[rows.index]
+        ok = x.notna()
+        return np.polyfit(t[ok], x[ok], 1)[0]
+
+    slopes = pd.Series(np.arange(len(values)), dtype=float).rolling(
+        window, min_periods=max(int(np.ceil(window / 2)), 2)
+    )
+    slopes = mean * np.nan if len(values) < window else slopes.apply(slope, raw=False)
+    full = np.arange(len(values)) >= window - 1
+    mean, std, slopes = mean[full], std[full], slopes[full]
+    return {
+        "mean": mean.mean(),
+        "std": std.mean(),
+        "slope": slopes.mean(),
+        "cv": (std / mean).mean(),
+    }
+
+
+def test_feature_table(sessions):
+    table = ft.feature_table(sessions, windows=[10, 60, 300]).set_index("id_sess")
+    assert table["sec"].to_dict() == {
+        "SMB001_day2": 250,
+        "SMB001_day1": 400,
+        "SMB002_day1": 20,
+    }
+    assert table.loc["SMB002_day1", ["id", "day"]].tolist() == ["SMB002", "day1"]
+
+    for id_sess, temp_df in sessions.groupby("id_sess"):
+        for signal, short in ft.SIGNALS.items():
+            for window in [10, 60, 300]:
+                expected = reference(temp_df, signal, window)
+                for stat in ft.ROLL_STATS:
+                    calc_result = table.loc[
+                        id_sess, ft.feature_column(short, stat, window)
+                    ]
+                    if len(temp_df) < window:
+                        assert np.isnan(calc_result)
+                    else:
+                        assert calc_result == pytest.approx(expected[stat], rel=1e-7)
+
+
+def test_session_parts(sessions):
+    # underscore IDs straight from the raw export
+    raw_ids = sessions.assign(
+        id_sess=sessions["id_sess"].str.replace("SMB00", "SMB_00")
+    )
+    raw_ids["id_sess"] = raw_ids["id_sess"] + "_01"
+    table = ft.feature_table(raw_ids, windows=[10]).set_index("id_sess")
+    assert table.loc["SMB_002_day1_01", ["id", "day"]].tolist() == ["SMB002", "day1"]
+
+    # the columns load_and_organize parsed win over id_sess
+    parsed = sessions.assign(
+        my_id=sessions["id_sess"].str[:6], day=sessions["id_sess"].str[7:]
+    )
+    parsed["my_id"] = parsed["my_id"].astype("category")
+    table = ft.feature_table(parsed, windows=[10]).set_index("id_sess")
+    assert table[["id", "day"]].to_dict("index") == {
+        "SMB001_day2": {"id": "SMB001", "day": "day2"},
+        "SMB001_day1": {"id": "SMB001", "day": "day1"},
+        "SMB002_day1": {"id": "SMB002", "day": "day1"},
+    }
@@ -0,0 +1,23 @@
+"""
+Checks that events are recorded and that the buffer stays bounded.
+"""
+from collections import deque
+import pandas as pd
+import instrument
+
+
+def test_events_are_capped(monkeypatch):
+    monkeypatch.setattr(instrument, "EVENTS", deque(maxlen=3))
+
+    @instrument.timed("double")
+    def double(df, id_sess=None):
+        return pd.concat([df, df])
+
+    for k in range(5):
+        double(pd.DataFrame({"x": [1, 2]}), id_sess=f"SMB00{k}_day1")
+
+    events = instrument.to_frame()
+    # only the last 3 calls are kept
+    assert events["id_sess"].tolist() == ["SMB002_day1", "SMB003_day1", "SMB004_day1"]
+    assert events["rows_in"].tolist() == [2, 2, 2]
+    assert events["rows_out"].tolist() == [4, 4, 4]
@@ -0,0 +1,57 @@
+"""
+Checks that the online filter keeps the same rows as the batch cleaning in dfBike.
+"""
+import io
+import numpy as np
+import pandas as pd
+import pytest
+import raw_processing as r
+import live
+
+
+def make_session(seed):
+    """
+    Cadence with a flat stretch in the warm up, spikes, missing values and a long idle tail
+    """
+    rng = np.random.default_rng(seed)
+    n = int(rng.integers(2500, 3500))
+    cadence = 80 + rng.normal(0, 5, n)
+    cadence[100:400] = 40
+    tail = int(rng.integers(0, 700))
+    cadence[n - tail :] = rng.choice([0.0, 0.001])
+    cadence[rng.integers(0, n, 5)] = 200
+    cadence[rng.integers(0, n, 20)] = np.nan
+    return cadence
+
+
+@pytest.mark.parametrize("seed", range(6))
+def test_online_filter_matches_batch(seed):
+    cadence = make_session(seed)
+    df = pd.DataFrame(
+        {
+            "id_sess": "SMB001_day1",
+            "elapsed_sec": np.arange(len(cadence)),
+            "cadence": cadence,
+        }
+    )
+    s = r.dfBike.__new__(r.dfBike)
+    expected = s.remove_extreme_cad(s.find_longest_zeroes(df), "SMB001_day1")
+
+    statuses = list(live.filter_rows(({"cadence": v} for v in cadence), "SMB001_day1"))
+    stop = statuses[-1]["stop"]
+    calc_result = [
+        st["elapsed_sec"]
+        for st in statuses
+        if st["elapsed_sec"] < stop and not st["extreme"]
+    ]
+    assert calc_result == expected["elapsed_sec"].tolist()
+
+
+def test_csv_rows():
+    lines = io.StringIO(
+        "Date,Time,Cadence\n10/19/2012,14:08:19,80.5\n10/19/2012,14:08:20,\n"
+    )
+    rows = list(live.filter_rows(live.csv_rows(lines)))
+
+    assert [row["cadence"] for row in rows] == ["80.5", ""]
+    assert [row["extreme"] for row in rows] == [False, True]
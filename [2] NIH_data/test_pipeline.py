@@ -0,0 +1,151 @@
+"""
+Checks that the pipeline only recomputes the nodes downstream of a change.
+"""
+import numpy as np
+import pandas as pd
+import pipeline as pl
+import studies as st
+
+
+def make_pipeline(cache_dir, calls):
+    def source(n=3):
+        calls.append("source")
+        return pd.DataFrame({"x": range(n)})
+
+    def other():
+        calls.append("other")
+        return pd.DataFrame({"y": [10]})
+
+    def total(df, other_df, scale=1):
+        calls.append("total")
+        return pd.DataFrame({"total": [df["x"].sum() * scale + other_df["y"].sum()]})
+
+    p = pl.pipeline(cache_dir)
+    p.add("source", source, params={"n": 3})
+    p.add("other", other)
+    p.add("total", total, inputs=["source", "other"])
+    return p
+
+
+def test_run_memoizes(tmp_path):
+    calls = []
+    p = make_pipeline(str(tmp_path), calls)
+    results = p.run()
+    assert results["total"]["total"].tolist() == [13]
+    assert sorted(calls) == ["other", "source", "total"]
+
+    calls.clear()
+    p.run()
+    assert calls == []
+
+    # a new pipeline over the same folder reads the outputs back
+    calls.clear()
+    assert make_pipeline(str(tmp_path), calls).run()["total"]["total"].tolist() == [13]
+    assert calls == []
+
+
+def test_run_recomputes_downstream(tmp_path):
+    calls = []
+    p = make_pipeline(str(tmp_path), calls)
+    p.run()
+
+    calls.clear()
+    p.set("source", n=5)
+    assert p.run(["total"])["total"]["total"].tolist() == [20]
+    assert calls == ["source", "total"]
+
+    calls.clear()
+    p.set("total", scale=2)
+    assert p.run(["total"])["total"]["total"].tolist() == [30]
+    assert calls == ["total"]
+
+
+def test_run_skips_memoized_inputs(tmp_path):
+    calls = []
+    p = make_pipeline(str(tmp_path), calls)
+    p.run()
+    # total is memoized, so source isn't needed even though it's gone
+    p.memo.clear()
+    for path in tmp_path.glob("source-*"):
+        path.unlink()
+
+    calls.clear()
+    assert list(p.run(["total"])) == ["total"]
+    assert calls == []
+
+
+def test_run_only_needed(tmp_path):
+    calls = []
+    results = make_pipeline(None, calls).run(["other"])
+    assert list(results) == ["other"]
+    assert calls == ["other"]
+
+
+def test_value_hash():
+    df = pd.DataFrame({"x": [1, 2]})
+    assert pl.value_hash(df) == pl.value_hash(df.copy())
+    assert pl.value_hash(df) != pl.value_hash(df.assign(x=[1, 3]))
+    assert pl.value_hash({"a": 1, "b": (0, 150)}) == pl.value_hash(
+        {"b": (0, 150), "a": 1}
+    )
+    assert pl.value_hash({"cad_limits": (0, 150)}) != pl.value_hash(
+        {"cad_limits": (0, 120)}
+    )
+
+
+def test_bike_from_dataframe(tmp_path):
+    rng = np.random.default_rng(0)
+    n = 600
+    stamps = pd.Timestamp("2012-10-19 14:00:00") + pd.to_timedelta(
+        np.arange(n), unit="s"
+    )
+    raw = pd.DataFrame(
+        {
+            "Date": stamps.strftime("%m/%d/%Y"),
+            "Time": stamps.strftime("%H:%M:%S"),
+            "Millitm": 0,
+            "HR": rng.integers(60, 120, n),
+            "Cadence": np.r_[80 + rng.normal(0, 5, n - 100), np.zeros(100)],
+            "Power": np.abs(rng.normal(30, 20, n)),
+            "ID": "SMB_001_day1_01",
+        }
+    )
+    p = pl.default_pipeline(str(tmp_path), bike={"use_this": raw, "workers": 1})
+    key = p.keys(["bike"])["bike"]
+    assert p.run(["bike"])["bike"]["id_sess"].unique().tolist() == ["SMB001_day1"]
+
+    # the frame's contents are part of the key
+    p.set("bike", use_this=raw.assign(Power=raw["Power"] + 1))
+    assert p.keys(["bike"])["bike"] != key
+
+
+def test_default_keys(tmp_path):
+    p = pl.default_pipeline(str(tmp_path))
+    names = list(p.nodes)
+    keys = p.keys(names)
+    assert p.nodes["entropy"]["inputs"] == ["bike", "updrs"]
+
+    # another study changes every key
+    static = {**st.NIH_R21, "keep_group": "static"}
+    other = pl.default_pipeline(str(tmp_path), study=static).keys(names)
+    assert all(other[name] != keys[name] for name in names)
+
+    # a spreadsheet path only changes its node and the nodes downstream
+    other = pl.default_pipeline(
+        str(tmp_path), updrs={"path": str(tmp_path / "updrs.xlsx")}
+    ).keys(names)
+    assert [name for name in names if other[name] != keys[name]] == [
+        "updrs",
+        "demos",
+        "entropy",
+    ]
+
+    other = pl.default_pipeline(
+        str(tmp_path), timeline_config={"max_gap_sec": 10}
+    ).keys(names)
+    assert [name for name in names if other[name] != keys[name]] == [
+        "bike",
+        "demos",
+        "entropy",
+        "features",
+    ]
@@ -1,10 +1,12 @@
 """
 Unit test to compare new scripts with the results gotten from their equivalent notebooks.
 """
+import numpy as np
 import pandas as pd
 import pytest
 import dynbike_helper_functions.helpers as h
 import raw_processing as r
+import instrument
 
 dba = h.dbConnect("sqlite:///nih_ntbk.db")
 
@@ -64,6 +66,21 @@ def ntbk_bike_sample_answ():
     return sample_df
 
 
+@pytest.fixture()
+def flat_tail_sessions():
+    """
+    Two sessions: one ramps up for 2500 seconds and then sits still for 300, the other never sits still
+    """
+    ramp = [float(i) for i in range(2800)]
+    flat = ramp[:2500] + [ramp[2499]] * 300
+    sample_dict = {
+        "id_sess": ["SMB001_day1"] * 2800 + ["SMB001_day2"] * 2800,
+        "elapsed_sec": list(range(2800)) * 2,
+        "cadence": flat + ramp,
+    }
+    return pd.DataFrame.from_dict(sample_dict)
+
+
 @pytest.fixture()
 def ntbk_demos():
     """
@@ -105,6 +122,88 @@ def test_dfBike(ntbk_bike_sample_data, ntbk_bike_sample_answ):
     assert all(calc_result == ntbk_bike_sample_answ)
 
 
+def test_load_and_organize_compact(ntbk_bike_sample_data):
+    compat = r.dfBike.load_and_organize(ntbk_bike_sample_data, compat=True)
+    compact = r.dfBike.load_and_organize(ntbk_bike_sample_data)
+
+    assert compact["id_sess"].dtype == "category"
+    assert compact["unknown"].dtype == "int8"
+    # the signals are compacted after trimming, see dfBike.clean_sessions
+    assert compact["cadence"].dtype == "float64"
+    pd.testing.assert_frame_equal(
+        compact.astype(compat.dtypes.to_dict()), compat, check_exact=False, rtol=1e-6
+    )
+
+
+def test_compact_cuts_like_compat():
+    """
+    The tail sits still from 2100, except 2200 is 0.5000007 higher. As float64 that 60 second
+    diff rounds to 1 and the longest run starts at 2261, as float32 it rounds to 0.
+    """
+    n = 3000
+    stamps = pd.Timestamp("2012-10-19 14:00:00") + pd.to_timedelta(np.arange(n), unit="s")
+    cadence = 80 + np.random.default_rng(0).normal(0, 5, n)
+    cadence[2100:] = 81.65218538091693
+    cadence[2200] = 82.15218609801248
+    raw = pd.DataFrame(
+        {
+            "Date": stamps.strftime("%m/%d/%Y"),
+            "Time": stamps.strftime("%H:%M:%S"),
+            "Millitm": 0,
+            "HR": 90,
+            "Cadence": cadence,
+            "Power": 30.0,
+            "ID": "SMB_001_day1_01",
+        }
+    )
+    compat = r.dfBike(raw, compat=True).result
+    compact = r.dfBike(raw).result
+
+    assert len(compat) == len(compact) == 2261
+    assert (compat["cadence_rounded"] == compact["cadence_rounded"]).all()
+
+
+def test_find_longest_zeroes(flat_tail_sessions):
+    s = r.dfBike.__new__(r.dfBike)
+    calc_result = s.find_longest_zeroes(flat_tail_sessions)
+
+    # the 60 second diff is zero from 2559 on, so day1 is cut there and day2 is untouched
+    assert calc_result.groupby("id_sess").size().to_dict() == {
+        "SMB001_day1": 2559,
+        "SMB001_day2": 2800,
+    }
+    cuts = s.zero_runs[s.zero_runs["cut"]]
+    assert cuts[["id_sess", "start", "length"]].values.tolist() == [
+        ["SMB001_day1", 2559, 241]
+    ]
+
+
+def test_find_longest_zeroes_events(flat_tail_sessions):
+    instrument.clear()
+    s = r.dfBike.__new__(r.dfBike)
+    s.find_longest_zeroes(flat_tail_sessions)
+
+    events = instrument.to_frame().set_index("id_sess")
+    assert events.loc["SMB001_day1", ["rows_in", "rows_out"]].tolist() == [2800, 2559]
+    assert instrument.summary().loc["find_longest_zeroes", "rows_out"] == 2559 + 2800
+
+
+def test_upsert_sessions(tmp_path, flat_tail_sessions):
+    db = r.dbInfo(f"sqlite:///{tmp_path / 'test.db'}")
+    db.upsert_sessions(flat_tail_sessions, "bike_data", {"SMB001_day1": "a", "SMB001_day2": "b"})
+
+    # day1 changed and lost rows, day2 is untouched
+    day1 = flat_tail_sessions[flat_tail_sessions["id_sess"] == "SMB001_day1"].iloc[:100]
+    db.upsert_sessions(day1, "bike_data", {"SMB001_day1": "c"})
+
+    calc_result = pd.read_sql("SELECT * FROM bike_data", db.engine)
+    assert calc_result.groupby("id_sess").size().to_dict() == {
+        "SMB001_day1": 100,
+        "SMB001_day2": 2800,
+    }
+    assert db.load_manifest("bike_data") == {"SMB001_day1": "c", "SMB001_day2": "b"}
+
+
 def test_dfDemos(ntbk_bike_sample_data, ntbk_demos):
     s = r.dfDemos(ntbk_bike_sample_data, save_table=False)
     calc_result = s.demos
@@ -0,0 +1,74 @@
+"""
+Checks that the segmentation report only draws the panels of sessions that changed.
+"""
+import os
+import re
+import numpy as np
+import pandas as pd
+import cache
+import segmenter as s
+import segment_report as sr
+
+
+def make_sessions(n_sessions=3, seed=0):
+    """
+    Sessions with a warm up, a main session and a cool down
+    """
+    rng = np.random.default_rng(seed)
+    frames = []
+    for k in range(n_sessions):
+        elapsed_sec = np.arange(3000)
+        cadence = np.where(
+            elapsed_sec < 300,
+            elapsed_sec / 300 * 80,
+            np.where(elapsed_sec < 2600, 80, 80 - (elapsed_sec - 2600) / 400 * 80),
+        )
+        frames.append(
+            pd.DataFrame(
+                {
+                    "id_sess": f"SMB00{k}_day1",
+                    "elapsed_sec": elapsed_sec,
+                    "cadence": cadence + rng.normal(0, 4, 3000),
+                }
+            )
+        )
+    return pd.concat(frames, ignore_index=True)
+
+
+def test_segment_report(tmp_path, capsys):
+    bike_df = make_sessions()
+    cuts = {id_sess: 2 for id_sess in bike_df["id_sess"].unique()}
+    breakpoints = s.dfMainSessions(bike_df, cuts, workers=1).breakpoints
+    panel_dir = str(tmp_path / "panels")
+
+    pdf = sr.segment_report(
+        bike_df, breakpoints, str(tmp_path / "report.pdf"), 1, panel_dir=panel_dir
+    )
+    assert "3 of 3 panels drawn" in capsys.readouterr().out
+    with open(pdf, "rb") as f:
+        assert len(re.findall(rb"/Type /Page\b(?!s)", f.read())) == 3
+    assert len(list((tmp_path / "panels").glob("*.png"))) == 3
+
+    # only the session whose data changed is drawn again
+    bike_df.loc[bike_df["id_sess"] == "SMB001_day1", "cadence"] += 1
+    page = sr.segment_report(
+        bike_df, breakpoints, str(tmp_path / "report.html"), 1, panel_dir=panel_dir
+    )
+    assert "1 of 3 panels drawn" in capsys.readouterr().out
+    text = open(page).read()
+    assert all(f">{id_sess}<" in text for id_sess in cuts)
+    assert text.count("<img") == 3
+
+
+def test_panels_evicted(tmp_path):
+    # the panels are bounded together with the parsed spreadsheets
+    panels = tmp_path / "panels"
+    panels.mkdir()
+    for k, path in enumerate(
+        [panels / "old.png", tmp_path / "updrs.parquet", panels / "new.png"]
+    ):
+        path.write_bytes(b"x" * 100)
+        os.utime(path, (1000 + k, 1000 + k))
+
+    cache.evict_cache(str(tmp_path), max_bytes=250)
+    assert sorted(p.name for p in tmp_path.rglob("*.*")) == ["new.png", "updrs.parquet"]
@@ -0,0 +1,50 @@
+"""
+Unit tests for the python version of segment_cutter.r
+"""
+import numpy as np
+import pandas as pd
+import pytest
+import segmenter as s
+
+
+@pytest.fixture()
+def warm_main_cool():
+    """
+    5 minute warm up, ~38 minute main session at 80 rpm, 6 minute cool down
+    """
+    rng = np.random.default_rng(0)
+    elapsed_sec = np.arange(3000)
+    cadence = np.where(
+        elapsed_sec < 300,
+        elapsed_sec / 300 * 80,
+        np.where(elapsed_sec < 2600, 80, 80 - (elapsed_sec - 2600) / 400 * 80),
+    )
+    cadence = cadence + rng.normal(0, 4, 3000)
+    return pd.DataFrame(
+        {"id_sess": "SMB001_day1", "elapsed_sec": elapsed_sec, "cadence": cadence}
+    )
+
+
+def test_fit_breakpoints(warm_main_cool):
+    fit = s.fit_breakpoints(warm_main_cool["elapsed_sec"], warm_main_cool["cadence"], 2)
+
+    assert np.allclose(fit["psi"], [300, 2600], atol=10)
+    assert all(fit["lower"] < fit["psi"]) and all(fit["psi"] < fit["upper"])
+
+
+def test_fit_breakpoints_any_number(warm_main_cool):
+    for n_breaks in [1, 3, 4]:
+        fit = s.fit_breakpoints(
+            warm_main_cool["elapsed_sec"], warm_main_cool["cadence"], n_breaks
+        )
+        assert len(fit["psi"]) == n_breaks
+
+
+def test_dfMainSessions(warm_main_cool):
+    dfm = s.dfMainSessions(warm_main_cool, {"SMB001_day1": 2}, workers=1)
+    calc_result = dfm.result
+
+    assert abs(calc_result["elapsed_sec"].min() - 300) <= 10
+    assert abs(calc_result["elapsed_sec"].max() - 2600) <= 10
+    assert calc_result["sane"].all()
+    assert len(dfm.breakpoints) == 2
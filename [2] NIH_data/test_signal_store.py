@@ -0,0 +1,39 @@
+"""
+Checks that the signal store gives back the same sessions it was given.
+"""
+import numpy as np
+import pandas as pd
+import pytest
+import signal_store as ss
+
+
+@pytest.fixture()
+def two_sessions():
+    rng = np.random.default_rng(0)
+    return pd.DataFrame(
+        {
+            "id_sess": ["SMB001_day1"] * 5 + ["SMB001_day2"] * 3,
+            "elapsed_sec": [4, 3, 2, 1, 0, 0, 1, 2],
+            "hr": rng.normal(90, 5, 8),
+            "power": rng.normal(40, 5, 8),
+            "cadence": rng.normal(80, 5, 8),
+        }
+    )
+
+
+def test_signal_store(tmp_path, two_sessions):
+    path = str(tmp_path / "signal_store")
+    ss.write_store(two_sessions, path)
+    store = ss.signalStore(path)
+
+    assert store.sessions == ["SMB001_day1", "SMB001_day2"]
+    assert store.bounds.tolist() == [0, 5, 8]
+    cadence = store.session("SMB001_day1")["cadence"]
+    assert np.shares_memory(cadence, store.arrays["cadence"])
+    # sorted by elapsed_sec on the way in
+    expected = two_sessions.iloc[4::-1]["cadence"].to_numpy(dtype=np.float32)
+    np.testing.assert_array_equal(cadence, expected)
+
+    calc_result = dict(iter(store))
+    assert calc_result["SMB001_day2"]["elapsed_sec"].tolist() == [0, 1, 2]
+    assert (calc_result["SMB001_day2"]["id_sess"] == "SMB001_day2").all()
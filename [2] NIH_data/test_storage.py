@@ -0,0 +1,146 @@
+"""
+Checks saving and loading the processed tables.
+"""
+import os
+import numpy as np
+import pandas as pd
+import pytest
+import sqlalchemy as sq
+import raw_processing as r
+import storage
+from storage import dbInfo
+
+
+@pytest.fixture()
+def db(tmp_path):
+    return dbInfo(f"sqlite:///{tmp_path / 'test.db'}")
+
+
+@pytest.fixture()
+def bike():
+    n = 5
+    return pd.DataFrame(
+        {
+            "datetime": pd.date_range("2012-10-19 14:00:00", periods=2 * n, freq="s"),
+            "elapsed_sec": list(range(n)) * 2,
+            "id_sess": pd.Categorical(["SMB001_day1"] * n + ["SMB002_day1"] * n),
+            "cadence": np.linspace(60, 90, 2 * n),
+        }
+    )
+
+
+def make_raw(ids, n=600):
+    """
+    Raw bike rows of each ID, the same shape as the combined export
+    """
+    rng = np.random.default_rng(0)
+    frames = []
+    for k, raw_id in enumerate(ids):
+        stamps = pd.Timestamp("2012-10-19 14:00:00") + pd.to_timedelta(
+            np.arange(n) + k * 86400, unit="s"
+        )
+        cadence = 80 + rng.normal(0, 5, n)
+        cadence[-100:] = 0
+        frames.append(
+            pd.DataFrame(
+                {
+                    "Date": stamps.strftime("%m/%d/%Y"),
+                    "Time": stamps.strftime("%H:%M:%S"),
+                    "Millitm": 0,
+                    "HR": rng.integers(60, 120, n),
+                    "Cadence": cadence,
+                    "Power": np.abs(rng.normal(30, 20, n)),
+                    "ID": raw_id,
+                }
+            )
+        )
+    return pd.concat(frames, ignore_index=True)
+
+
+def test_full_save_clears_manifest(tmp_path, monkeypatch):
+    # dfBike saves to the default database
+    url = f"sqlite:///{tmp_path / 'nih_scripts.db'}"
+    monkeypatch.setattr(storage, "DB_URL", url)
+    both = make_raw(["SMB_001_day1_01", "SMB_002_day1_01"])
+    one = both[both["ID"] == "SMB_001_day1_01"]
+
+    r.dfBike(both, save_table=True, incremental=True)
+    r.dfBike(one, save_table=True)
+    assert dbInfo(url).load_manifest("bike_data") == {}
+
+    # the incremental run can't trust fingerprints of sessions the full save dropped
+    dfb = r.dfBike(both, save_table=True, incremental=True)
+    assert sorted(dfb.result["id_sess"].unique()) == ["SMB001_day1", "SMB002_day1"]
+    assert dbInfo(url).list_sessions("bike_data") == ["SMB001_day1", "SMB002_day1"]
+
+
+def test_round_trip(db, bike):
+    db.save_table(bike, "bike_data")
+    calc_result = db.load_table("bike_data")
+
+    assert calc_result["datetime"].tolist() == bike["datetime"].tolist()
+    assert calc_result["id_sess"].tolist() == bike["id_sess"].tolist()
+    np.testing.assert_array_equal(calc_result["cadence"], bike["cadence"])
+    assert calc_result["elapsed_sec"].tolist() == bike["elapsed_sec"].tolist()
+
+
+def test_load_where(db, bike):
+    db.save_table(bike, "bike_data")
+    one = db.load_table("bike_data", where={"id_sess": "SMB002_day1"})
+    assert one["id_sess"].unique().tolist() == ["SMB002_day1"]
+    assert len(one) == 5
+
+    some = db.load_table(
+        "bike_data",
+        columns=["id_sess", "elapsed_sec"],
+        where={"id_sess": ["SMB001_day1", "SMB002_day1"], "elapsed_sec": [0, 4]},
+    )
+    assert list(some.columns) == ["id_sess", "elapsed_sec"]
+    assert some.values.tolist() == [
+        ["SMB001_day1", 0],
+        ["SMB001_day1", 4],
+        ["SMB002_day1", 0],
+        ["SMB002_day1", 4],
+    ]
+
+
+def test_indexes(db, bike):
+    db.save_table(bike, "bike_data")
+    indexes = sq.inspect(db.engine).get_indexes("bike_data")
+    assert [ix["column_names"] for ix in indexes] == [["id_sess", "elapsed_sec"]]
+
+
+def test_failed_save_rolls_back(db, bike):
+    db.save_table(bike, "bike_data")
+    # sqlite can't store a dict, the insert fails after the old table was dropped
+    broken = bike.assign(cadence=[{"rpm": 80}] * len(bike))
+    with pytest.raises(Exception):
+        db.save_table(broken, "bike_data")
+    with pytest.raises(Exception):
+        db.save_frames([bike, broken], "bike_data")
+
+    calc_result = db.load_table("bike_data")
+    np.testing.assert_array_equal(calc_result["cadence"], bike["cadence"])
+
+
+def test_engine_follows_cwd(tmp_path, monkeypatch, bike):
+    # the same relative url is a different database in each folder
+    for folder, rows in [("a", 3), ("b", 10)]:
+        (tmp_path / folder).mkdir()
+        monkeypatch.chdir(tmp_path / folder)
+        dbInfo("sqlite:///rel.db").save_table(bike.iloc[:rows], "bike_data")
+
+    for folder, rows in [("a", 3), ("b", 10)]:
+        db = dbInfo(f"sqlite:///{tmp_path / folder / 'rel.db'}")
+        assert len(db.load_table("bike_data")) == rows
+
+
+def test_fingerprints_settings(bike):
+    bounds = np.array([0, 5, 10])
+    plain = r.dfBike.cleaner().session_fingerprints(bike, bounds)
+    assert plain == r.dfBike.cleaner().session_fingerprints(bike, bounds)
+    assert plain != r.dfBike.cleaner(compat=True).session_fingerprints(bike, bounds)
+
+    tms = {"name": "tms_test", "id_patterns": {"my_id": r"^(TMS\d\d)"}}
+    other = r.dfBike.cleaner(study=tms)
+    assert plain != other.session_fingerprints(bike, bounds)
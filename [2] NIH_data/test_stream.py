@@ -0,0 +1,85 @@
+"""
+Checks that the streamed sessions match the all-at-once versions.
+"""
+import os
+import numpy as np
+import pandas as pd
+import pytest
+import raw_processing as r
+import entropy as ent
+import stream
+from storage import dbInfo
+
+
+@pytest.fixture()
+def raw_folder(tmp_path, monkeypatch):
+    """
+    Four raw exports of three sessions, SMB001_day1 was restarted so it has two files
+    """
+    monkeypatch.chdir(tmp_path)
+    rng = np.random.default_rng(0)
+    folder = tmp_path / "raw_bike_files"
+    folder.mkdir()
+    for name, n in [
+        ("SMB_001_day1_01", 300),
+        ("SMB_001_day1_02", 2500),
+        ("SMB_001_day2_01", 2600),
+        ("SMB_002_day1_04", 2400),
+    ]:
+        stamps = pd.Timestamp("2012-10-19 14:00:00") + pd.to_timedelta(
+            np.arange(n), unit="s"
+        )
+        cadence = 80 + rng.normal(0, 5, n)
+        cadence[-400:] = 0
+        pd.DataFrame(
+            {
+                "Date": stamps.strftime("%m/%d/%Y"),
+                "Time": stamps.strftime("%H:%M:%S"),
+                "Millitm": 0,
+                "HR": rng.integers(60, 120, n),
+                "Cadence": cadence,
+                "Power": np.abs(rng.normal(30, 20, n)),
+            }
+        ).to_csv(folder / f"{name}.csv", index=False)
+    return str(folder)
+
+
+def test_iter_raw_sessions(raw_folder):
+    expected = r.dfBike(use_this=raw_folder, workers=1).result
+    sessions = list(stream.iter_raw_sessions(raw_folder))
+
+    assert [k for k, _ in sessions] == ["SMB001_day1", "SMB001_day2", "SMB002_day1"]
+    # each session has its own categories, so compare the values
+    calc_result = pd.concat([df for _, df in sessions], ignore_index=True)
+    pd.testing.assert_frame_equal(
+        calc_result, expected.astype(calc_result.dtypes.to_dict())
+    )
+
+
+def test_iter_raw_sessions_resample(raw_folder):
+    # a 20 second gap in the middle of SMB001_day2
+    path = os.path.join(raw_folder, "SMB_001_day2_01.csv")
+    raw = pd.read_csv(path)
+    raw.drop(range(1000, 1020)).to_csv(path, index=False)
+
+    expected = r.dfBike(use_this=raw_folder, workers=1, resample=True).result
+    sessions = list(stream.iter_raw_sessions(raw_folder, resample=True))
+    calc_result = pd.concat([df for _, df in sessions], ignore_index=True)
+    assert "filled" in calc_result.columns
+    pd.testing.assert_frame_equal(
+        calc_result, expected.astype(calc_result.dtypes.to_dict())
+    )
+
+
+def test_iter_db_sessions(raw_folder, tmp_path):
+    url = f"sqlite:///{tmp_path / 'test.db'}"
+    db = dbInfo(url)
+    db.save_frames((df for _, df in stream.iter_raw_sessions(raw_folder)), "bike_data")
+    expected = r.dfBike(use_this=raw_folder, workers=1).result
+
+    sessions = dict(stream.iter_db_sessions(url=url))
+    assert list(sessions) == ["SMB001_day1", "SMB001_day2", "SMB002_day1"]
+    assert len(sessions["SMB001_day1"]) == (expected["id_sess"] == "SMB001_day1").sum()
+
+    calc_result = stream.stream_entropy(stream.iter_db_sessions(url=url), workers=1)
+    pd.testing.assert_frame_equal(calc_result, ent.entropy_table(expected, workers=1))
@@ -0,0 +1,120 @@
+"""
+Checks that study adapters split IDs by their own grammar, and that several studies
+are ingested into one store per study.
+"""
+import numpy as np
+import pandas as pd
+import pytest
+import cache
+import raw_processing as r
+import signal_store as ss
+import studies as st
+
+TMS = {
+    "name": "tms_test",
+    "id_patterns": {"my_id": r"^(TMS\d\d)", "day": r"(sess\d+)", "unknown": None},
+}
+
+
+def make_raw(ids, n=120):
+    """
+    A raw bike export with one session per ID
+    """
+    frames = []
+    for k, id_ in enumerate(ids):
+        ts = pd.Timestamp("2012-10-19 14:00:00") + pd.to_timedelta(
+            np.arange(n) + 86400 * k, unit="s"
+        )
+        frames.append(
+            pd.DataFrame(
+                {
+                    "Date": ts.strftime("%m/%d/%Y"),
+                    "Time": ts.strftime("%H:%M:%S"),
+                    "Millitm": 531,
+                    "HR": 80,
+                    "Cadence": 70.0 + np.arange(n) % 5,
+                    "Power": 30.0,
+                    "ID": id_,
+                }
+            )
+        )
+    return pd.concat(frames, ignore_index=True)
+
+
+def test_parse_ids():
+    parts = st.parse_ids(pd.Series(["SMB_024_day1_02", "SMB_101_day3_11"]))
+    assert parts["my_id"].tolist() == ["SMB024", "SMB101"]
+    assert parts["day"].tolist() == ["day1", "day3"]
+    assert parts["unknown"].tolist() == ["02", "11"]
+
+    parts = st.parse_ids(pd.Series(["TMS03_sess12"]), TMS)
+    assert parts.iloc[0].tolist() == ["TMS03", "sess12", "0"]
+
+
+def test_load_and_organize_study():
+    df = r.dfBike.load_and_organize(make_raw(["TMS03_sess1", "TMS03_sess2"]), study=TMS)
+    assert df["id_sess"].unique().tolist() == ["TMS03_sess1", "TMS03_sess2"]
+    assert (df["unknown"] == 0).all()
+
+
+def test_session_parts_study():
+    # TMS IDs have no _day, my_id and day come from the study's grammar
+    raw = make_raw(["TMS03_sess1", "TMS03_sess2"])
+    df = r.dfBike(raw, workers=1, study=TMS).result
+    entropy = r.dfEntropy(bike_df=df, workers=1, study=TMS).result
+    assert entropy["subject"].tolist() == ["TMS03", "TMS03"]
+    assert entropy["session"].tolist() == [1, 2]
+
+    sessions, _ = r.ef.effort_tables(df)
+    assert sessions[["id", "day"]].values.tolist() == [
+        ["TMS03", "sess1"],
+        ["TMS03", "sess2"],
+    ]
+
+
+def test_combined_file_cache(tmp_path, monkeypatch):
+    # one combined export read by two studies with different ID grammars
+    monkeypatch.chdir(tmp_path)
+    make_raw(["TMS03_sess1", "TMS03_sess2"]).to_excel("combined.xlsx", index=False)
+    by_sess = {**TMS, "combined_file": "combined.xlsx"}
+    by_site = {
+        **by_sess,
+        "name": "tms_site",
+        "id_patterns": {**TMS["id_patterns"], "my_id": r"^(TMS\d)"},
+    }
+
+    df = r.dfBike(workers=1, study=by_sess).result
+    assert df["id_sess"].unique().tolist() == ["TMS03_sess1", "TMS03_sess2"]
+    df = r.dfBike(workers=1, study=by_site).result
+    assert df["id_sess"].unique().tolist() == ["TMS0_sess1", "TMS0_sess2"]
+
+
+def test_get_study():
+    with pytest.raises(KeyError):
+        st.get_study("not_a_study")
+    with pytest.raises(ValueError):
+        st.sheet_layout(TMS, "updrs")
+    assert st.get_study(None)["name"] == st.DEFAULT_STUDY
+
+
+def test_ingest_studies(tmp_path, monkeypatch):
+    monkeypatch.setattr(cache, "ENABLED", False)
+    nih = tmp_path / "nih"
+    tms = tmp_path / "tms"
+    nih.mkdir()
+    tms.mkdir()
+    make_raw(["SMB_024_day1_02"]).to_csv(nih / "SMB_024_day1_02.csv", index=False)
+    make_raw(["SMB_024_day2_03"]).to_csv(nih / "SMB_024_day2_03.csv", index=False)
+    make_raw(["TMS03_sess1"]).to_csv(tms / "TMS03_sess1.csv", index=False)
+
+    studies = [
+        {**st.NIH_R21, "raw_folder": str(nih)},
+        {**TMS, "raw_folder": str(tms)},
+    ]
+    st.ingest_studies(studies, path=str(tmp_path / "store"), workers=1)
+    stores = ss.open_studies(str(tmp_path / "store"))
+
+    assert sorted(stores) == ["nih_r21", "tms_test"]
+    assert stores["nih_r21"].sessions == ["SMB024_day1", "SMB024_day2"]
+    assert stores["tms_test"].sessions == ["TMS03_sess1"]
+    assert len(stores["tms_test"].session("TMS03_sess1")["cadence"]) == 120
@@ -0,0 +1,81 @@
+"""
+Checks the gap report and the 1 Hz resampling of timeline.py.
+"""
+import numpy as np
+import pandas as pd
+import zero_runs as zr
+import raw_processing as r
+import timeline as tl
+
+
+def make_sessions():
+    """
+    Two sessions: one with a 3 s gap, a repeat and a 10 s gap, one logged every second
+    """
+    offsets_a = [0, 1, 2, 5, 6, 6, 7, 17, 18]
+    offsets_b = [0, 1, 2, 3]
+    start = pd.Timestamp("2012-10-19 14:08:19")
+    df = pd.DataFrame(
+        {
+            "id_sess": ["SMB001_day1"] * len(offsets_a)
+            + ["SMB002_day1"] * len(offsets_b),
+            "datetime": [
+                start + pd.Timedelta(seconds=s) for s in offsets_a + offsets_b
+            ],
+            "cadence": np.arange(len(offsets_a) + len(offsets_b), dtype=float),
+            "unknown": np.arange(len(offsets_a) + len(offsets_b)),
+        }
+    )
+    bounds = zr.session_bounds([len(offsets_a), len(offsets_b)])
+    return df, bounds
+
+
+def test_find_gaps():
+    df, bounds = make_sessions()
+    seconds = tl.elapsed_seconds(df["datetime"], bounds)
+    gaps = tl.find_gaps(seconds, bounds)
+
+    assert gaps["kind"].tolist() == ["gap", "repeat", "gap"]
+    assert gaps["row"].tolist() == [3, 5, 7]
+    assert gaps["missing"].tolist() == [2, 0, 9]
+    assert (gaps["session"] == 0).all()
+
+    summary = tl.gap_summary(gaps, ["SMB001_day1", "SMB002_day1"])
+    assert summary["n_gaps"].tolist() == [2, 0]
+    assert summary["missing_sec"].tolist() == [11, 0]
+    assert summary["longest_gap"].tolist() == [9, 0]
+    assert summary["n_repeats"].tolist() == [1, 0]
+
+
+def test_find_gaps_backwards():
+    bounds = zr.session_bounds([4])
+    gaps = tl.find_gaps(np.array([0.0, 1.0, 0.0, 1.0]), bounds)
+
+    assert gaps["kind"].tolist() == ["backwards"]
+
+
+def test_resample():
+    df, bounds = make_sessions()
+    seconds = tl.elapsed_seconds(df["datetime"], bounds)
+    out, new_bounds = tl.resample(df, bounds, seconds, {"max_gap_sec": 5})
+
+    assert new_bounds.tolist() == [0, 19, 23]
+    first = out.iloc[:19]
+    # the 3 s gap is interpolated, the 10 s gap is left missing
+    assert first["cadence"].iloc[3:5].tolist() == [2 + 1 / 3, 2 + 2 / 3]
+    assert first["cadence"].iloc[8:17].isna().all()
+    assert first["filled"].sum() == 19 - 8
+    # ints are carried forward, datetime is on the grid
+    assert first["unknown"].iloc[3] == 2
+    assert (out["datetime"].diff().iloc[1:19] == pd.Timedelta(seconds=1)).all()
+    assert out["cadence"].iloc[19:].tolist() == [9, 10, 11, 12]
+
+
+def test_clean_sessions_reports_gaps():
+    df, bounds = make_sessions()
+    s = r.dfBike.cleaner(resample=True)
+    out, new_bounds = s.check_timeline(df, bounds)
+
+    assert s.gaps["id_sess"].tolist() == ["SMB001_day1"] * 3
+    assert s.timeline["n_gaps"].tolist() == [2, 0]
+    assert len(out) == new_bounds[-1] == 23
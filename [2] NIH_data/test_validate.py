@@ -0,0 +1,73 @@
+"""
+Checks that diff_databases only reports the sessions and columns that really differ.
+"""
+import numpy as np
+import pandas as pd
+import validate as v
+from storage import dbInfo
+
+
+def make_bike(n=50):
+    frames = []
+    for id_sess in ["SMB001_day1", "SMB002_day1", "SMB003_day1"]:
+        frames.append(
+            pd.DataFrame(
+                {
+                    "id_sess": id_sess,
+                    "elapsed_sec": np.arange(n, dtype=float),
+                    "cadence": np.linspace(60, 90, n),
+                    "power": np.linspace(10, 40, n),
+                    "my_id": id_sess[:6],
+                }
+            )
+        )
+    return pd.concat(frames, ignore_index=True)
+
+
+def test_diff_databases(tmp_path):
+    url_a = f"sqlite:///{tmp_path / 'a.db'}"
+    url_b = f"sqlite:///{tmp_path / 'b.db'}"
+    bike = make_bike()
+    dbInfo(url_a).save_table(bike, "bike_data")
+
+    changed = bike.copy()
+    rows = changed.index[changed["id_sess"] == "SMB002_day1"]
+    # below the tolerance everywhere
+    changed["cadence"] += 1e-9
+    # a real difference in one row of one session
+    changed.loc[rows[10], "power"] += 0.5
+    # a number that rounds to the other side of the 6th decimal, but is within tolerance
+    changed.loc[rows[3], "elapsed_sec"] = 3.0000004
+    a = bike.copy()
+    a.loc[rows[3], "elapsed_sec"] = 3.0000006
+    dbInfo(url_a).save_table(a, "bike_data")
+    dbInfo(url_b).save_table(changed[changed["id_sess"] != "SMB003_day1"], "bike_data")
+
+    diffs = v.diff_databases(url_a, url_b, tables=["bike_data", "demos"])
+    values = diffs[diffs["status"] == "values"]
+    assert values[["key", "column"]].values.tolist() == [["SMB002_day1", "power"]]
+    assert values["n_diff"].iloc[0] == 1
+    assert values["first_row"].iloc[0] == 10
+    missing = diffs[diffs["key"] == "SMB003_day1"]
+    assert missing["status"].tolist() == ["only_in_a"]
+    assert missing["column"].isna().all()
+    assert diffs[diffs["table"] == "demos"]["status"].tolist() == ["missing"]
+
+    # the digests alone also flag the elapsed_sec rounding, check drops it
+    flagged = v.diff_databases(url_a, url_b, tables=["bike_data"], check=False)
+    flagged = flagged[flagged["status"] == "values"]
+    assert sorted(flagged["column"]) == ["elapsed_sec", "power"]
+
+
+def test_check_rows_chunks(tmp_path, monkeypatch):
+    # every flagged session is read, even when they don't fit in one statement
+    monkeypatch.setattr(v, "MAX_PARAMS", 2)
+    url_a = f"sqlite:///{tmp_path / 'a.db'}"
+    url_b = f"sqlite:///{tmp_path / 'b.db'}"
+    bike = make_bike()
+    dbInfo(url_a).save_table(bike, "bike_data")
+    dbInfo(url_b).save_table(bike.assign(power=bike["power"] + 1), "bike_data")
+
+    diffs = v.diff_databases(url_a, url_b, tables=["bike_data"])
+    assert diffs["key"].tolist() == ["SMB001_day1", "SMB002_day1", "SMB003_day1"]
+    assert (diffs["n_diff"] == 50).all()
@@ -0,0 +1,220 @@
+"""
+Checks each session's real timestamps, and optionally puts every session on a regular 1 Hz grid.
+
+USE:
+    seconds = elapsed_seconds(df["datetime"], bounds)
+    gaps = find_gaps(seconds, bounds)   # one row per gap, repeat or backwards step
+    report = gap_summary(gaps, sess_ids)  # one row per session
+    df, bounds = resample(df, bounds, seconds)
+
+    dfb = dfBike(resample = True)  # through dfBike, the gaps end up in dfb.gaps
+
+PURPOSE:
+    * dfBike labels rows 0, 1, 2, ... as seconds. That is only right when the bike logged
+      exactly one row per second, find_gaps says where it didn't:
+        * gap: more than one second between two rows, `missing` seconds were not logged
+        * repeat: two rows in the same second
+        * backwards: the clock went back
+    * resample puts a session on a 1 Hz grid from its first timestamp: logged seconds keep
+      their row, gaps of up to `max_gap_sec` are linearly interpolated, longer gaps are
+      left as missing values. The rows that were not logged have filled = True.
+    * Everything works on all sessions at once, with the session offsets of zero_runs
+"""
+import numpy as np
+import pandas as pd
+import zero_runs as zr
+
+# a step within tolerance_sec of 1 second is on time
+TIMELINE_CONFIG = {
+    "tolerance_sec": 0.5,
+    "max_gap_sec": 5,
+}
+
+GAP_COLS = ["session", "row", "start_sec", "stop_sec", "jump_sec", "missing", "kind"]
+
+
+def elapsed_seconds(datetimes, bounds):
+    """
+    Seconds since the first timestamp of each session, nan where the timestamp is missing
+
+    input
+    -----
+    datetimes: pd.Series of datetime64
+        Every session back to back
+    bounds: np.array
+        Session offsets from zero_runs.session_bounds
+    """
+    stamps = pd.to_datetime(pd.Series(datetimes).reset_index(drop=True))
+    first = np.repeat(stamps.to_numpy()[bounds[:-1]], np.diff(bounds))
+    return (stamps - first).dt.total_seconds().to_numpy(dtype=float)
+
+
+def find_gaps(seconds, bounds, config=None):
+    """
+    Every step between neighbouring rows of a session that isn't one second
+
+    output
+    ------
+    pd.DataFrame with one row per step (see GAP_COLS):
+        session: index of the session
+        row: row the step lands on, counted from the start of the session
+        start_sec, stop_sec: seconds before and after the step
+        jump_sec: stop_sec - start_sec
+        missing: seconds that were not logged (gaps only)
+        kind: gap, repeat or backwards
+    """
+    config = {**TIMELINE_CONFIG, **(config or {})}
+    tol = config["tolerance_sec"]
+    seconds = np.asarray(seconds, dtype=float)
+    pos = zr.session_positions(bounds)
+    sess = np.repeat(np.arange(len(bounds) - 1), np.diff(bounds))
+
+    # steps that start a session or touch a missing timestamp don't count
+    jump = np.diff(seconds)
+    valid = (pos[1:] > 0) & ~np.isnan(jump)
+    kind = np.full(len(jump), "", dtype=object)
+    kind[valid & (jump > 1 + tol)] = "gap"
+    kind[valid & (np.abs(jump) <= tol)] = "repeat"
+    kind[valid & (jump < -tol)] = "backwards"
+    rows = np.flatnonzero(kind != "")
+
+    jump = jump[rows]
+    return pd.DataFrame(
+        {
+            "session": sess[rows + 1],
+            "row": pos[rows + 1],
+            "start_sec": seconds[rows],
+            "stop_sec": seconds[rows + 1],
+            "jump_sec": jump,
+            "missing": np.where(kind[rows] == "gap", np.rint(jump) - 1, 0).astype(int),
+            "kind": kind[rows],
+        },
+        columns=GAP_COLS,
+    )
+
+
+def gap_summary(gaps, sess_ids):
+    """
+    One row per session: number of gaps, seconds missing, longest gap, repeats and backwards steps
+
+    input
+    -----
+    gaps: pd.DataFrame
+        Output of find_gaps
+    sess_ids: array-like
+        id_sess of every session, in order
+    """
+    kinds = pd.crosstab(gaps["session"], gaps["kind"]).reindex(
+        index=range(len(sess_ids)), columns=["gap", "repeat", "backwards"], fill_value=0
+    )
+    by_sess = gaps.groupby("session")["missing"]
+    return pd.DataFrame(
+        {
+            "id_sess": list(sess_ids),
+            "n_gaps": kinds["gap"].to_numpy(),
+            "missing_sec": by_sess.sum().reindex(kinds.index, fill_value=0).to_numpy(),
+            "longest_gap": by_sess.max().reindex(kinds.index, fill_value=0).to_numpy(),
+            "n_repeats": kinds["repeat"].to_numpy(),
+            "n_backwards": kinds["backwards"].to_numpy(),
+        }
+    )
+
+
+def set_rows(series, rows, values):
+    """
+    series with values written into rows, adding categories if series is categorical
+    """
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        new = pd.Index(values.unique()).difference(series.cat.categories)
+        series = series.cat.add_categories(new)
+    series = series.copy()
+    series[rows] = values.to_numpy()
+    return series
+
+
+def resample(dataframe, bounds, seconds, config=None):
+    """
+    Puts every session on a 1 Hz grid that starts at its earliest timestamp
+
+    input
+    -----
+    dataframe: pd.DataFrame
+        Sessions back to back, with a datetime column
+    bounds: np.array
+        Session offsets
+    seconds: np.array
+        elapsed_seconds of every row
+    config: dict
+        Overrides for TIMELINE_CONFIG, max_gap_sec is the longest gap that gets interpolated
+
+    output
+    ------
+    The resampled dataframe (with a `filled` column) and its session offsets. Float columns
+    are interpolated, every other column is carried forward from the last logged row, and
+    datetime is rebuilt from the grid. Only the first of repeated seconds is used, and
+    sessions without any timestamp are dropped.
+    """
+    config = {**TIMELINE_CONFIG, **(config or {})}
+    max_gap = config["max_gap_sec"]
+    n_sess = len(bounds) - 1
+    sess = np.repeat(np.arange(n_sess), np.diff(bounds))
+    seconds = np.asarray(seconds, dtype=float)
+
+    # logged rows, sorted by time within each session, without repeated seconds
+    order = np.lexsort((seconds, sess))
+    order = order[~np.isnan(seconds[order])]
+    s_log, t_log = sess[order], seconds[order]
+    repeat = np.zeros(len(order), dtype=bool)
+    repeat[1:] = (s_log[1:] == s_log[:-1]) & (t_log[1:] == t_log[:-1])
+    order, s_log, t_log = order[~repeat], s_log[~repeat], t_log[~repeat]
+
+    # each session starts at its earliest timestamp
+    counts = np.bincount(s_log, minlength=n_sess)
+    log_bounds = zr.session_bounds(counts)
+    first = np.zeros(n_sess)
+    last = np.zeros(n_sess)
+    has = counts > 0
+    first[has] = t_log[log_bounds[:-1][has]]
+    last[has] = t_log[log_bounds[1:][has] - 1]
+    t_log = t_log - first[s_log]
+
+    lengths = np.where(has, np.floor(last - first + 1e-9).astype(np.int64) + 1, 0)
+    new_bounds = zr.session_bounds(lengths[has])
+    g_sess = np.repeat(np.flatnonzero(has), lengths[has])
+    grid = zr.session_positions(new_bounds).astype(float)
+
+    # one axis for every session, far enough apart that nothing is filled across sessions
+    pad = np.concatenate([[0], np.cumsum(lengths + max_gap + 2)[:-1]]).astype(float)
+    x = t_log + pad[s_log]
+    g = grid + pad[g_sess]
+    idx = np.searchsorted(x, g)
+    right = np.minimum(idx, len(x) - 1)
+    left = np.maximum(idx - 1, 0)
+    exact = np.abs(x[right] - g) < 1e-9
+    fillable = ~exact & (idx > 0) & (x[right] - x[left] <= max_gap + 1)
+    # rows are carried forward from the last logged row at or before each second
+    source = np.where(exact, right, left)
+
+    out = dataframe.iloc[order[source]].reset_index(drop=True)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        weight = (g - x[left]) / (x[right] - x[left])
+    for col in out.columns:
+        if col == "datetime" or not pd.api.types.is_float_dtype(out[col]):
+            continue
+        values = dataframe[col].to_numpy()[order]
+        filled = values[left] + weight * (values[right] - values[left])
+        out[col] = np.where(
+            exact, values[right], np.where(fillable, filled, np.nan)
+        ).astype(values.dtype)
+
+    if "datetime" in out.columns:
+        stamps = pd.to_datetime(dataframe["datetime"]).to_numpy()
+        start = stamps[order[log_bounds[:-1][g_sess]]]
+        out["datetime"] = start + pd.to_timedelta(grid, unit="s").to_numpy()
+        # date and time of the rows that were not logged
+        for col, fmt in [("date", "%Y-%m-%d"), ("time", "%H:%M:%S")]:
+            if col in out.columns and not exact.all():
+                values = out.loc[~exact, "datetime"].dt.strftime(fmt)
+                out[col] = set_rows(out[col], ~exact, values)
+    out["filled"] = ~exact
+    return out, new_bounds
@@ -0,0 +1,320 @@
+"""
+Compares the tables of two databases (ex: nih_ntbk.db and nih_scripts.db) session by session and column by column.
+
+USE:
+    diffs = diff_databases("sqlite:///nih_ntbk.db", "sqlite:///nih_scripts.db")
+    diffs[diffs["status"] == "values"]  # id_sess / column pairs whose values differ
+
+    digests = table_digests("sqlite:///nih_scripts.db", "bike_data")
+
+PURPOSE:
+    * The database reduces every (session, column) to a digest in one GROUP BY query, nothing
+      is loaded row by row:
+        * numbers are rounded to `decimals` first, so float32 vs float64 and other noise below
+          the tolerance doesn't count. The digest is the count and integer checksums of the
+          values, their squares and the values weighted by the order column (catches rows
+          that moved). Timestamps are checksummed the same way, to the millisecond.
+        * text uses the count, number of distinct values, total length, min and max
+    * Only the digests that don't match are checked row by row, by reading just those
+      sessions. A pair whose values all agree within 10^-decimals (a number that rounded
+      to the other side of the last decimal) is dropped, the rest are reported with the
+      number of differing rows and the first one.
+    * Sessions, columns or tables that are only in one of the databases are reported too
+"""
+import numpy as np
+import pandas as pd
+import sqlalchemy as sq
+from storage import dbInfo, MAX_PARAMS
+
+# how each table is split into sessions, and the column that orders the rows of a session
+DIGEST_KEYS = {
+    "bike_data": ["id_sess"],
+    "effort": ["id_sess"],
+    "demos": ["id"],
+    "entropy": ["subject", "session"],
+}
+ORDER_COLS = {"bike_data": "elapsed_sec"}
+DECIMALS = 6
+# checksums are kept modulo this prime, so squares and products never overflow SQLite integers
+PRIME = 2147483647
+
+DIFF_COLS = ["table", "key", "column", "status", "n_diff", "first_row", "a", "b"]
+STATS = ["n", "s1", "s2", "s3", "low", "high"]
+NUMERIC_TYPES = ("INT", "REAL", "FLOA", "DOUB", "NUM", "DEC", "BOOL")
+
+
+def table_columns(engine, table_name):
+    """
+    {column: declared type} of a table, None if the table doesn't exist
+    """
+    if not sq.inspect(engine).has_table(table_name):
+        return None
+    with engine.connect() as cnx:
+        info = pd.read_sql(sq.text(f'PRAGMA table_info("{table_name}")'), cnx)
+    return dict(zip(info["name"], info["type"].str.upper()))
+
+
+def digest_sql(column, kind, order=None, decimals=DECIMALS):
+    """
+    The aggregates of one column, named {column}|{stat}
+    """
+    c = f'"{column}"'
+    if kind.startswith(NUMERIC_TYPES + ("TIMESTAMP", "DATE")):
+        # the rounded number (timestamps in ms) as an integer, integer sums in SQLite are exact.
+        # ROUND(x * 1e6) is much faster than ROUND(x, 6) in SQLite.
+        if kind.startswith(NUMERIC_TYPES):
+            number = f"CAST(ROUND({c} * 1e{decimals}) AS INTEGER)"
+        else:
+            number = f"CAST(ROUND(julianday({c}) * 86400000) AS INTEGER)"
+        value = f"{number} % {PRIME}"
+        parts = {
+            "n": f"COUNT({c})",
+            "s1": f"SUM({value})",
+            "s2": f"SUM(({value}) * ({value}) % {PRIME})",
+        }
+    else:
+        value = f"LENGTH({c})"
+        parts = {
+            "n": f"COUNT({c})",
+            "s1": f"COUNT(DISTINCT {c})",
+            "s2": f"SUM({value})",
+            "low": f"MIN({c})",
+            "high": f"MAX({c})",
+        }
+    if order:
+        position = f'CAST(ROUND("{order}" * 1e3) AS INTEGER) % {PRIME}'
+        parts["s3"] = f"SUM(({value}) * ({position}) % {PRIME})"
+    return [f'{sql} AS "{column}|{stat}"' for stat, sql in parts.items()]
+
+
+def table_digests(url, table_name, keys=None, columns=None, decimals=DECIMALS):
+    """
+    One digest per session and column of a table
+
+    input
+    -----
+    url: str
+        Database url
+    table_name: str
+    keys: list of str
+        Columns that identify a session, defaults to DIGEST_KEYS
+    columns: list of str
+        Columns to digest, defaults to every column that isn't a key
+    decimals: int
+        Numbers are rounded to this many decimals first
+
+    output
+    ------
+    pd.DataFrame with the keys, column, n_rows and the STATS of each column,
+    None if the table doesn't exist
+    """
+    engine = dbInfo(url).engine
+    types = table_columns(engine, table_name)
+    if types is None:
+        return None
+    keys = keys or DIGEST_KEYS.get(table_name, [])
+    columns = [c for c in (columns or types) if c not in keys and c in types]
+    order = ORDER_COLS.get(table_name)
+    order = order if order in types else None
+
+    selects = [f'"{k}"' for k in keys] + ["COUNT(*) AS n_rows"]
+    for col in columns:
+        selects += digest_sql(col, types[col], order, decimals)
+    query = f'SELECT {", ".join(selects)} FROM "{table_name}"'
+    if keys:
+        query += " GROUP BY " + ", ".join(f'"{k}"' for k in keys)
+    with engine.connect() as cnx:
+        wide = pd.read_sql(sq.text(query), cnx)
+
+    # one row per session and column
+    frames = []
+    for col in columns:
+        part = wide[keys + ["n_rows"]].copy()
+        part["column"] = col
+        for stat in STATS:
+            if f"{col}|{stat}" in wide.columns:
+                part[stat] = wide[f"{col}|{stat}"].astype(object)
+            else:
+                part[stat] = None
+        frames.append(part)
+    if not frames:
+        return pd.DataFrame(columns=keys + ["n_rows", "column"] + STATS)
+    return pd.concat(frames, ignore_index=True)
+
+
+def same_stat(a, b):
+    """
+    Element-wise, True where two digest stats are equal (or both missing)
+    """
+    a = pd.Series(a, dtype=object).reset_index(drop=True)
+    b = pd.Series(b, dtype=object).reset_index(drop=True)
+    return ((a == b) | (a.isna() & b.isna())).to_numpy(dtype=bool)
+
+
+def key_label(row, keys):
+    """
+    A session's key as one string, ex: SMB024_day1 or SMB024|2
+    """
+    return "|".join(str(row[k]) for k in keys)
+
+
+def compare_digests(a, b, keys):
+    """
+    The (session, column) pairs whose digests differ, or that are only in a or b
+
+    output
+    ------
+    pd.DataFrame with the keys, column and status (only_in_a, only_in_b, rows or values)
+    """
+    merged = a.merge(
+        b, on=keys + ["column"], how="outer", suffixes=("_a", "_b"), indicator=True
+    )
+    status = np.full(len(merged), "", dtype=object)
+    status[(merged["_merge"] == "left_only").to_numpy()] = "only_in_a"
+    status[(merged["_merge"] == "right_only").to_numpy()] = "only_in_b"
+    both = (merged["_merge"] == "both").to_numpy()
+
+    same_rows = same_stat(merged["n_rows_a"], merged["n_rows_b"])
+    status[both & ~same_rows] = "rows"
+    same = np.ones(len(merged), dtype=bool)
+    for stat in STATS:
+        same &= same_stat(merged[f"{stat}_a"], merged[f"{stat}_b"])
+    status[both & same_rows & ~same] = "values"
+
+    merged["status"] = status
+    merged = merged[merged["status"] != ""]
+    return merged[keys + ["column", "status", "n_rows_a", "n_rows_b"]].reset_index(
+        drop=True
+    )
+
+
+def check_rows(url_a, url_b, table_name, keys, flagged, decimals=DECIMALS):
+    """
+    Compares the rows of the flagged (session, column) pairs, reading only those sessions
+
+    output
+    ------
+    flagged with n_diff and first_row (row of the session, in ORDER_COLS order), and the
+    a and b values of that row. Pairs without a real difference are dropped.
+    """
+    order = ORDER_COLS.get(table_name)
+    columns = list(
+        dict.fromkeys(keys + ([order] if order else []) + list(flagged["column"]))
+    )
+    sessions = flagged[keys[0]].unique().tolist()
+    frames = []
+    for url in [url_a, url_b]:
+        db = dbInfo(url)
+        # sqlite only allows so many parameters per statement
+        df = pd.concat(
+            [
+                db.load_table(
+                    table_name,
+                    columns=columns,
+                    where={keys[0]: sessions[i : i + MAX_PARAMS]},
+                )
+                for i in range(0, len(sessions), MAX_PARAMS)
+            ],
+            ignore_index=True,
+        )
+        if order:
+            df = df.sort_values(keys + [order], kind="stable")
+        frames.append(df.groupby(keys, sort=False))
+
+    atol = 10.0**-decimals
+    rows = []
+    for _, pair in flagged.iterrows():
+        key = tuple(pair[k] for k in keys)
+        x = frames[0].get_group(key)[pair["column"]].to_numpy()
+        y = frames[1].get_group(key)[pair["column"]].to_numpy()
+        if x.dtype.kind in "biuf" and y.dtype.kind in "biuf":
+            x = x.astype(float)
+            y = y.astype(float)
+            diff = ~np.isclose(x, y, rtol=0, atol=atol, equal_nan=True)
+        else:
+            diff = ~((x == y) | (pd.isna(x) & pd.isna(y)))
+        if not diff.any():
+            continue
+        first = int(np.argmax(diff))
+        rows.append(
+            {
+                **pair,
+                "n_diff": int(diff.sum()),
+                "first_row": first,
+                "a": x[first],
+                "b": y[first],
+            }
+        )
+    return pd.DataFrame(
+        rows, columns=list(flagged.columns) + ["n_diff", "first_row", "a", "b"]
+    )
+
+
+def diff_table(url_a, url_b, table_name, keys=None, decimals=DECIMALS, check=True):
+    """
+    Differences in one table between the databases at url_a and url_b, see diff_databases
+    """
+    keys = keys or DIGEST_KEYS.get(table_name, [])
+    a = table_digests(url_a, table_name, keys, decimals=decimals)
+    b = table_digests(url_b, table_name, keys, decimals=decimals)
+    if a is None or b is None:
+        status = "only_in_b" if a is None else "only_in_a"
+        if a is None and b is None:
+            status = "missing"
+        return pd.DataFrame(
+            [{"table": table_name, "status": status}], columns=DIFF_COLS
+        )
+
+    diffs = compare_digests(a, b, keys)
+    values = diffs[diffs["status"] == "values"]
+    if check and len(values):
+        checked = check_rows(url_a, url_b, table_name, keys, values, decimals)
+        diffs = pd.concat(
+            [diffs[diffs["status"] != "values"], checked], ignore_index=True
+        )
+    for col in ["n_diff", "first_row", "a", "b"]:
+        if col not in diffs.columns:
+            diffs[col] = None
+
+    diffs.insert(0, "table", table_name)
+    diffs.insert(1, "key", [key_label(row, keys) for _, row in diffs.iterrows()])
+    # sessions missing from one side are one row, not one per column
+    missing = diffs["status"].isin(["only_in_a", "only_in_b"])
+    whole = missing & diffs.duplicated(["key", "status"], keep=False)
+    sessions = diffs[whole].drop_duplicates(["key", "status"]).assign(column=None)
+    diffs = pd.concat([diffs[~whole], sessions], ignore_index=True)
+    return (
+        diffs[DIFF_COLS]
+        .sort_values(["key", "column"], na_position="first")
+        .reset_index(drop=True)
+    )
+
+
+def diff_databases(url_a, url_b, tables=None, decimals=DECIMALS, check=True):
+    """
+    Every session and column that differs between two databases
+
+    input
+    -----
+    url_a, url_b: str
+        Database urls, ex: "sqlite:///nih_ntbk.db" and "sqlite:///nih_scripts.db"
+    tables: list of str
+        Defaults to bike_data, demos, effort and entropy (see DIGEST_KEYS)
+    decimals: int
+        Numbers that agree to this many decimals are the same
+    check: bool
+        If False, reports every digest that differs without reading any rows
+
+    output
+    ------
+    pd.DataFrame, one row per difference (see DIFF_COLS). status is:
+        only_in_a / only_in_b: the table, session (column is empty) or column is only in one database
+        rows: the session has a different number of rows
+        values: n_diff rows differ, first_row is the first of them with its a and b values
+    Empty if the databases agree.
+    """
+    tables = tables or list(DIGEST_KEYS)
+    diffs = [
+        diff_table(url_a, url_b, t, decimals=decimals, check=check) for t in tables
+    ]
+    return pd.concat(diffs, ignore_index=True)
@@ -0,0 +1,128 @@
+"""
+Run-length helpers used to trim trailing zeroes from the bike sessions.
+
+USE:
+    bounds = session_bounds(lengths)
+    diffs = rolling_diff(df["cadence"].to_numpy(), bounds, roll=60)
+    runs = find_runs(np.rint(diffs) == 0, bounds)
+    longest = longest_runs(runs, len(bounds) - 1)
+
+PURPOSE:
+    * Work on every session at once instead of one session at a time
+    * Sessions are contiguous blocks of rows. `bounds` holds the start row of each
+      session plus the total number of rows, so session `i` is rows
+      `bounds[i]:bounds[i + 1]`
+    * A run never crosses from one session into the next
+"""
+import pandas as pd
+import numpy as np
+
+
+def session_bounds(lengths):
+    """
+    Turns a list of session lengths into row offsets
+
+    input
+    -----
+    lengths: array-like of int
+        Number of rows in each session, in the order they appear
+    """
+    return np.concatenate([[0], np.cumsum(lengths, dtype=np.int64)])
+
+
+def session_positions(bounds):
+    """
+    Position of each row within its own session (0, 1, 2, ... restarting every session)
+    """
+    lengths = np.diff(bounds)
+    return np.arange(bounds[-1]) - np.repeat(bounds[:-1], lengths)
+
+
+def rolling_diff(values, bounds, roll=60):
+    """
+    Same as `Series.diff(periods=roll)` per session, with the leading nans filled with 0
+
+    input
+    -----
+    values: np.array
+        Signal for every session, back to back
+    bounds: np.array
+        Session offsets from `session_bounds`
+    roll: int
+        Number of rows to look back
+    """
+    values = np.asarray(values, dtype=float)
+    pos = session_positions(bounds)
+    diffs = np.full(len(values), np.nan)
+    ok = pos >= roll
+    rows = np.flatnonzero(ok)
+    diffs[rows] = values[rows] - values[rows - roll]
+    return np.nan_to_num(diffs, nan=0.0)
+
+
+def find_runs(mask, bounds, weights=None):
+    """
+    Finds every run of True values in mask, without crossing session borders
+
+    input
+    -----
+    mask: np.array of bool
+    bounds: np.array
+        Session offsets from `session_bounds`
+    weights: np.array of bool or int
+        What each row counts for in the run length. Defaults to 1 per row.
+
+    output
+    ------
+    pd.DataFrame with one row per run, ordered by session then start:
+        session: index of the session the run belongs to
+        start: first row of the run, counted from the start of the session
+        length: sum of weights in the run
+    """
+    mask = np.asarray(mask, dtype=bool)
+    n = len(mask)
+    lengths = np.diff(bounds)
+    if weights is None:
+        weights = np.ones(n, dtype=np.int64)
+
+    new_sess = np.zeros(n, dtype=bool)
+    new_sess[bounds[:-1][lengths > 0]] = True
+    prev = np.zeros(n, dtype=bool)
+    prev[1:] = mask[:-1]
+    begins = mask & (~prev | new_sess)
+
+    begin_rows = np.flatnonzero(begins)
+    run_id = np.cumsum(begins) - 1
+    run_len = np.bincount(
+        run_id[mask], weights=np.asarray(weights)[mask], minlength=len(begin_rows)
+    ).astype(np.int64)
+    sess = np.repeat(np.arange(len(lengths)), lengths)[begin_rows]
+
+    return pd.DataFrame(
+        {"session": sess, "start": begin_rows - bounds[:-1][sess], "length": run_len}
+    )
+
+
+def longest_runs(runs, n_sessions):
+    """
+    Picks the longest run of each session. Ties go to the earliest run.
+
+    output
+    ------
+    pd.DataFrame indexed by session (0 to n_sessions - 1) with `start` and `length`.
+    Sessions without any run get -1 for both.
+    """
+    order = np.lexsort(
+        (runs["start"].to_numpy(), -runs["length"].to_numpy(), runs["session"].to_numpy())
+    )
+    sess = runs["session"].to_numpy()[order]
+    first = np.ones(len(order), dtype=bool)
+    first[1:] = sess[1:] != sess[:-1]
+    best = runs.iloc[order[first]]
+
+    longest = pd.DataFrame(
+        {"start": -1, "length": -1}, index=pd.RangeIndex(n_sessions, name="session")
+    )
+    longest.loc[best["session"].to_numpy(), "start"] = best["start"].to_numpy()
+    longest.loc[best["session"].to_numpy(), "length"] = best["length"].to_numpy()
+    return longest